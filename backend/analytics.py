@@ -0,0 +1,381 @@
+# nativarrry（ネイティバリー）ポートフォリオ分析
+# 集計済みのサマリーコレクションを書き込み時の増分更新と定期的な$mergeジョブで維持する
+
+import re
+from collections import Counter
+from datetime import datetime, timezone
+
+
+PLATFORM_STATS = "analytics_platform_stats"
+REJECTION_CATEGORIES = "analytics_rejection_categories"
+PHASE_DURATIONS = "analytics_phase_durations"
+OVERDUE_BY_ASSIGNEE = "analytics_overdue_by_assignee"
+
+UNASSIGNED = "未割り当て"
+
+# App Store Review Guidelines の章番号によるカテゴリ
+GUIDELINE_CATEGORIES = [
+    ("2.1", "crash_bugs"),
+    ("2.3", "metadata"),
+    ("4.2", "minimum_functionality"),
+    ("4.3", "spam"),
+    ("5.1", "privacy"),
+    ("1", "content"),
+    ("2", "performance"),
+    ("3", "payments"),
+    ("4", "design"),
+    ("5", "legal"),
+]
+
+# 章番号がない場合（Google Playを含む）のキーワードによるカテゴリ
+KEYWORD_CATEGORIES = [
+    ("crash_bugs", ["crash", "bug", "freeze", "クラッシュ", "不具合", "強制終了"]),
+    ("login_demo", ["demo account", "login", "sign in", "credentials", "デモアカウント", "ログイン"]),
+    ("privacy", ["privacy", "tracking", "personal data", "data safety", "プライバシー", "個人情報", "トラッキング"]),
+    ("payments", ["in-app purchase", "payment", "subscription", "課金", "決済", "サブスクリプション"]),
+    ("metadata", ["metadata", "screenshot", "description", "icon", "メタデータ", "スクリーンショット", "説明文", "アイコン"]),
+    ("spam", ["spam", "copycat", "duplicate", "スパム", "重複"]),
+    ("minimum_functionality", ["minimum functionality", "webview", "web view", "機能不足"]),
+    ("legal", ["copyright", "trademark", "intellectual property", "著作権", "商標", "知的財産"]),
+    ("content", ["objectionable", "content rating", "コンテンツレーティング", "不適切"]),
+]
+
+_GUIDELINE_PATTERN = re.compile(r"(?:guideline|ガイドライン)\s*(\d+(?:\.\d+)*)", re.IGNORECASE)
+
+
+def classify_rejection(reason: str) -> str:
+    """リジェクト理由の文面からカテゴリを推定する"""
+    text = (reason or "").lower()
+    
+    match = _GUIDELINE_PATTERN.search(text)
+    if match:
+        number = match.group(1)
+        for prefix, category in GUIDELINE_CATEGORIES:
+            if number == prefix or number.startswith(prefix + "."):
+                return category
+    
+    for category, keywords in KEYWORD_CATEGORIES:
+        if any(keyword in text for keyword in keywords):
+            return category
+    return "other"
+
+
+def platforms_of(platform: str) -> list:
+    """"Both" のプロジェクトは iOS と Android の両方に数える"""
+    return ["iOS", "Android"] if platform == "Both" else [platform]
+
+
+# ========== 増分更新（書き込みパスから呼び出す） ==========
+
+async def record_project_created(db, platform: str):
+    for name in platforms_of(platform):
+        await db[PLATFORM_STATS].update_one(
+            {"_id": name}, {"$inc": {"projects": 1}, "$setOnInsert": {"platform": name}}, upsert=True
+        )
+
+
+async def record_project_platform_changed(db, old_platform: str, new_platform: str):
+    if old_platform == new_platform:
+        return
+    for name in platforms_of(old_platform):
+        await db[PLATFORM_STATS].update_one({"_id": name}, {"$inc": {"projects": -1}})
+    await record_project_created(db, new_platform)
+
+
+async def _record_project_counts(db, project_id: str, platform: str, sign: int):
+    for name in platforms_of(platform):
+        await db[PLATFORM_STATS].update_one(
+            {"_id": name}, {"$inc": {"projects": sign}, "$setOnInsert": {"platform": name}}, upsert=True
+        )
+    
+    for (platform_name, category), count in (await _rejection_counts(db, project_id)).items():
+        await db[PLATFORM_STATS].update_one(
+            {"_id": platform_name},
+            {"$inc": {"rejections": sign * count}, "$setOnInsert": {"platform": platform_name}},
+            upsert=True
+        )
+        await db[REJECTION_CATEGORIES].update_one(
+            {"_id": f"{platform_name}:{category}"},
+            {"$inc": {"count": sign * count}, "$setOnInsert": {"platform": platform_name, "category": category}},
+            upsert=True
+        )
+
+
+async def _rejection_counts(db, project_id: str) -> Counter:
+    """
+    プロジェクトのリジェクト件数（(プラットフォーム, カテゴリ) ごと）
+    
+    アーカイブ済みのリジェクトはプロジェクトに残したサマリーから数える。
+    アーカイブ後も残っているリジェクト（アーカイブにも含まれるもの）は重複して数えない。
+    """
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0, "archive_summary.rejections": 1})
+    archived = ((project or {}).get("archive_summary") or {}).get("rejections") or []
+    counts = Counter((rejection.get("platform"), rejection.get("category") or "other") for rejection in archived)
+    archived_ids = [rejection["id"] for rejection in archived if rejection.get("id")]
+    async for rejection in db.rejections.find(
+        {"project_id": project_id, "id": {"$nin": archived_ids}}, {"_id": 0, "platform": 1, "category": 1}
+    ):
+        counts[(rejection.get("platform"), rejection.get("category") or "other")] += 1
+    return counts
+
+
+async def record_project_deleted(db, project_id: str, platform: str):
+    """プロジェクトと、そのリジェクトの件数を差し引く（論理削除の時点で集計から外す）"""
+    await _record_project_counts(db, project_id, platform, -1)
+
+
+async def record_project_restored(db, project_id: str, platform: str):
+    """論理削除から復元したプロジェクトとリジェクトの件数を戻す"""
+    await _record_project_counts(db, project_id, platform, 1)
+
+
+async def record_rejection_created(db, platform: str, category: str):
+    await db[PLATFORM_STATS].update_one(
+        {"_id": platform}, {"$inc": {"rejections": 1}, "$setOnInsert": {"platform": platform}}, upsert=True
+    )
+    await db[REJECTION_CATEGORIES].update_one(
+        {"_id": f"{platform}:{category}"},
+        {"$inc": {"count": 1}, "$setOnInsert": {"platform": platform, "category": category}},
+        upsert=True
+    )
+
+
+# ========== アーカイブ済みプロジェクト ==========
+# アーカイブ時に関連データは圧縮して退避されるため、定期集計に必要な値だけをプロジェクトに残す
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def archive_summary(project: dict, tasks: list, rejections: list) -> dict:
+    """
+    アーカイブするプロジェクトの集計用サマリー（定期集計の各パイプラインと同じ条件で求める）
+    
+    Returns:
+        {"rejections": [...], "phases": [...], "open_tasks": [...]}
+    """
+    phases = {}
+    for task in tasks:
+        if task.get("phase_number") is None:
+            continue
+        phase = phases.setdefault(task["phase_number"], {"phase_name": task.get("phase"), "total": 0, "completed": 0, "ended_at": None})
+        phase["total"] += 1
+        phase["completed"] += 1 if task.get("completed") else 0
+        completed_at = _parse_date(task.get("completed_at"))
+        if completed_at is not None and (phase["ended_at"] is None or completed_at > phase["ended_at"]):
+            phase["ended_at"] = completed_at
+    
+    project_start = _parse_date(project.get("start_date") or project.get("created_at"))
+    durations = []
+    previous_end = None
+    for phase_number in sorted(phases):
+        phase = phases[phase_number]
+        started_at = previous_end or project_start
+        if phase["total"] == phase["completed"] and phase["ended_at"] is not None and started_at is not None:
+            durations.append({
+                "phase_number": phase_number,
+                "phase_name": phase["phase_name"],
+                "days": max(0, (phase["ended_at"] - started_at).total_seconds() / 86400),
+            })
+        previous_end = phase["ended_at"]
+    
+    return {
+        "rejections": [
+            {"id": rejection.get("id"), "platform": rejection.get("platform"), "category": rejection.get("category") or "other"}
+            for rejection in rejections
+        ],
+        "phases": durations,
+        "open_tasks": [
+            {"assigned_to": task.get("assigned_to"), "due_date": task.get("due_date"), "due_at": task.get("due_at")}
+            for task in tasks
+            if not task.get("completed") and (isinstance(task.get("due_at"), datetime) or isinstance(task.get("due_date"), str))
+        ],
+    }
+
+
+def _archived(field: str, pipeline: list = ()) -> dict:
+    """アーカイブ済みプロジェクトのサマリー（archive_summary）を元データの行として合流させる"""
+    return {"$unionWith": {"coll": "projects", "pipeline": [
+        {"$match": {"archived_at": {"$ne": None}, "deleted_at": None}},
+        {"$unwind": f"$archive_summary.{field}"},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [{"project_id": "$id"}, f"$archive_summary.{field}"]}}},
+        *pipeline
+    ]}}
+
+
+# ========== 定期集計（$merge） ==========
+
+def _platform_stats_pipeline(stamp: str, deleted: list) -> list:
+    return [
+        {"$match": {"deleted_at": None}},
+        {"$project": {
+            "_id": 0,
+            "platform": {"$cond": [{"$eq": ["$platform", "Both"]}, ["iOS", "Android"], ["$platform"]]}
+        }},
+        {"$unwind": "$platform"},
+        {"$group": {"_id": "$platform", "projects": {"$sum": 1}, "rejections": {"$sum": 0},
+                    "rejected": {"$first": {"$literal": []}}}},
+        {"$unionWith": {"coll": "rejections", "pipeline": [
+            {"$match": {"project_id": {"$nin": deleted}}},
+            _archived("rejections"),
+            {"$group": {"_id": "$platform", "projects": {"$sum": 0}, "rejections": {"$sum": 1},
+                        "rejected": {"$addToSet": "$project_id"}}}
+        ]}},
+        {"$group": {
+            "_id": "$_id",
+            "projects": {"$sum": "$projects"},
+            "rejections": {"$sum": "$rejections"},
+            "rejected": {"$push": "$rejected"}
+        }},
+        {"$project": {
+            "platform": "$_id",
+            "projects": 1,
+            "rejections": 1,
+            "rejected_projects": {"$size": {"$reduce": {
+                "input": "$rejected", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}
+            }}},
+            "refreshed_at": stamp
+        }},
+        {"$merge": {"into": PLATFORM_STATS, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+def _rejection_categories_pipeline(stamp: str, deleted: list) -> list:
+    return [
+        {"$match": {"project_id": {"$nin": deleted}}},
+        _archived("rejections"),
+        {"$group": {
+            "_id": {"platform": "$platform", "category": {"$ifNull": ["$category", "other"]}},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.platform", ":", "$_id.category"]},
+            "platform": "$_id.platform",
+            "category": "$_id.category",
+            "count": 1,
+            "refreshed_at": stamp
+        }},
+        {"$merge": {"into": REJECTION_CATEGORIES, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+def _phase_durations_pipeline(stamp: str, deleted: list) -> list:
+    """
+    フェーズの所要日数 = フェーズ内の最後のタスク完了日時 − 前フェーズの完了日時
+    （第1フェーズ、または前フェーズが未完了の場合はプロジェクトの開始日・作成日を起点とする）
+    """
+    to_date = lambda expression: {"$dateFromString": {"dateString": expression, "onError": None, "onNull": None}}
+    position = lambda ratio: {"$toInt": {"$floor": {"$multiply": [{"$subtract": [{"$size": "$durations"}, 1]}, ratio]}}}
+    return [
+        {"$match": {"phase_number": {"$ne": None}, "project_id": {"$nin": deleted}}},
+        {"$group": {
+            "_id": {"project_id": "$project_id", "phase_number": "$phase_number"},
+            "phase_name": {"$first": "$phase"},
+            "total": {"$sum": 1},
+            "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+            "ended_at": {"$max": to_date("$completed_at")}
+        }},
+        {"$setWindowFields": {
+            "partitionBy": "$_id.project_id",
+            "sortBy": {"_id.phase_number": 1},
+            "output": {"previous_end": {"$shift": {"output": "$ended_at", "by": -1}}}
+        }},
+        {"$match": {"$expr": {"$and": [{"$eq": ["$total", "$completed"]}, {"$ne": ["$ended_at", None]}]}}},
+        {"$lookup": {
+            "from": "projects",
+            "localField": "_id.project_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "start_date": 1, "created_at": 1}}],
+            "as": "project"
+        }},
+        {"$set": {"started_at": {"$ifNull": [
+            "$previous_end",
+            to_date({"$ifNull": [{"$first": "$project.start_date"}, {"$first": "$project.created_at"}]})
+        ]}}},
+        {"$match": {"started_at": {"$ne": None}}},
+        {"$set": {"days": {"$max": [0, {"$divide": [{"$subtract": ["$ended_at", "$started_at"]}, 86400000]}]}}},
+        _archived("phases", [{"$project": {
+            "_id": {"project_id": "$project_id", "phase_number": "$phase_number"}, "phase_name": 1, "days": 1
+        }}]),
+        {"$group": {
+            "_id": "$_id.phase_number",
+            "phase_name": {"$first": "$phase_name"},
+            "projects": {"$sum": 1},
+            "mean_days": {"$avg": "$days"},
+            "durations": {"$push": "$days"}
+        }},
+        {"$set": {"durations": {"$sortArray": {"input": "$durations", "sortBy": 1}}}},
+        {"$project": {
+            "phase_number": "$_id",
+            "phase_name": 1,
+            "projects": 1,
+            "mean_days": {"$round": ["$mean_days", 2]},
+            "median_days": {"$round": [{"$arrayElemAt": ["$durations", position(0.5)]}, 2]},
+            "p90_days": {"$round": [{"$arrayElemAt": ["$durations", position(0.9)]}, 2]},
+            "refreshed_at": stamp
+        }},
+        {"$merge": {"into": PHASE_DURATIONS, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+def _overdue_pipeline(stamp: str, now: datetime, deleted: list) -> list:
+    """
+    期限は日時型（due_at）で比較する
+    （due_date の文字列は "Z" と "+00:00" の表記が混在し、文字列の順序が時刻の順序と一致しないため）
+    """
+    # due_at を持たない古いアーカイブのサマリーは due_date を日時に変換する
+    due_at = {"$ifNull": ["$due_at", {"$dateFromString": {"dateString": "$due_date", "onError": None, "onNull": None}}]}
+    return [
+        {"$match": {"completed": False, "due_at": {"$type": "date", "$lt": now}, "project_id": {"$nin": deleted}}},
+        _archived("open_tasks", [{"$set": {"due_at": due_at}}, {"$match": {"due_at": {"$type": "date", "$lt": now}}}]),
+        {"$group": {
+            "_id": {"$ifNull": ["$assigned_to", UNASSIGNED]},
+            "overdue_tasks": {"$sum": 1},
+            "projects": {"$addToSet": "$project_id"},
+            "oldest_due_at": {"$min": "$due_at"}
+        }},
+        {"$project": {
+            "assigned_to": "$_id",
+            "overdue_tasks": 1,
+            "projects": {"$size": "$projects"},
+            "oldest_due_date": {"$dateToString": {"date": "$oldest_due_at", "format": "%Y-%m-%dT%H:%M:%S.%LZ"}},
+            "refreshed_at": stamp
+        }},
+        {"$merge": {"into": OVERDUE_BY_ASSIGNEE, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+async def refresh_analytics(db) -> str:
+    """
+    全サマリーコレクションを元データから再集計する
+    
+    増分更新の取りこぼしを補正し、時間経過で変わる値（期限切れタスク）と
+    増分では求めにくい値（中央値、リジェクトされたプロジェクト数）を更新する。
+    
+    Returns:
+        集計の実行日時（ISO形式）
+    """
+    now = datetime.now(timezone.utc)
+    stamp = now.isoformat()
+    # 論理削除されたプロジェクト（物理削除されるまでの保持期間中のもの）は集計に含めない
+    deleted = await db.projects.distinct("id", {"deleted_at": {"$ne": None}})
+    
+    jobs = [
+        ("projects", PLATFORM_STATS, _platform_stats_pipeline(stamp, deleted)),
+        ("rejections", REJECTION_CATEGORIES, _rejection_categories_pipeline(stamp, deleted)),
+        ("tasks", PHASE_DURATIONS, _phase_durations_pipeline(stamp, deleted)),
+        ("tasks", OVERDUE_BY_ASSIGNEE, _overdue_pipeline(stamp, now, deleted)),
+    ]
+    for source, target, pipeline in jobs:
+        await db[source].aggregate(pipeline).to_list(None)
+        # 今回の集計に現れなかったキーは削除する
+        await db[target].delete_many({"refreshed_at": {"$ne": stamp}})
+    
+    return stamp
@@ -0,0 +1,205 @@
+# nativarrry（ネイティバリー）ストア掲載素材の自動チェック
+# アップロードされた画像のヘッダーだけを読み、プラットフォーム・項目ごとのルールと照合する
+
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, UnidentifiedImageError
+
+
+MB = 1024 * 1024
+
+# ヘッダーの解析に読み込むバイト数（JPEGはEXIFの後ろにサイズ情報があるため余裕を持たせる）
+HEADER_BYTES = 256 * 1024
+
+
+def _both_orientations(*sizes) -> list:
+    return [list(size) for width, height in sizes for size in ((width, height), (height, width))]
+
+
+# プラットフォーム → チェックリストの項目名 → ルール
+# sizes: 許可する解像度、devices: デバイスサイズごとの解像度（項目内でデバイスごとに枚数を数える）
+ASSET_RULES = {
+    "iOS": {
+        "アプリアイコン": {
+            "formats": ["PNG"],
+            "sizes": [[1024, 1024]],
+            "alpha": False,
+            "modes": ["RGB"],
+            "min_files": 1,
+            "max_files": 1,
+        },
+        "スクリーンショット": {
+            "formats": ["PNG", "JPEG"],
+            "devices": {
+                "iPhone 6.9インチ": _both_orientations((1320, 2868), (1290, 2796)),
+                "iPhone 6.5インチ": _both_orientations((1242, 2688), (1284, 2778)),
+                "iPhone 5.5インチ": _both_orientations((1242, 2208)),
+                "iPad 13インチ": _both_orientations((2064, 2752), (2048, 2732)),
+            },
+            "alpha": False,
+            "modes": ["RGB"],
+            "min_per_device": 4,
+            "max_per_device": 10,
+        },
+    },
+    "Android": {
+        "アプリアイコン": {
+            "formats": ["PNG"],
+            "sizes": [[512, 512]],
+            "alpha": True,
+            "modes": ["RGB"],
+            "max_bytes": 1 * MB,
+            "min_files": 1,
+            "max_files": 1,
+        },
+        "Feature Graphic": {
+            "formats": ["PNG", "JPEG"],
+            "sizes": [[1024, 500]],
+            "alpha": False,
+            "modes": ["RGB"],
+            "max_bytes": 15 * MB,
+            "min_files": 1,
+            "max_files": 1,
+        },
+        "スクリーンショット": {
+            "formats": ["PNG", "JPEG"],
+            "min_side": 320,
+            "max_side": 3840,
+            "max_aspect": 2.0,  # 長辺は短辺の2倍まで
+            "alpha": False,
+            "modes": ["RGB"],
+            "max_bytes": 8 * MB,
+            "min_files": 2,
+            "max_files": 8,
+        },
+    },
+}
+
+
+# アルファチャンネル付きのモード → 元のカラーモード
+COLOR_MODES = {"RGBA": "RGB", "RGBa": "RGB", "LA": "L", "La": "L", "PA": "P"}
+
+
+def rule_for(platform: str, item_name: str):
+    """チェックリスト項目に対応するルール（自動チェックの対象外はNone）"""
+    return ASSET_RULES.get(platform, {}).get(item_name)
+
+
+def inspect_header(header: bytes) -> dict:
+    """
+    画像のヘッダーから形式・解像度・カラーモード・透過の有無を読み取る（画素はデコードしない）
+    
+    プロセスプールのワーカーで実行する。
+    """
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            return {
+                "format": image.format,
+                "width": image.width,
+                "height": image.height,
+                "mode": image.mode,
+                "has_alpha": image.mode in COLOR_MODES or "transparency" in image.info,
+            }
+    except (UnidentifiedImageError, OSError, ValueError, SyntaxError):
+        return {"error": "画像として読み込めません"}
+
+
+def _device_of(rule: dict, info: dict):
+    size = [info.get("width"), info.get("height")]
+    for device, sizes in rule.get("devices", {}).items():
+        if size in sizes:
+            return device
+    return None
+
+
+def check_file(rule: dict, info: dict, file_size: int) -> list:
+    """ファイル単位のルール違反の一覧"""
+    if "error" in info:
+        return [info["error"]]
+    
+    errors = []
+    width, height = info["width"], info["height"]
+    if info["format"] not in rule["formats"]:
+        errors.append(f"形式が{'/'.join(rule['formats'])}ではありません（実際: {info['format']}）")
+    if "sizes" in rule and [width, height] not in rule["sizes"]:
+        expected = "、".join(f"{w}x{h}px" for w, h in rule["sizes"])
+        errors.append(f"解像度が{expected}ではありません（実際: {width}x{height}px）")
+    if "devices" in rule and _device_of(rule, info) is None:
+        errors.append(f"対応するデバイスサイズの解像度ではありません（実際: {width}x{height}px）")
+    if "min_side" in rule and min(width, height) < rule["min_side"]:
+        errors.append(f"短辺が{rule['min_side']}px未満です（実際: {min(width, height)}px）")
+    if "max_side" in rule and max(width, height) > rule["max_side"]:
+        errors.append(f"長辺が{rule['max_side']}pxを超えています（実際: {max(width, height)}px）")
+    if "max_aspect" in rule and max(width, height) > min(width, height) * rule["max_aspect"]:
+        errors.append(f"縦横比が1:{rule['max_aspect']:g}を超えています")
+    if not rule.get("alpha", True) and info["has_alpha"]:
+        errors.append("透過（アルファチャンネル）を含めることはできません")
+    # 透過の有無は alpha で判定するため、カラーモードはアルファチャンネルを除いて比較する
+    color_mode = COLOR_MODES.get(info["mode"], info["mode"])
+    if "modes" in rule and color_mode not in rule["modes"]:
+        errors.append(f"カラーモードが{'/'.join(rule['modes'])}ではありません（実際: {info['mode']}）")
+    if "max_bytes" in rule and file_size > rule["max_bytes"]:
+        errors.append(f"ファイルサイズが{rule['max_bytes'] // MB}MBを超えています")
+    return errors
+
+
+def check_item(rule: dict, infos: list) -> list:
+    """項目単位（枚数）のルール違反の一覧"""
+    errors = []
+    if "devices" in rule:
+        counts = {}
+        for info in infos:
+            device = _device_of(rule, info)
+            if device is not None:
+                counts[device] = counts.get(device, 0) + 1
+        if not counts:
+            errors.append("対応するデバイスサイズのスクリーンショットがありません")
+        for device, count in counts.items():
+            if count < rule.get("min_per_device", 1):
+                errors.append(f"{device}のスクリーンショットが{rule['min_per_device']}枚未満です（{count}枚）")
+            if count > rule.get("max_per_device", count):
+                errors.append(f"{device}のスクリーンショットが{rule['max_per_device']}枚を超えています（{count}枚）")
+    if len(infos) < rule.get("min_files", 0):
+        errors.append(f"ファイルが{rule['min_files']}件未満です（{len(infos)}件）")
+    if len(infos) > rule.get("max_files", len(infos)):
+        errors.append(f"ファイルが{rule['max_files']}件を超えています（{len(infos)}件）")
+    return errors
+
+
+def _noop():
+    return None
+
+
+class AssetInspector:
+    """
+    ヘッダー解析を実行するプロセスプール
+    
+    workers=0 の場合はスレッドで実行する（開発環境など）。
+    ワーカーは spawn で起動し、起動済みのイベントループやDB接続を引き継がない。
+    """
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = None
+    
+    async def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # 最初のアップロードでワーカーの起動を待たないよう、全ワーカーを起動しておく
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _noop) for _ in range(self.workers)))
+    
+    async def inspect(self, headers: list) -> list:
+        if self._pool is None:
+            return await asyncio.to_thread(lambda: [inspect_header(header) for header in headers])
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self._pool, inspect_header, header) for header in headers))
+    
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
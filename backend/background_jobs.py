@@ -0,0 +1,105 @@
+# nativarrry（ネイティバリー）バックグラウンドジョブ
+# アプリの起動中に一定間隔で実行する処理を管理する
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+
+logger = logging.getLogger(__name__)
+
+def worker_id() -> str:
+    """リースの所有者を識別するID（import後にforkされたワーカーも区別できるよう、呼び出し時に求める）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class PeriodicJob:
+    """
+    非同期関数を一定間隔で実行するジョブ（例外はログに記録して次回に持ち越す）
+    
+    leases を指定した場合は、そのコレクションのリースを取得できたプロセスだけが実行する。
+    リースの有効期限は実行間隔より長く取り、所有者が停止した場合のみ他のプロセスが引き継ぐ。
+    実行が長引いても引き継がれないよう、実行中は実行間隔の半分ごとにリースを延長する。
+    """
+    
+    def __init__(self, name: str, func, interval: float, leases=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.leases = leases  # リース用コレクションを返す関数
+        self._task = None
+    
+    def _lease_expires_at(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.interval * 1.5)
+    
+    async def _acquire_lease(self) -> bool:
+        now = datetime.now(timezone.utc)
+        owner = worker_id()
+        try:
+            await self.leases().find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": self._lease_expires_at(now)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # 他のプロセスが有効なリースを保持している
+    
+    async def _renew_lease(self):
+        """実行中のリースを延長し続ける（保持しているリースのみ）"""
+        while True:
+            await asyncio.sleep(self.interval / 2)
+            try:
+                result = await self.leases().update_one(
+                    {"_id": self.name, "owner": worker_id()},
+                    {"$set": {"expires_at": self._lease_expires_at(datetime.now(timezone.utc))}}
+                )
+                if result.matched_count == 0:
+                    logger.warning(f"Background job '{self.name}' lost its lease while running")
+            except Exception:
+                logger.exception(f"Failed to renew lease for background job '{self.name}'")
+    
+    async def _run_with_lease(self):
+        if not await self._acquire_lease():
+            return
+        heartbeat = asyncio.create_task(self._renew_lease(), name=f"{self.name}:lease")
+        try:
+            await self.func()
+        finally:
+            heartbeat.cancel()
+            try:
+                await heartbeat
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            try:
+                if self.leases is None:
+                    await self.func()
+                else:
+                    await self._run_with_lease()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Background job '{self.name}' failed")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name=self.name)
+    
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
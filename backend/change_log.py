@@ -0,0 +1,100 @@
+# nativarrry（ネイティバリー）差分同期のための変更の記録
+# 関連データの追加・変更・削除にプロジェクトのリビジョン（rev）を付け、since 以降の変更を返せるようにする
+#
+# リビジョンを進めてから rev を付けるまでの間は、プロジェクトの sync_pending に書き込み中として記録する。
+# その間に同期したクライアントに進めたリビジョンを返すと、後から rev の付いた変更を取りこぼすため、
+# 書き込み中の記録がある場合は since を進めない（次回の同期で重複して返す）。
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+
+PENDING_TIMEOUT = 60  # 秒。これより古い書き込み中の記録は異常終了したものとして扱う
+
+
+async def touch(db, project_id: str, section: str, inc: Optional[dict] = None, pending: Optional[str] = None) -> Optional[int]:
+    """
+    プロジェクトのリビジョンを進める
+    
+    revision はプロジェクト全体、revisions.{section} は tasks / checklist / rejections などの区分ごとの値。
+    進捗カウンターの $inc と、pending を指定した場合は書き込み中の記録も同じ更新で行う。
+    
+    Returns:
+        新しいリビジョン（プロジェクトが存在しない場合はNone）
+    """
+    now = datetime.now(timezone.utc)
+    update = {
+        "$inc": {**(inc or {}), "revision": 1, f"revisions.{section}": 1},
+        "$set": {"active_at": now.isoformat()}
+    }
+    if pending is not None:
+        update["$push"] = {"sync_pending": {"token": pending, "at": now}}
+    project = await db.projects.find_one_and_update(
+        {"id": project_id},
+        update,
+        projection={"_id": 0, "revision": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return project["revision"] if project else None
+
+
+async def _finish(db, project_id: str, token: str):
+    """書き込み中の記録を取り除く（異常終了で残った古い記録も合わせて取り除く）"""
+    stale = datetime.now(timezone.utc) - timedelta(seconds=PENDING_TIMEOUT)
+    await db.projects.update_one(
+        {"id": project_id},
+        {"$pull": {"sync_pending": {"$or": [{"token": token}, {"at": {"$lt": stale}}]}}}
+    )
+
+
+async def record_changes(db, collection: str, project_id: str, section: str, ids: List[str], inc: Optional[dict] = None) -> Optional[int]:
+    """
+    ドキュメントの追加・変更を記録する
+    
+    プロジェクトのリビジョンを進め、変更したドキュメントに rev（そのリビジョン）と updated_at を付ける。
+    """
+    token = str(uuid.uuid4()) if ids else None
+    revision = await touch(db, project_id, section, inc, token)
+    if revision is not None and ids:
+        try:
+            await db[collection].update_many(
+                {"id": {"$in": ids}},
+                {"$set": {"rev": revision, "updated_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        finally:
+            await _finish(db, project_id, token)
+    return revision
+
+
+async def record_deletions(db, project_id: str, section: str, ids: List[str], inc: Optional[dict] = None) -> Optional[int]:
+    """ドキュメントの削除を記録する（差分同期で削除を伝えるための tombstone を残す）"""
+    token = str(uuid.uuid4()) if ids else None
+    revision = await touch(db, project_id, section, inc, token)
+    if revision is not None and ids:
+        try:
+            deleted_at = datetime.now(timezone.utc)
+            await db.tombstones.insert_many([
+                {"project_id": project_id, "section": section, "id": doc_id, "rev": revision, "deleted_at": deleted_at}
+                for doc_id in ids
+            ])
+        finally:
+            await _finish(db, project_id, token)
+    return revision
+
+
+def synced_revision(project: dict, since: int) -> int:
+    """
+    同期したクライアントが次回の since に指定するリビジョン
+    
+    rev を付け終えていない書き込みがある場合は since を進めない。
+    project は変更を読み込む前に読んだもの。
+    """
+    stale = datetime.now(timezone.utc) - timedelta(seconds=PENDING_TIMEOUT)
+    for entry in project.get("sync_pending") or []:
+        at = entry["at"] if entry["at"].tzinfo else entry["at"].replace(tzinfo=timezone.utc)
+        if at >= stale:
+            return since
+    return project.get("revision", 0)
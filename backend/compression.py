@@ -0,0 +1,369 @@
+# nativarrry（ネイティバリー）レスポンスの圧縮
+# Accept-Encoding に応じて zstd / br / gzip で圧縮するASGIミドルウェアと、
+# 書き込み時に一度だけ圧縮して保存する大きなテキスト（AIの分析結果など）を応答に埋め込む処理
+
+import json
+import re
+import struct
+import uuid
+import zlib
+from typing import Optional
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # 未インストールの環境では br を使わない
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 未インストールの環境では zstd を使わない
+    zstandard = None
+
+
+MIN_SIZE = 1024  # これより小さい応答は圧縮しない（バイト）
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # 応答ごとに圧縮するため速度を優先する
+ZSTD_LEVEL = 3
+PRECOMPRESS_LEVEL = 9  # 保存時の圧縮は1回だけのため圧縮率を優先する
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+PRECOMPRESSED = "precompressed"  # 圧縮して保存したテキストを持つフィールド（フィールド名 → 保存用の値）
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"  # 更新日時なし・OS不明
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        return self._compressor.process(data) + (self._compressor.finish() if finish else self._compressor.flush())
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if finish else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+# 圧縮方式 → エンコーダー（q値が同じ場合はこの順に選ぶ）
+ENCODERS = {
+    name: encoder
+    for name, encoder, available in [
+        ("zstd", _ZstdEncoder, zstandard is not None),
+        ("br", _BrotliEncoder, brotli is not None),
+        ("gzip", _GzipEncoder, True),
+    ]
+    if available
+}
+
+
+def negotiate(accept_encoding: Optional[str], available) -> Optional[str]:
+    """Accept-Encoding から使う圧縮方式を選ぶ（受け付けない場合はNone）"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for entry in accept_encoding.split(","):
+        name, _, params = entry.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name.strip():
+            weights[name.strip().lower()] = weight
+    
+    selected, best = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best:
+            selected, best = encoding, weight
+    return selected
+
+
+def _is_compressible(headers) -> bool:
+    content_type = ""
+    for name, value in headers:
+        name = name.lower()
+        if name in (b"content-encoding", b"content-range"):
+            return False  # 圧縮済み・部分的な応答
+        if name == b"content-type":
+            content_type = value.decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type or "+xml" in content_type
+
+
+def _compressed_headers(headers, encoding: str) -> list:
+    result = []
+    vary = []
+    for name, value in headers:
+        lower = name.lower()
+        if lower == b"content-length":
+            continue
+        if lower == b"vary":
+            vary.append(value)
+            continue
+        if lower == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value  # 圧縮後のバイト列は異なるため弱いETagにする
+        result.append((name, value))
+    if not any(b"accept-encoding" in value.lower() for value in vary):
+        vary.append(b"Accept-Encoding")
+    result.append((b"vary", b", ".join(vary)))
+    result.append((b"content-encoding", encoding.encode()))
+    return result
+
+
+class CompressionMiddleware:
+    """
+    Accept-Encoding に応じて応答を圧縮するASGIミドルウェア
+    
+    min_size バイトに満たない応答・圧縮済みの応答・画像などの圧縮しても縮まない形式はそのまま返す。
+    本文が複数回に分けて送られる応答（ストリーミング）は、送られるたびに圧縮してフラッシュする。
+    """
+    
+    def __init__(self, app, min_size: int = MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate(accept_encoding, ENCODERS)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start = None
+        encoder = None
+        passthrough = False
+        buffer = b""
+        
+        async def send_wrapper(message):
+            nonlocal start, encoder, passthrough, buffer
+            if message["type"] == "http.response.start":
+                start = message
+                passthrough = message["status"] < 200 or message["status"] in (204, 206, 304) \
+                    or not _is_compressible(message.get("headers", []))
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                # 圧縮するかは min_size バイトたまるか本文が終わるまで待って決める
+                buffer += body
+                if len(buffer) < self.min_size:
+                    if more_body:
+                        return
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": buffer})
+                    return
+                encoder = ENCODERS[encoding]()
+                await send({**start, "headers": _compressed_headers(start.get("headers", []), encoding)})
+                body, buffer = buffer, b""
+            await send({"type": "http.response.body", "body": encoder.compress(body, not more_body), "more_body": more_body})
+        
+        await self.app(scope, receive, send_wrapper)
+
+
+# ========== 保存時に圧縮するテキスト ==========
+
+def precompress(text: str) -> dict:
+    """
+    テキストを保存用に圧縮する
+    
+    JSON文字列としてエンコードしてからdeflateで圧縮し、gzipの応答に展開せずに埋め込めるようにする。
+    """
+    literal = json.dumps(text, ensure_ascii=False).encode()
+    compressor = zlib.compressobj(PRECOMPRESS_LEVEL, zlib.DEFLATED, -15)
+    # 末尾は最終ブロックにせずバイト境界で区切り、前後に別のdeflateのデータをつなげられるようにする
+    deflate = compressor.compress(literal) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return {"deflate": deflate, "crc32": zlib.crc32(literal), "size": len(literal)}
+
+
+class Fragment:
+    """圧縮して保存したJSON文字列"""
+    __slots__ = ("deflate", "crc32", "size")
+    
+    def __init__(self, stored: dict):
+        self.deflate = bytes(stored["deflate"])
+        self.crc32 = stored["crc32"]
+        self.size = stored["size"]
+    
+    def literal(self) -> bytes:
+        """展開したJSON文字列（引用符・エスケープを含む）"""
+        return zlib.decompressobj(-15).decompress(self.deflate)
+    
+    def text(self) -> str:
+        return json.loads(self.literal())
+
+
+def store_texts(doc: dict, fields) -> dict:
+    """fields のテキストを圧縮して PRECOMPRESSED に移す（元のフィールドはNoneにする）"""
+    stored = {}
+    for field in fields:
+        if isinstance(doc.get(field), str):
+            stored[field] = precompress(doc[field])
+            doc[field] = None
+    if stored:
+        doc[PRECOMPRESSED] = {**doc.get(PRECOMPRESSED, {}), **stored}
+    return doc
+
+
+def fragments_of(doc: dict) -> dict:
+    """ドキュメントの圧縮して保存したテキスト（フィールド名 → Fragment。ドキュメントは変更しない）"""
+    stored = doc.get(PRECOMPRESSED) or {}
+    # 保存後に書き換えられたフィールドは元のフィールドの値を使う
+    return {field: Fragment(value) for field, value in stored.items() if doc.get(field) is None}
+
+
+def expand_texts(doc: dict) -> dict:
+    """圧縮して保存したテキストを展開して元のフィールドに戻す"""
+    for field, fragment in fragments_of(doc).items():
+        doc[field] = fragment.text()
+    doc.pop(PRECOMPRESSED, None)
+    return doc
+
+
+# ========== 圧縮済みのテキストを含む応答 ==========
+
+# CRC-32 の連結（zlib の crc32_combine と同じ計算）
+_CRC32_POLY = 0xEDB88320
+
+
+def _multmodp(a: int, b: int) -> int:
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if (a & (m - 1)) == 0:
+                break
+        m >>= 1
+        b = (b >> 1) ^ _CRC32_POLY if b & 1 else b >> 1
+    return p
+
+
+def _x2n_table() -> list:
+    table = [1 << 30]
+    for _ in range(31):
+        table.append(_multmodp(table[-1], table[-1]))
+    return table
+
+
+_X2N = _x2n_table()
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """crc32(A) と crc32(B)・len(B) から crc32(A + B) を求める"""
+    p = 1 << 31
+    k = 3
+    while length2:
+        if length2 & 1:
+            p = _multmodp(_X2N[k & 31], p)
+        length2 >>= 1
+        k += 1
+    return _multmodp(p, crc1) ^ crc2
+
+
+class GzipSplicer:
+    """未圧縮のバイト列と圧縮済みの断片を、断片を展開せずに1つのgzipにつなぐ"""
+    
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self._chunks = [GZIP_HEADER]
+        self._crc32 = 0
+        self._size = 0
+    
+    def write(self, data: bytes):
+        self._chunks.append(self._compressor.compress(data))
+        self._crc32 = zlib.crc32(data, self._crc32)
+        self._size += len(data)
+    
+    def write_fragment(self, fragment: Fragment):
+        # 断片の後のデータが断片より前を参照しないよう、圧縮の履歴を捨ててバイト境界で区切る
+        self._chunks.append(self._compressor.flush(zlib.Z_FULL_FLUSH))
+        self._chunks.append(fragment.deflate)
+        self._crc32 = crc32_combine(self._crc32, fragment.crc32, fragment.size)
+        self._size += fragment.size
+    
+    def finish(self) -> bytes:
+        self._chunks.append(self._compressor.flush())
+        self._chunks.append(struct.pack("<II", self._crc32, self._size & 0xFFFFFFFF))
+        return b"".join(self._chunks)
+
+
+def _substitute(value, fragments: list, marker: str):
+    # Fragment を JSON 上で一意に見分けられる文字列に置き換える
+    if isinstance(value, Fragment):
+        fragments.append(value)
+        return f"\x00{marker}:{len(fragments) - 1}"
+    if isinstance(value, dict):
+        return {key: _substitute(item, fragments, marker) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, fragments, marker) for item in value]
+    return value
+
+
+def json_response(content, accept_encoding: Optional[str], headers: dict = None, min_size: int = MIN_SIZE) -> Response:
+    """
+    Fragment を含むJSONの応答
+    
+    gzip を受け付けるクライアントには、Fragment を展開・再圧縮せずにつないだgzipを返す。
+    それ以外は展開したJSONを返す（CompressionMiddleware が Accept-Encoding に応じて圧縮する）。
+    content は Fragment 以外はJSONに変換できる値にしておくこと。
+    """
+    fragments = []
+    marker = uuid.uuid4().hex
+    skeleton = json.dumps(
+        _substitute(content, fragments, marker), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+    # [JSON, 断片の番号, JSON, ...] に分ける（文字列内の \x00 はエスケープされるため、値の一部とは一致しない）
+    pieces = re.split(rb'"\\u0000' + marker.encode() + rb':(\d+)"', skeleton)
+    
+    headers = dict(headers or {})
+    size = sum(len(piece) for piece in pieces[::2]) + sum(fragment.size for fragment in fragments)
+    if not fragments or size < min_size or negotiate(accept_encoding, ["gzip"]) is None:
+        body = b"".join(
+            piece if index % 2 == 0 else fragments[int(piece)].literal()
+            for index, piece in enumerate(pieces)
+        )
+        return Response(body, media_type="application/json", headers=headers)
+    
+    splicer = GzipSplicer()
+    for index, piece in enumerate(pieces):
+        if index % 2 == 0:
+            splicer.write(piece)
+        else:
+            splicer.write_fragment(fragments[int(piece)])
+    headers["Content-Encoding"] = "gzip"
+    headers["Vary"] = "Accept-Encoding"
+    return Response(splicer.finish(), media_type="application/json", headers=headers)
@@ -0,0 +1,178 @@
+# nativarrry（ネイティバリー）タスクメモの書き込みバッファ
+# 自動保存で連続するメモの更新をタスクごとにまとめ、一定間隔でMongoDBへ書き込む
+
+from pymongo import UpdateOne
+
+
+class MemoConflict(Exception):
+    """差分の基準バージョンが現在のバージョンと一致しない"""
+    
+    def __init__(self, version: int):
+        super().__init__(f"Memo version mismatch (current: {version})")
+        self.version = version
+
+
+class InvalidMemoPatch(ValueError):
+    pass
+
+
+def apply_patches(text: str, patches: list) -> str:
+    """
+    差分を順に適用する
+    
+    各差分は {"start", "end", "text"} で、[start, end) の範囲を text に置き換える。
+    位置はコードポイント単位で、直前の差分を適用した後の文字列に対する値。
+    """
+    for patch in patches:
+        start, end = patch["start"], patch["end"]
+        if not 0 <= start <= end <= len(text):
+            raise InvalidMemoPatch(f"Patch range {start}-{end} is out of bounds (length: {len(text)})")
+        text = text[:start] + patch["text"] + text[end:]
+    return text
+
+
+class _PendingMemo:
+    __slots__ = ("project_id", "memo", "version")
+    
+    def __init__(self, project_id: str, memo: str, version: int):
+        self.project_id = project_id
+        self.memo = memo
+        self.version = version
+
+
+class MemoBuffer:
+    """
+    未書き込みのメモ（プロセス単位）
+    
+    同じタスクへの更新は最後の値だけを残し（last-write-wins）、flush() でまとめて書き込む。
+    バージョンは更新を受け付けるたびにMongoDBの memo_seq で割り当てるため、複数のプロセスで受け付けても重複しない。
+    memo_version は memo に保存済みの内容のバージョンで、書き込み時は保存済みより新しい場合のみ上書きする。
+    """
+    
+    def __init__(self, tasks, on_flushed=None):
+        self.tasks = tasks  # tasksコレクションを返す関数
+        self.on_flushed = on_flushed  # プロジェクトID → 書き込んだタスクIDの一覧 を受け取る非同期関数
+        self._pending = {}
+    
+    async def _current(self, task_id: str):
+        entry = self._pending.get(task_id)
+        if entry is not None:
+            return entry
+        task = await self.tasks().find_one(
+            {"id": task_id}, {"_id": 0, "project_id": 1, "memo": 1, "memo_version": 1, "memo_seq": 1}
+        )
+        if task is None:
+            return None
+        version = task.get("memo_version") or 0
+        if "memo_seq" not in task:
+            # memo_seq のないタスクは保存済みのバージョンから割り当てを始める
+            await self.tasks().update_one({"id": task_id, "memo_seq": {"$exists": False}}, {"$set": {"memo_seq": version}})
+        # 読み込み中に別の更新が受け付けられていればそちらを優先する
+        return self._pending.get(task_id) or _PendingMemo(task["project_id"], task.get("memo") or "", version)
+    
+    async def _reserve(self, task_id: str, base_version: int = None):
+        """
+        次のバージョンを割り当てる
+        
+        base_version を指定した場合は、それより新しいバージョンがまだ割り当てられていない場合のみ割り当てる。
+        """
+        query = {"id": task_id}
+        if base_version is not None:
+            query["memo_seq"] = base_version
+        previous = await self.tasks().find_one_and_update(query, {"$inc": {"memo_seq": 1}}, projection={"_id": 0, "memo_seq": 1})
+        return (previous.get("memo_seq") or 0) + 1 if previous else None
+    
+    async def update(self, task_id: str, memo: str = None, patches: list = None, base_version: int = None):
+        """
+        メモの更新を受け付ける（書き込みは flush() で行う）
+        
+        Args:
+            memo: メモの全文
+            patches: 全文の代わりに送る差分（base_version が必須）
+            base_version: クライアントが編集を始めた時点のバージョン
+        
+        Returns:
+            新しいバージョン（タスクが存在しない場合はNone）
+        """
+        entry = await self._current(task_id)
+        if entry is None:
+            return None
+        if base_version is not None and base_version != entry.version:
+            raise MemoConflict(entry.version)
+        
+        text = memo if memo is not None else entry.memo
+        if patches:
+            text = apply_patches(text, patches)
+        
+        version = await self._reserve(task_id, base_version)
+        if version is None:
+            # 他のプロセス（または並行するリクエスト）が先に新しいバージョンを受け付けた
+            task = await self.tasks().find_one({"id": task_id}, {"_id": 0, "memo_seq": 1})
+            if task is None:
+                return None
+            raise MemoConflict(task["memo_seq"])
+        
+        current = self._pending.get(task_id)
+        if current is None or current.version < version:
+            self._pending[task_id] = _PendingMemo(entry.project_id, text, version)
+        return version
+    
+    def discard(self, task_id: str):
+        """メモ以外の経路で書き込んだ・削除したタスクの未書き込み分を破棄する"""
+        self._pending.pop(task_id, None)
+    
+    def pending_marker(self, project_id: str) -> int:
+        """プロジェクトの未書き込み分を表す値（ETagに含め、未書き込みの更新を304で隠さないようにする）"""
+        return sum(entry.version for entry in self._pending.values() if entry.project_id == project_id)
+    
+    def overlay(self, tasks: list) -> list:
+        """読み出したタスクに未書き込みのメモを反映する"""
+        if self._pending:
+            for task in tasks:
+                entry = self._pending.get(task.get("id"))
+                if entry is not None and "memo" in task:
+                    task["memo"] = entry.memo
+                    task["memo_version"] = entry.version
+        return tasks
+    
+    async def flush(self, task_id: str = None) -> int:
+        """
+        未書き込みのメモを書き込む
+        
+        Args:
+            task_id: 指定した場合はそのタスクのみ
+        
+        Returns:
+            書き込んだ件数
+        """
+        if task_id is not None:
+            targets = {task_id: self._pending[task_id]} if task_id in self._pending else {}
+        else:
+            targets = dict(self._pending)
+        if not targets:
+            return 0
+        
+        # 書き込み中に受け付けた更新は次回に持ち越すため、この時点の値を控えておく
+        snapshot = {task_id: (entry.memo, entry.version) for task_id, entry in targets.items()}
+        await self.tasks().bulk_write(
+            [
+                UpdateOne(
+                    {"id": task_id, "$or": [{"memo_version": {"$lt": version}}, {"memo_version": {"$exists": False}}]},
+                    {"$set": {"memo": memo, "memo_version": version}}
+                )
+                for task_id, (memo, version) in snapshot.items()
+            ],
+            ordered=False
+        )
+        
+        for task_id, (_, version) in snapshot.items():
+            entry = self._pending.get(task_id)
+            if entry is not None and entry.version == version:
+                del self._pending[task_id]
+        
+        if self.on_flushed is not None:
+            changed = {}
+            for task_id, entry in targets.items():
+                changed.setdefault(entry.project_id, []).append(task_id)
+            await self.on_flushed(changed)
+        return len(snapshot)
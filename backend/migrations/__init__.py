@@ -0,0 +1,224 @@
+# nativarrry（ネイティバリー）スキーマのマイグレーション
+# 既存のドキュメントをバージョンごとのスクリプトで新しい形式に揃え、適用済みのバージョンをDBに記録する
+#
+# 各スクリプト（vNNN_*.py）は次を定義する:
+#   VERSION: バージョン番号（1から連番）
+#   NAME: 名前
+#   COLLECTION: 対象のコレクション
+#   QUERY: 未移行のドキュメントの条件（移行後のドキュメントは一致しないこと）
+#   PROJECTION: transform に渡すフィールド
+#   transform(doc): (追加の条件, 更新内容) を返す（_id の条件は自動で付ける）
+#   finalize(db): 全件の移行後に実行する処理（任意）
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from migrations import (
+    v001_task_fields, v002_attachment_text_status, v003_precompressed_rejection_texts, v004_task_due_at,
+    v005_archive_filenames, v006_archive_ids
+)
+
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "schema"  # maintenance_state のドキュメント（適用済みのバージョン・実行中の位置）
+
+MIGRATIONS = [
+    v001_task_fields, v002_attachment_text_status, v003_precompressed_rejection_texts, v004_task_due_at,
+    v005_archive_filenames, v006_archive_ids
+]
+LATEST_VERSION = MIGRATIONS[-1].VERSION
+
+assert [migration.VERSION for migration in MIGRATIONS] == list(range(1, LATEST_VERSION + 1))
+
+MAX_PASSES = 5  # 走査中に並行して変更されたドキュメントを拾い直す回数の上限
+
+
+async def current_version(db) -> int:
+    """適用済みのスキーマバージョン（未適用は0）"""
+    state = await db.maintenance_state.find_one({"_id": STATE_ID}, {"version": 1})
+    return (state or {}).get("version", 0)
+
+
+async def status(db) -> dict:
+    """適用済みのバージョンと未適用のマイグレーション（実行中のものは再開位置）"""
+    state = await db.maintenance_state.find_one({"_id": STATE_ID}, {"_id": 0}) or {}
+    version = state.get("version", 0)
+    checkpoint = state.get("checkpoint") or {}
+    return {
+        "version": version,
+        "latest_version": LATEST_VERSION,
+        "applied": state.get("applied", []),
+        "pending": [
+            {
+                "version": migration.VERSION,
+                "name": migration.NAME,
+                "collection": migration.COLLECTION,
+                "in_progress": checkpoint.get("version") == migration.VERSION,
+                "scanned": checkpoint.get("scanned", 0) if checkpoint.get("version") == migration.VERSION else 0,
+            }
+            for migration in MIGRATIONS if migration.VERSION > version
+        ],
+    }
+
+
+async def _throttle(count: int, started: float, rate: float):
+    # 1秒あたり rate 件を超えないよう待つ（書き込みが遅いときは待ち時間が短くなる）
+    if rate > 0:
+        await asyncio.sleep(max(0.0, count / rate - (time.monotonic() - started)))
+
+
+async def _dry_run(db, migration, batch_size: int, rate: float) -> dict:
+    report = {"version": migration.VERSION, "name": migration.NAME, "matched": 0, "would_modify": 0}
+    last_id = None
+    while True:
+        started = time.monotonic()
+        query = migration.QUERY if last_id is None else {**migration.QUERY, "_id": {"$gt": last_id}}
+        docs = await db[migration.COLLECTION].find(
+            query, {**migration.PROJECTION, "_id": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return report
+        report["matched"] += len(docs)
+        report["would_modify"] += sum(1 for doc in docs if migration.transform(doc) is not None)
+        last_id = docs[-1]["_id"]
+        await _throttle(len(docs), started, rate)
+
+
+async def _apply(db, migration, batch_size: int, rate: float, deadline: float) -> dict:
+    """
+    マイグレーションを1つ、保存した位置から _id 順に進める
+    
+    Returns:
+        {"version", "name", "scanned", "modified", "completed"}（deadline までに終わらなければ completed=False）
+    """
+    state = await db.maintenance_state.find_one({"_id": STATE_ID}, {"checkpoint": 1}) or {}
+    checkpoint = state.get("checkpoint") or {}
+    if checkpoint.get("version") != migration.VERSION:
+        checkpoint = {
+            "version": migration.VERSION,
+            "last_id": None,
+            "passes": 1,
+            "scanned": 0,
+            "modified": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+    collection = db[migration.COLLECTION]
+    
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        last_id = checkpoint["last_id"]
+        query = migration.QUERY if last_id is None else {**migration.QUERY, "_id": {"$gt": last_id}}
+        docs = await collection.find(
+            query, {**migration.PROJECTION, "_id": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        
+        if docs:
+            requests = []
+            for doc in docs:
+                change = migration.transform(doc)
+                if change is not None:
+                    condition, update = change
+                    requests.append(UpdateOne({**condition, "_id": doc["_id"]}, update))
+            if requests:
+                result = await collection.bulk_write(requests, ordered=False)
+                checkpoint["modified"] += result.modified_count
+            checkpoint["scanned"] += len(docs)
+            checkpoint["last_id"] = docs[-1]["_id"]
+        else:
+            # 走査中に更新されて条件から外れなかったドキュメントは、先頭から拾い直す
+            remaining = await collection.count_documents(migration.QUERY, limit=1)
+            if not remaining:
+                break
+            if checkpoint["passes"] >= MAX_PASSES:
+                raise RuntimeError(f"Migration {migration.VERSION} ({migration.NAME}) did not converge")
+            checkpoint["passes"] += 1
+            checkpoint["last_id"] = None
+        
+        await db.maintenance_state.update_one({"_id": STATE_ID}, {"$set": {"checkpoint": checkpoint}}, upsert=True)
+        await _throttle(len(docs), started, rate)
+    else:
+        # deadline までに終わらなかった（位置は保存済み）
+        return {"version": migration.VERSION, "name": migration.NAME, "scanned": checkpoint["scanned"],
+                "modified": checkpoint["modified"], "completed": False}
+    
+    finalize = getattr(migration, "finalize", None)
+    if finalize is not None:
+        await finalize(db)
+    applied = {
+        "version": migration.VERSION,
+        "name": migration.NAME,
+        "scanned": checkpoint["scanned"],
+        "modified": checkpoint["modified"],
+        "started_at": checkpoint["started_at"],
+        "applied_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        # 並行して実行された場合も、適用の記録は1回だけにする
+        await db.maintenance_state.update_one(
+            {"_id": STATE_ID, "version": {"$not": {"$gte": migration.VERSION}}},
+            {"$set": {"version": migration.VERSION}, "$push": {"applied": applied}, "$unset": {"checkpoint": ""}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    logger.info(f"Applied schema migration {migration.VERSION} ({migration.NAME}): {checkpoint['modified']} documents")
+    return {**applied, "completed": True}
+
+
+async def run(db, batch_size: int, rate: float, time_budget: float = None, target: int = None, dry_run: bool = False) -> dict:
+    """
+    未適用のマイグレーションを順に適用する
+    
+    batch_size 件ずつ bulk write し、1秒あたり rate 件（0で無制限）を超えないよう間隔を空ける。
+    time_budget 秒を過ぎたら位置を保存して中断し、次回はその続きから再開する。
+    dry_run の場合は書き込まずに、対象件数と変更される件数を返す。
+    
+    Returns:
+        {"version": 実行後のバージョン, "migrations": マイグレーションごとの結果}
+    """
+    version = await current_version(db)
+    target = LATEST_VERSION if target is None else min(target, LATEST_VERSION)
+    deadline = float("inf") if time_budget is None else time.monotonic() + time_budget
+    
+    reports = []
+    for migration in MIGRATIONS:
+        if not version < migration.VERSION <= target:
+            continue
+        if dry_run:
+            reports.append(await _dry_run(db, migration, batch_size, rate))
+            continue
+        report = await _apply(db, migration, batch_size, rate, deadline)
+        reports.append(report)
+        if not report["completed"]:
+            break
+        version = migration.VERSION
+    return {"version": version, "dry_run": dry_run, "migrations": reports}
+
+
+class SchemaVersion:
+    """
+    適用済みのスキーマバージョンのキャッシュ
+    
+    読み込み処理で旧形式のドキュメントへの対応を省けるかの判定に使う。
+    バージョンは下がらないため、一度満たした判定はDBを読まずに返す。
+    """
+    
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._version = 0
+        self._checked_at = None
+    
+    async def at_least(self, db, version: int) -> bool:
+        if self._version >= version:
+            return True
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.ttl:
+            self._version = await current_version(db)
+            self._checked_at = now
+        return self._version >= version
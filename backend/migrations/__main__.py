@@ -0,0 +1,45 @@
+# マイグレーションをコマンドラインから実行する（backend ディレクトリで実行）
+#   python -m migrations --status
+#   python -m migrations --dry-run
+#   python -m migrations [--target N] [--batch-size 200] [--rate 1000]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import migrations
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.status:
+            result = await migrations.status(db)
+        else:
+            result = await migrations.run(
+                db, args.batch_size, args.rate, target=args.target, dry_run=args.dry_run
+            )
+    finally:
+        client.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="show the applied version and pending migrations")
+    parser.add_argument("--dry-run", action="store_true", help="count affected documents without writing")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get('SCHEMA_MIGRATION_BATCH_SIZE', '200')))
+    parser.add_argument("--rate", type=float, default=float(os.environ.get('SCHEMA_MIGRATION_RATE', '1000')),
+                        help="maximum documents per second (0 for unlimited)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+# Phase 2 より前に作成されたタスクに、後から追加したフィールドを補う
+# フェーズ番号はフェーズ名から、ステップ番号と表示順はデフォルトタスクのテンプレートと同じタイトルのものから求める
+
+from default_tasks_template import DEFAULT_PHASES
+import task_tree
+
+
+VERSION = 1
+NAME = "task_fields"
+COLLECTION = "tasks"
+
+FIELDS = ["step_number", "phase_number", "order", "is_default", "memo_version", "rev"]
+
+QUERY = {"$or": [{field: {"$exists": False}} for field in FIELDS]}
+PROJECTION = {"title": 1, "phase": 1, **{field: 1 for field in FIELDS}}
+
+PHASE_NUMBERS = {phase["phase_name"]: phase["phase_number"] for phase in DEFAULT_PHASES}
+TEMPLATES = {(phase["phase_name"], task["title"]): task for phase in DEFAULT_PHASES for task in phase["tasks"]}
+
+
+def transform(doc: dict):
+    template = TEMPLATES.get((doc.get("phase"), doc.get("title")), {})
+    defaults = {
+        "step_number": template.get("step_number"),
+        "phase_number": PHASE_NUMBERS.get(doc.get("phase")),
+        "order": template.get("order", 0),
+        "is_default": False,
+        "memo_version": 0,
+        "rev": 0,
+    }
+    missing = {field: value for field, value in defaults.items() if field not in doc}
+    if not missing:
+        return None
+    # 読み込んだ後に設定されたフィールドは上書きしない（残ったものは次の走査で拾い直す）
+    return {field: {"$exists": False} for field in missing}, {"$set": missing}
+
+
+async def finalize(db):
+    # フェーズ別のツリーは移行前のドキュメントを持つため、次回の読み込みで作り直す
+    await db[task_tree.TREES].delete_many({})
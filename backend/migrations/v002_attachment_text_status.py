@@ -0,0 +1,28 @@
+# テキスト抽出の導入前に添付されたファイルに text_status を設定する
+# 抽出対象のドキュメントは pending としてキューに入れ、画像などは unsupported にする
+
+import text_extraction
+
+
+VERSION = 2
+NAME = "attachment_text_status"
+COLLECTION = "checklist_items"
+
+QUERY = {"files": {"$elemMatch": {"text_status": {"$exists": False}}}}
+PROJECTION = {"files.filename": 1, "files.original_name": 1, "files.mime_type": 1, "files.text_status": 1}
+
+
+def transform(doc: dict):
+    condition = {}
+    update = {}
+    for index, f in enumerate(doc.get("files", [])):
+        if "text_status" in f:
+            continue
+        # 読み込んだ後にファイルが追加・削除された場合は位置がずれるため、ファイル名で確認する
+        condition[f"files.{index}.filename"] = f["filename"]
+        update[f"files.{index}.text_status"] = text_extraction.initial_status(
+            f.get("mime_type"), f.get("original_name") or f["filename"]
+        )
+    if not update:
+        return None
+    return condition, {"$set": update}
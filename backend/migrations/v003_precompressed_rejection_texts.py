@@ -0,0 +1,25 @@
+# 保存時の圧縮を導入する前に作成されたリジェクトの、AIが生成したテキストを圧縮して保存し直す
+
+import compression
+
+
+VERSION = 3
+NAME = "precompressed_rejection_texts"
+COLLECTION = "rejections"
+
+FIELDS = ["ai_analysis", "action_plan"]
+
+QUERY = {"$or": [{field: {"$type": "string"}} for field in FIELDS]}
+PROJECTION = {field: 1 for field in FIELDS}
+
+
+def transform(doc: dict):
+    texts = {field: doc[field] for field in FIELDS if isinstance(doc.get(field), str)}
+    if not texts:
+        return None
+    update = {}
+    for field, text in texts.items():
+        update[f"{compression.PRECOMPRESSED}.{field}"] = compression.precompress(text)
+        update[field] = None
+    # 読み込んだ後に編集されたテキストは上書きしない（残ったものは次の走査で拾い直す）
+    return texts, {"$set": update}
@@ -0,0 +1,22 @@
+# 期限（ISO文字列の due_date）を日時型の due_at にも保存する（担当者・期限別の待ち行列のインデックスに使う）
+
+from datetime import datetime
+
+import work_queue
+
+
+VERSION = 4
+NAME = "task_due_at"
+COLLECTION = "tasks"
+
+QUERY = {"due_date": {"$type": "string"}, "due_at": {"$exists": False}}
+PROJECTION = {"due_date": 1}
+
+
+def transform(doc: dict):
+    try:
+        value = work_queue.due_at(datetime.fromisoformat(doc["due_date"]))
+    except ValueError:
+        value = None  # 解釈できない期限は待ち行列の対象外にする
+    # 読み込んだ後に期限が変更された場合は上書きしない
+    return {"due_date": doc["due_date"]}, {"$set": {"due_at": value}}
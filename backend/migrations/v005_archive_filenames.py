@@ -0,0 +1,17 @@
+# 添付ファイル名（filenames）を持たないアーカイブのチャンクに、展開して求めたファイル名を保存する
+# （アーカイブ中のチェックリスト項目の添付ファイルを、孤立ファイルの検出・ファイルの解放で参照として扱う）
+
+import project_archive
+
+
+VERSION = 5
+NAME = "archive_filenames"
+COLLECTION = project_archive.ARCHIVES
+
+QUERY = {"filenames": {"$exists": False}}
+PROJECTION = {"data": 1}
+
+
+def transform(doc: dict):
+    # チャンクは作成後に変更されないため、追加の条件は不要
+    return {}, {"$set": {"filenames": project_archive.chunk_filenames(doc)}}
@@ -0,0 +1,17 @@
+# ドキュメントのID（ids）を持たないアーカイブのチャンクに、展開して求めたIDを保存する
+# （アーカイブ中のタスク・チェックリスト項目にIDで書き込まれたときに、復元するプロジェクトを求める）
+
+import project_archive
+
+
+VERSION = 6
+NAME = "archive_ids"
+COLLECTION = project_archive.ARCHIVES
+
+QUERY = {"ids": {"$exists": False}}
+PROJECTION = {"data": 1}
+
+
+def transform(doc: dict):
+    # チャンクは作成後に変更されないため、追加の条件は不要
+    return {}, {"$set": {"ids": project_archive.chunk_ids(doc)}}
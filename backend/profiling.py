@@ -0,0 +1,350 @@
+# nativarrry（ネイティバリー）リクエストプロファイリング
+# ヘッダーまたはサンプリング率で有効化し、スタックのサンプリングとスパンの内訳を記録する
+
+import contextvars
+import functools
+import hmac
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from fastapi.routing import APIRoute
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+# 無効時はミドルウェア・DBプロキシ・ルートクラスのいずれも組み込まない
+ENABLED = _env_flag("PROFILING_ENABLED")
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_MS", "500"))
+BUFFER_SIZE = int(os.environ.get("PROFILE_BUFFER_SIZE", "100"))
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")  # 未設定の場合は X-Profile ヘッダーを無視する
+PROFILE_HEADER = b"x-profile"
+MAX_STACKS = 500
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """1リクエスト分のプロファイル"""
+    
+    def __init__(self, method: str, path: str, forced: bool):
+        self.id = str(uuid.uuid4())
+        self.method = method
+        self.path = path
+        self.route = None
+        self.forced = forced
+        self.status = None
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self.stacks = Counter()  # サンプラーのスレッドから書き込むため _lock を取って読み書きする
+        self.endpoint_window = None
+        self._lock = threading.Lock()
+    
+    def add_sample(self, stack: str):
+        with self._lock:
+            self.stacks[stack] += 1
+    
+    def add_span(self, name: str, start: float, end: float):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3)
+        })
+    
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self.start) * 1000, 3)
+    
+    def span_totals(self) -> dict:
+        totals = {}
+        for span in self.spans:
+            category = span["name"].split(".", 1)[0]
+            totals[category] = round(totals.get(category, 0) + span["duration_ms"], 3)
+        return totals
+    
+    def _stacks_snapshot(self) -> Counter:
+        with self._lock:
+            return self.stacks.copy()
+    
+    def folded_stacks(self) -> str:
+        """flamegraph.pl / speedscope で読み込める折り畳み形式"""
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks_snapshot().most_common()) + "\n"
+    
+    def to_document(self) -> dict:
+        stacks = self._stacks_snapshot()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "forced": self.forced,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "span_totals": self.span_totals(),
+            "spans": self.spans,
+            "sample_interval_ms": SAMPLE_INTERVAL * 1000,
+            "samples": sum(stacks.values()),
+            "stacks": [[stack, count] for stack, count in stacks.most_common(MAX_STACKS)]
+        }
+
+
+class _Span:
+    __slots__ = ("profile", "name", "start")
+    
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.profile.add_span(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """プロファイル中のリクエストであれば区間の所要時間を記録する"""
+    profile = _current_profile.get()
+    if profile is None:
+        return _NULL_SPAN
+    return _Span(profile, name)
+
+
+class StackSampler:
+    """イベントループのスレッドのスタックを一定間隔で採取するサンプラー"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def add(self, profile: RequestProfile, thread_id: int):
+        with self._lock:
+            self._targets[profile.id] = (profile, thread_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+    
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            self._targets.pop(profile.id, None)
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                targets = list(self._targets.values())
+            frames = sys._current_frames()
+            folded = {}
+            for _, thread_id in targets:
+                if thread_id not in folded:
+                    folded[thread_id] = _fold(frames.get(thread_id))
+            # remove() の後は加算しないよう、登録中であることをロック内で確かめる（remove() が戻った時点で stacks は確定する）
+            with self._lock:
+                for profile, thread_id in targets:
+                    if folded[thread_id] and profile.id in self._targets:
+                        profile.add_sample(folded[thread_id])
+            time.sleep(self.interval)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+SAMPLER = StackSampler(SAMPLE_INTERVAL)
+
+
+class ProfilingMiddleware:
+    """
+    X-Profileヘッダーまたはサンプリング率でリクエスト単位のプロファイルを取るASGIミドルウェア
+    
+    ヘッダーによる強制は PROFILE_TOKEN と一致する値を送った場合のみ有効。
+    """
+    
+    def __init__(self, app, on_complete):
+        self.app = app
+        self.on_complete = on_complete
+    
+    def _requested(self, scope) -> bool:
+        # トークンなしで強制できると、任意のクライアントがサンプリングと保存を発生させられるため無効にする
+        if not PROFILE_TOKEN:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, PROFILE_TOKEN.encode("latin-1"))
+        return False
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        forced = self._requested(scope)
+        if not forced and not (SAMPLE_RATE and random.random() < SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+        
+        profile = RequestProfile(scope["method"], scope["path"], forced)
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+        
+        token = _current_profile.set(profile)
+        SAMPLER.add(profile, threading.get_ident())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            SAMPLER.remove(profile)
+            _current_profile.reset(token)
+            profile.finish()
+            profile.route = getattr(scope.get("route"), "path", None)
+            if forced or profile.duration_ms >= SLOW_REQUEST_MS:
+                await self.on_complete(profile)
+
+
+class ProfiledRoute(APIRoute):
+    """リクエストの検証・エンドポイント本体・レスポンスのシリアライズを別スパンとして記録するルート"""
+    
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def profiled_endpoint(*args, **kwargs):
+                profile = _current_profile.get()
+                if profile is None:
+                    return await endpoint(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    profile.endpoint_window = (start, time.perf_counter())
+            
+            self.dependant.call = profiled_endpoint
+        
+        handler = super().get_route_handler()
+        
+        async def profiled_handler(request):
+            profile = _current_profile.get()
+            if profile is None:
+                return await handler(request)
+            start = time.perf_counter()
+            response = await handler(request)
+            end = time.perf_counter()
+            if profile.endpoint_window:
+                endpoint_start, endpoint_end = profile.endpoint_window
+                profile.add_span("pydantic.request_validation", start, endpoint_start)
+                profile.add_span("endpoint", endpoint_start, endpoint_end)
+                profile.add_span("pydantic.response_serialization", endpoint_end, end)
+            return response
+        
+        return profiled_handler
+
+
+async def _timed(awaitable, name: str):
+    with span(name):
+        return await awaitable
+
+
+class ProfiledCursor:
+    """カーソルのto_list()をスパンとして記録する"""
+    
+    def __init__(self, cursor, name: str):
+        self._cursor = cursor
+        self._name = name
+    
+    def __getattr__(self, attr):
+        value = getattr(self._cursor, attr)
+        if attr == "to_list":
+            return lambda *args, **kwargs: _timed(value(*args, **kwargs), self._name)
+        if not callable(value):
+            return value
+        
+        def chained(*args, **kwargs):
+            result = value(*args, **kwargs)
+            return self if result is self._cursor else result
+        
+        return chained
+    
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class ProfiledCollection:
+    """プロファイル中のリクエストに限りMongo操作をスパンとして記録するコレクションのプロキシ"""
+    
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self._name = name
+    
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if _current_profile.get() is None or not callable(value):
+            return value
+        label = f"mongo.{self._name}.{attr}"
+        
+        def wrapper(*args, **kwargs):
+            result = value(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return _timed(result, label)
+            if hasattr(result, "to_list"):
+                return ProfiledCursor(result, label)
+            return result
+        
+        return wrapper
+
+
+class ProfiledDatabase:
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+    
+    def _collection(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = ProfiledCollection(self._database[name], name)
+        return self._collections[name]
+    
+    def __getattr__(self, attr):
+        if attr.startswith("_") or hasattr(type(self._database), attr):
+            return getattr(self._database, attr)
+        return self._collection(attr)
+    
+    def __getitem__(self, name: str):
+        return self._collection(name)
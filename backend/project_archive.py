@@ -0,0 +1,212 @@
+# nativarrry（ネイティバリー）プロジェクトのアーカイブ
+# 承認済み・長期間更新のないプロジェクトの関連データを圧縮してアーカイブ用コレクションへ移し、
+# 参照されたときに元のコレクションへ戻す（プロジェクト本体は一覧表示のため残す）
+
+import asyncio
+import logging
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import bson
+from pymongo.errors import BulkWriteError
+
+import analytics
+import task_tree
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVES = "project_archives"  # 圧縮したBSONのチャンク（archive_id, collection, seq ごと）
+# チャンクには添付ファイル名（filenames）も圧縮せずに持たせ、アーカイブ中も参照として扱えるようにする
+# ドキュメントのID（ids）も同様に持たせ、IDで書き込まれたときに復元するプロジェクトを求める
+
+# アーカイブする関連コレクション（tombstones は保持期間で消えるため対象外）
+COLLECTIONS = ["tasks", "checklist_items", "rejections"]
+
+CHUNK_SIZE = 500  # 1チャンクあたりのドキュメント数
+COMPRESSION_LEVEL = 6
+
+
+def _pack(docs: list) -> bytes:
+    return zlib.compress(bson.encode({"docs": docs}), COMPRESSION_LEVEL)
+
+
+def _unpack(data: bytes) -> list:
+    return bson.decode(zlib.decompress(data))["docs"]
+
+
+def attachment_filenames(docs: list) -> list:
+    return sorted({f["filename"] for doc in docs for f in doc.get("files") or []})
+
+
+def chunk_ids(chunk: dict) -> list:
+    """チャンクのドキュメントのID（ids のない古いチャンクは展開して求める）"""
+    if "ids" in chunk:
+        return chunk["ids"]
+    return [doc.get("id") for doc in _unpack(chunk["data"])]
+
+
+def chunk_filenames(chunk: dict) -> list:
+    """チャンクのドキュメントが参照する添付ファイル名（filenames のない古いチャンクは展開して求める）"""
+    if "filenames" in chunk:
+        return chunk["filenames"]
+    return attachment_filenames(_unpack(chunk["data"]))
+
+
+def _idle_since(cutoff: str) -> dict:
+    return {"updated_at": {"$lt": cutoff}, "$or": [{"active_at": None}, {"active_at": {"$lt": cutoff}}]}
+
+
+def candidates_query(approved_days: float, idle_days: float) -> dict:
+    """
+    アーカイブ対象のプロジェクト
+    
+    承認済みで approved_days 日、または状態に関わらず idle_days 日、書き込みのないもの
+    （プロジェクト本体の更新は updated_at、関連データの更新は active_at で判定する）。
+    """
+    now = datetime.now(timezone.utc)
+    return {
+        "deleted_at": None,
+        "archived_at": None,
+        "$or": [
+            {"status": "approved", **_idle_since((now - timedelta(days=approved_days)).isoformat())},
+            _idle_since((now - timedelta(days=idle_days)).isoformat()),
+        ],
+    }
+
+
+async def archive_project(db, project_id: str) -> bool:
+    """
+    プロジェクトの関連データをアーカイブする
+    
+    退避中に書き込みがあった場合（リビジョンが変わった場合）は中止し、退避したチャンクを削除する。
+    
+    Returns:
+        アーカイブしたか
+    """
+    project = await db.projects.find_one({"id": project_id, "archived_at": None, "deleted_at": None}, {"_id": 0})
+    if project is None:
+        return False
+    revision = project.get("revision", 0)
+    archive_id = str(uuid.uuid4())
+    
+    archived = {}
+    counts = {}
+    compressed_bytes = 0
+    try:
+        for collection in COLLECTIONS:
+            docs = await db[collection].find({"project_id": project_id}).to_list(None)
+            archived[collection] = docs
+            counts[collection] = len(docs)
+            for seq, start in enumerate(range(0, len(docs), CHUNK_SIZE)):
+                chunk = docs[start:start + CHUNK_SIZE]
+                data = await asyncio.to_thread(_pack, chunk)
+                compressed_bytes += len(data)
+                await db[ARCHIVES].insert_one({
+                    "archive_id": archive_id,
+                    "project_id": project_id,
+                    "collection": collection,
+                    "seq": seq,
+                    "data": bson.Binary(data),
+                    "filenames": attachment_filenames(chunk),
+                    "ids": [doc.get("id") for doc in chunk],
+                })
+        
+        # 退避を始めた時点からリビジョンが変わっていなければ確定する
+        committed = await db.projects.find_one_and_update(
+            {"id": project_id, "revision": revision, "archived_at": None, "deleted_at": None},
+            {"$set": {
+                "archived_at": datetime.now(timezone.utc).isoformat(),
+                "archive_id": archive_id,
+                "archive_revision": revision,
+                "archive_counts": counts,
+                "archive_bytes": compressed_bytes,
+                "archive_summary": analytics.archive_summary(project, archived["tasks"], archived["rejections"]),
+            }},
+            projection={"_id": 1}
+        )
+    except Exception:
+        await db[ARCHIVES].delete_many({"archive_id": archive_id})
+        raise
+    if committed is None:
+        await db[ARCHIVES].delete_many({"archive_id": archive_id})
+        return False
+    
+    # 確定後に更新されたドキュメント（rev が新しいもの）は残し、復元時に重複として扱う
+    for collection in COLLECTIONS:
+        await db[collection].delete_many({"project_id": project_id, "rev": {"$not": {"$gt": revision}}})
+    await task_tree.invalidate(db, project_id)
+    return True
+
+
+async def ensure_hot(db, project_id: str) -> bool:
+    """
+    アーカイブ済みのプロジェクトであれば関連データを元のコレクションへ戻す
+    
+    同時に呼び出された場合も、重複した挿入は無視されるため結果は同じになる。
+    
+    Returns:
+        復元したか（アーカイブされていない場合はFalse）
+    """
+    project = await db.projects.find_one(
+        {"id": project_id, "archived_at": {"$ne": None}}, {"_id": 0, "archive_id": 1, "archive_revision": 1}
+    )
+    if project is None:
+        return False
+    archive_id = project["archive_id"]
+    
+    # アーカイブの確定後に削除されたドキュメントは戻さない
+    deleted = set(await db.tombstones.distinct(
+        "id", {"project_id": project_id, "rev": {"$gt": project.get("archive_revision", 0)}}
+    ))
+    async for chunk in db[ARCHIVES].find({"archive_id": archive_id}).sort([("collection", 1), ("seq", 1)]):
+        docs = [doc for doc in await asyncio.to_thread(_unpack, chunk["data"]) if doc.get("id") not in deleted]
+        if not docs:
+            continue
+        try:
+            await db[chunk["collection"]].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # 確定後に更新されて残っていたドキュメント・並行して復元されたドキュメント
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    
+    # 復元直後に再びアーカイブされないよう、最終更新日時を進める
+    await db.projects.update_one(
+        {"id": project_id, "archive_id": archive_id},
+        {
+            "$set": {"archived_at": None, "active_at": datetime.now(timezone.utc).isoformat()},
+            "$unset": {"archive_id": "", "archive_revision": "", "archive_counts": "", "archive_bytes": "", "archive_summary": ""},
+        }
+    )
+    await db[ARCHIVES].delete_many({"archive_id": archive_id})
+    logger.info(f"Rehydrated archived project {project_id}")
+    return True
+
+
+async def archived_project_of(db, collection: str, doc_id: str) -> Optional[str]:
+    """ドキュメントを含むアーカイブ中のプロジェクトのID（アーカイブされていない場合はNone）"""
+    chunk = await db[ARCHIVES].find_one({"collection": collection, "ids": doc_id}, {"_id": 0, "project_id": 1})
+    return chunk["project_id"] if chunk else None
+
+
+async def archive_inactive(db, approved_days: float, idle_days: float, limit: int) -> int:
+    """
+    対象のプロジェクトを最大 limit 件アーカイブする
+    
+    Returns:
+        アーカイブしたプロジェクト数
+    """
+    project_ids = [
+        project["id"] for project in await db.projects.find(
+            candidates_query(approved_days, idle_days), {"_id": 0, "id": 1}
+        ).to_list(limit)
+    ]
+    archived = 0
+    for project_id in project_ids:
+        if await archive_project(db, project_id):
+            archived += 1
+    if archived:
+        logger.info(f"Archived {archived} inactive projects")
+    return archived
@@ -0,0 +1,93 @@
+# nativarrry（ネイティバリー）削除済みプロジェクトのガベージコレクション
+# 論理削除（deleted_at）から保持期間を過ぎたプロジェクトの関連データを、少しずつ物理削除する
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import project_archive
+
+
+logger = logging.getLogger(__name__)
+
+# 添付ファイルを持たない関連コレクション（checklist_items とそのアーカイブは添付ファイルと合わせて処理する）
+CHILD_COLLECTIONS = ["tasks", "rejections", "tombstones", "project_archives", "task_trees"]
+
+
+async def release_files(db, storage, filenames) -> int:
+    """
+    どのチェックリスト項目からも参照されなくなったファイルを削除する
+    
+    複製したプロジェクトは添付ファイルを共有するため、参照が残っている間は削除しない
+    （アーカイブ済みのチェックリスト項目からの参照も含む）。
+    
+    Returns:
+        削除したファイル数
+    """
+    released = 0
+    for filename in set(filenames):
+        if await db.checklist_items.find_one({"files.filename": filename}, {"_id": 1}) is not None:
+            continue
+        if await db[project_archive.ARCHIVES].find_one({"filenames": filename}, {"_id": 1}) is not None:
+            continue
+        try:
+            await storage.delete(filename)
+            released += 1
+        except Exception as e:
+            logger.error(f"Failed to delete file {filename}: {str(e)}")
+    return released
+
+
+async def _delete_in_batches(
+    db, collection: str, query: dict, batch_size: int, pause: float, on_batch=None, projection=None
+) -> int:
+    deleted = 0
+    while True:
+        docs = await db[collection].find(
+            query, projection or {"_id": 1, "files.filename": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return deleted
+        await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        if on_batch is not None:
+            await on_batch(docs)
+        deleted += len(docs)
+        # 他のリクエストのクエリを圧迫しないよう、バッチごとに間隔を空ける
+        await asyncio.sleep(pause)
+
+
+async def collect_project(db, storage, project_id: str, batch_size: int, pause: float) -> dict:
+    """論理削除されたプロジェクトの関連データとファイルを削除し、最後にプロジェクト本体を削除する"""
+    async def release(docs):
+        await release_files(db, storage, [f["filename"] for doc in docs for f in doc.get("files", [])])
+    
+    async def release_archived(chunks):
+        await release_files(db, storage, [name for chunk in chunks for name in project_archive.chunk_filenames(chunk)])
+    
+    query = {"project_id": project_id}
+    counts = {"checklist_items": await _delete_in_batches(db, "checklist_items", query, batch_size, pause, release)}
+    # アーカイブ済みのチェックリスト項目の添付ファイルは、チャンクを削除してから参照を確認する
+    archived_items = await _delete_in_batches(
+        db, project_archive.ARCHIVES, {**query, "collection": "checklist_items"}, batch_size, pause,
+        release_archived, projection={"_id": 1, "filenames": 1, "data": 1}
+    )
+    for collection in CHILD_COLLECTIONS:
+        counts[collection] = await _delete_in_batches(db, collection, query, batch_size, pause)
+    counts[project_archive.ARCHIVES] += archived_items
+    await db.projects.delete_one({"id": project_id, "deleted_at": {"$ne": None}})
+    return counts
+
+
+async def collect_garbage(db, storage, retention_days: float, batch_size: int, pause: float) -> int:
+    """
+    保持期間を過ぎた論理削除済みプロジェクトを物理削除する
+    
+    Returns:
+        削除したプロジェクト数
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+    project_ids = await db.projects.distinct("id", {"deleted_at": {"$ne": None, "$lt": cutoff}})
+    for project_id in project_ids:
+        counts = await collect_project(db, storage, project_id, batch_size, pause)
+        logger.info(f"Collected deleted project {project_id}: {counts}")
+    return len(project_ids)
@@ -0,0 +1,162 @@
+# nativarrry（ネイティバリー）プロジェクト進捗カウンター
+# タスク・チェックリスト・リジェクトの件数をプロジェクトのドキュメントに非正規化して保持する
+
+from pymongo import UpdateOne
+
+
+REPAIR_BATCH_SIZE = 500
+
+
+def _phase_key(task: dict) -> str:
+    return str(task.get("phase_number") or 0)
+
+
+def task_counts(task: dict, sign: int = 1) -> dict:
+    """タスク1件分の $inc（sign=-1 で差し引き）"""
+    if not task:
+        return {}
+    completed = sign if task.get("completed") else 0
+    phase = f"progress.phases.{_phase_key(task)}"
+    return {
+        "progress.tasks.total": sign,
+        "progress.tasks.completed": completed,
+        f"{phase}.total": sign,
+        f"{phase}.completed": completed,
+    }
+
+
+def checklist_counts(item: dict, sign: int = 1) -> dict:
+    """チェックリスト項目1件分の $inc（プラットフォーム別）"""
+    if not item:
+        return {}
+    platform = f"progress.checklist.{item.get('platform') or 'unknown'}"
+    return {
+        f"{platform}.total": sign,
+        f"{platform}.completed": sign if item.get("status") == "completed" else 0,
+    }
+
+
+def rejection_counts(rejection: dict, sign: int = 1) -> dict:
+    """リジェクト1件分の $inc（未解決のものだけを数える）"""
+    if not rejection:
+        return {}
+    return {"progress.open_rejections": sign if rejection.get("status") != "resolved" else 0}
+
+
+def changes(before: dict, after: dict, counts) -> dict:
+    """変更前後のドキュメントから差分の $inc を求める"""
+    inc = dict(counts(before, -1))
+    for path, value in counts(after, 1).items():
+        inc[path] = inc.get(path, 0) + value
+    return {path: value for path, value in inc.items() if value}
+
+
+def merge(*incs) -> dict:
+    total = {}
+    for inc in incs:
+        for path, value in inc.items():
+            total[path] = total.get(path, 0) + value
+    # 0の $inc もフィールドを作成するため残す
+    return total
+
+
+def _ordered(progress: dict) -> dict:
+    """サブドキュメントの比較はキーの順序に依存するため、$inc で追加される順（番号・名前順）に揃える"""
+    progress["phases"] = dict(sorted(progress["phases"].items(), key=lambda item: int(item[0])))
+    progress["checklist"] = dict(sorted(progress["checklist"].items()))
+    return progress
+
+
+def empty_progress() -> dict:
+    return {"tasks": {"total": 0, "completed": 0}, "phases": {}, "checklist": {}, "open_rejections": 0}
+
+
+def build_progress(tasks: list, items: list, rejections: list) -> dict:
+    """ドキュメントの一覧から進捗を集計する（複製時など、挿入前のドキュメント向け）"""
+    progress = empty_progress()
+    for task in tasks:
+        phase = progress["phases"].setdefault(_phase_key(task), {"total": 0, "completed": 0})
+        for counter in (progress["tasks"], phase):
+            counter["total"] += 1
+            counter["completed"] += 1 if task.get("completed") else 0
+    for item in items:
+        counter = progress["checklist"].setdefault(item.get("platform") or "unknown", {"total": 0, "completed": 0})
+        counter["total"] += 1
+        counter["completed"] += 1 if item.get("status") == "completed" else 0
+    progress["open_rejections"] = sum(1 for rejection in rejections if rejection.get("status") != "resolved")
+    return _ordered(progress)
+
+
+async def _recompute_batch(db, project_ids: list) -> int:
+    match = {"$match": {"project_id": {"$in": project_ids}}}
+    progress = {project_id: empty_progress() for project_id in project_ids}
+    
+    task_rows = await db.tasks.aggregate([
+        match,
+        {"$group": {
+            "_id": {"project_id": "$project_id", "phase_number": "$phase_number"},
+            "total": {"$sum": 1},
+            "completed": {"$sum": {"$cond": ["$completed", 1, 0]}}
+        }}
+    ]).to_list(None)
+    for row in task_rows:
+        target = progress[row["_id"]["project_id"]]
+        target["phases"][_phase_key(row["_id"])] = {"total": row["total"], "completed": row["completed"]}
+        target["tasks"]["total"] += row["total"]
+        target["tasks"]["completed"] += row["completed"]
+    
+    item_rows = await db.checklist_items.aggregate([
+        match,
+        {"$group": {
+            "_id": {"project_id": "$project_id", "platform": "$platform"},
+            "total": {"$sum": 1},
+            "completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}}
+        }}
+    ]).to_list(None)
+    for row in item_rows:
+        platform = row["_id"].get("platform") or "unknown"
+        progress[row["_id"]["project_id"]]["checklist"][platform] = {"total": row["total"], "completed": row["completed"]}
+    
+    rejection_rows = await db.rejections.aggregate([
+        match,
+        {"$match": {"status": {"$ne": "resolved"}}},
+        {"$group": {"_id": "$project_id", "open": {"$sum": 1}}}
+    ]).to_list(None)
+    for row in rejection_rows:
+        progress[row["_id"]]["open_rejections"] = row["open"]
+    
+    # 値が変わったプロジェクトのみ更新し、リビジョンを進める（ETagを無効化するため）
+    await db.projects.bulk_write(
+        [
+            UpdateOne({"id": project_id, "progress": {"$ne": _ordered(value)}}, {"$set": {"progress": value}, "$inc": {"revision": 1}})
+            for project_id, value in progress.items()
+        ],
+        ordered=False
+    )
+    return len(project_ids)
+
+
+async def recompute_progress(db, project_ids: list = None) -> int:
+    """
+    元データからカウンターを再計算する（修復ジョブ）
+    
+    Args:
+        project_ids: 対象のプロジェクトID（省略時は全プロジェクト）
+    
+    Returns:
+        再計算したプロジェクト数
+    """
+    if project_ids is not None:
+        return await _recompute_batch(db, project_ids) if project_ids else 0
+    
+    repaired = 0
+    batch = []
+    # アーカイブ済みのプロジェクトは関連データが退避されているため対象外（復元時に戻る）
+    async for project in db.projects.find({"deleted_at": None, "archived_at": None}, {"_id": 0, "id": 1}):
+        batch.append(project["id"])
+        if len(batch) >= REPAIR_BATCH_SIZE:
+            repaired += await _recompute_batch(db, batch)
+            batch = []
+    if batch:
+        repaired += await _recompute_batch(db, batch)
+    return repaired
@@ -0,0 +1,110 @@
+# nativarrry（ネイティバリー）プロセス単位のリソース
+# MongoDBクライアントはimport時ではなくlifespanの中で生成し、ワーカープロセスごとに接続プールを持つ
+
+import asyncio
+import logging
+import os
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+import metrics
+import profiling
+
+
+logger = logging.getLogger(__name__)
+
+# 環境変数 → MongoClientのオプション（未設定のものはドライバーの既定値）
+# ホストあたりの最大接続数は ワーカー数 × MONGO_MAX_POOL_SIZE になる
+MONGO_POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+}
+
+# 接続待ちで無期限にブロックしないための既定値
+MONGO_POOL_DEFAULTS = {
+    "serverSelectionTimeoutMS": 5000,
+    "waitQueueTimeoutMS": 5000,
+}
+
+
+def mongo_client_options() -> dict:
+    options = dict(MONGO_POOL_DEFAULTS)
+    for env_name, option in MONGO_POOL_SETTINGS.items():
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = int(value)
+    return options
+
+
+class Resources:
+    """lifespanで生成・破棄するリソースのコンテナ"""
+    
+    def __init__(self):
+        self.client = None
+        self.db = None
+        self.ready = False
+    
+    def connect(self):
+        self.client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            event_listeners=[metrics.MongoCommandListener()],
+            **mongo_client_options()
+        )
+        database = self.client[os.environ['DB_NAME']]
+        self.db = profiling.ProfiledDatabase(database) if profiling.ENABLED else database
+    
+    async def wait_until_reachable(self, timeout: float):
+        """MongoDBに接続できるまで待つ（timeout秒を超えたら例外を送出）"""
+        deadline = time.monotonic() + timeout
+        delay = 0.5
+        while True:
+            try:
+                await self.client.admin.command("ping")
+                return
+            except PyMongoError as e:
+                if time.monotonic() + delay > deadline:
+                    raise
+                logger.warning(f"MongoDB is not reachable yet, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+    
+    async def ping(self, timeout: float) -> bool:
+        if self.client is None:
+            return False
+        try:
+            await asyncio.wait_for(self.client.admin.command("ping"), timeout)
+            return True
+        except (PyMongoError, asyncio.TimeoutError):
+            return False
+    
+    def close(self):
+        self.ready = False
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self.db = None
+
+
+class DatabaseHandle:
+    """接続済みのデータベースへの参照（import時点では未接続のため、アクセスのたびに解決する）"""
+    
+    def __init__(self, resources: Resources):
+        self._resources = resources
+    
+    def _database(self):
+        if self._resources.db is None:
+            raise RuntimeError("Database is not connected; it is opened by the application lifespan")
+        return self._resources.db
+    
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+    
+    def __getitem__(self, name):
+        return self._database()[name]
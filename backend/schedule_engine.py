@@ -0,0 +1,207 @@
+# nativarrry（ネイティバリー）スケジュール予測エンジン
+# タスクの所要日数（estimated_days）から各タスクの予定開始日・終了日を算出する
+
+import re
+import unicodedata
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+
+
+HOURS_PER_DAY = 8  # 「数時間」などを作業日に換算する際の1日の作業時間
+SECONDS_PER_DAY = 86400
+
+# 単位ごとの日数換算
+UNIT_DAYS = {
+    "時間": 1 / HOURS_PER_DAY,
+    "日": 1,
+    "週間": 7,
+    "週": 7,
+    "ヶ月": 30,
+    "か月": 30,
+    "カ月": 30,
+}
+
+# 数値のない表現
+FIXED_ESTIMATES = {
+    "即時": (0.0, 0.0),
+    "数時間": (2 / HOURS_PER_DAY, 6 / HOURS_PER_DAY),
+    "数日": (2.0, 5.0),
+    "数週間": (14.0, 28.0),
+}
+
+_RANGE_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(?:[-~〜]\s*(\d+(?:\.\d+)?))?\s*(時間|日|週間|週|ヶ月|か月|カ月)"
+)
+
+
+@lru_cache(maxsize=1024)
+def parse_estimated_days(text: str) -> tuple:
+    """
+    所要日数の文字列を (最短日数, 最長日数) に変換する
+    
+    Args:
+        text: "即時", "1-2日", "1-2週間", "数時間", "平均 2～7日 (場合により10日以上)" など
+    
+    Returns:
+        (min_days, max_days)。解釈できない場合は (nan, nan)
+    """
+    if not text:
+        return (float("nan"), float("nan"))
+    normalized = unicodedata.normalize("NFKC", text).strip()
+    
+    for keyword, estimate in FIXED_ESTIMATES.items():
+        if keyword in normalized:
+            return estimate
+    
+    matches = _RANGE_PATTERN.findall(normalized)
+    if not matches:
+        return (float("nan"), float("nan"))
+    
+    # 最初の範囲を基本とし、補足（「10日以上」など）は最長日数にのみ反映する
+    low, high, unit = matches[0]
+    min_days = float(low) * UNIT_DAYS[unit]
+    max_days = float(high or low) * UNIT_DAYS[unit]
+    for low, high, unit in matches[1:]:
+        max_days = max(max_days, float(high or low) * UNIT_DAYS[unit])
+    return (min_days, max_days)
+
+
+def _to_epoch_days(value) -> float:
+    if value is None:
+        return float("nan")
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp() / SECONDS_PER_DAY
+
+
+def _from_epoch_days(value: float):
+    if np.isnan(value):
+        return None
+    return datetime.fromtimestamp(value * SECONDS_PER_DAY, tz=timezone.utc)
+
+
+def compute_schedules(projects: list, tasks: list, now: datetime = None, include_tasks: bool = True) -> dict:
+    """
+    複数プロジェクトのスケジュールをまとめて算出する
+    
+    未完了のタスクをフェーズ番号・表示順に直列で実行するものとして、
+    max(開始日, 現在日時) を起点に予定開始日・終了日を積み上げる。
+    完了済みタスクの所要日数は0として扱う。
+    
+    Args:
+        projects: id, start_date, publish_date を含むプロジェクトのリスト
+        tasks: project_id, phase_number, order, estimated_days, completed を含むタスクのリスト
+        now: 基準日時（省略時は現在日時）
+        include_tasks: タスク単位の予測を結果に含めるかどうか
+    
+    Returns:
+        プロジェクトIDをキーとしたスケジュール予測
+    """
+    now_days = _to_epoch_days(now or datetime.now(timezone.utc))
+    project_index = {project["id"]: i for i, project in enumerate(projects)}
+    start = np.array([_to_epoch_days(p.get("start_date")) for p in projects], dtype=float)
+    publish = np.array([_to_epoch_days(p.get("publish_date")) for p in projects], dtype=float)
+    anchor = np.fmax(np.nan_to_num(start, nan=now_days), now_days)
+    
+    tasks = [task for task in tasks if task.get("project_id") in project_index]
+    count = len(tasks)
+    proj = np.fromiter((project_index[t["project_id"]] for t in tasks), dtype=np.int64, count=count)
+    phase = np.fromiter((t.get("phase_number") or 0 for t in tasks), dtype=np.int64, count=count)
+    order = np.fromiter((t.get("order") or 0 for t in tasks), dtype=np.int64, count=count)
+    done = np.fromiter((bool(t.get("completed")) for t in tasks), dtype=bool, count=count)
+    
+    # 所要日数は種類が少ないため、ユニークな文字列ごとに1回だけ解析する
+    labels, inverse = np.unique(np.array([t.get("estimated_days") or "" for t in tasks], dtype=object), return_inverse=True)
+    parsed = np.array([parse_estimated_days(label) for label in labels], dtype=float).reshape(-1, 2)
+    duration_min = parsed[inverse, 0] if count else np.zeros(0)
+    duration_max = parsed[inverse, 1] if count else np.zeros(0)
+    unestimated = np.isnan(duration_min)
+    
+    # プロジェクト → フェーズ → 表示順で並べ替え
+    sort_index = np.lexsort((order, phase, proj))
+    proj, done = proj[sort_index], done[sort_index]
+    duration_min, duration_max = duration_min[sort_index], duration_max[sort_index]
+    unestimated = unestimated[sort_index]
+    
+    remaining_min = np.where(done, 0.0, np.nan_to_num(duration_min))
+    remaining_max = np.where(done, 0.0, np.nan_to_num(duration_max))
+    
+    # プロジェクトごとの累積和（全体の累積和から各プロジェクト先頭までの累積を差し引く）
+    end_min = _segmented_cumsum(remaining_min, proj)
+    end_max = _segmented_cumsum(remaining_max, proj)
+    
+    project_count = len(projects)
+    total_min = np.bincount(proj, weights=remaining_min, minlength=project_count)
+    total_max = np.bincount(proj, weights=remaining_max, minlength=project_count)
+    open_tasks = np.bincount(proj, weights=~done, minlength=project_count)
+    unestimated_tasks = np.bincount(proj, weights=unestimated & ~done, minlength=project_count)
+    
+    finish_min = anchor + total_min
+    finish_max = anchor + total_max
+    slack = publish - finish_max
+    
+    schedules = {}
+    for i, project in enumerate(projects):
+        schedules[project["id"]] = {
+            "project_id": project["id"],
+            "name": project.get("name"),
+            "anchor_date": _from_epoch_days(anchor[i]),
+            "publish_date": _from_epoch_days(publish[i]),
+            "projected_finish_min": _from_epoch_days(finish_min[i]),
+            "projected_finish_max": _from_epoch_days(finish_max[i]),
+            "remaining_days_min": round(float(total_min[i]), 2),
+            "remaining_days_max": round(float(total_max[i]), 2),
+            "slack_days": None if np.isnan(slack[i]) else round(float(slack[i]), 2),
+            "open_tasks": int(open_tasks[i]),
+            "unestimated_tasks": int(unestimated_tasks[i]),
+            "risk": _risk(publish[i], finish_min[i], finish_max[i]),
+        }
+        if include_tasks:
+            schedules[project["id"]]["tasks"] = []
+    
+    if include_tasks:
+        start_min = end_min - remaining_min
+        start_max = end_max - remaining_max
+        for position, task_position in enumerate(sort_index):
+            task = tasks[task_position]
+            i = proj[position]
+            schedules[task["project_id"]]["tasks"].append({
+                "id": task.get("id"),
+                "title": task.get("title"),
+                "step_number": task.get("step_number"),
+                "phase_number": task.get("phase_number"),
+                "estimated_days": task.get("estimated_days"),
+                "completed": bool(done[position]),
+                "duration_days_min": None if unestimated[position] else float(duration_min[position]),
+                "duration_days_max": None if unestimated[position] else float(duration_max[position]),
+                "projected_start_min": None if done[position] else _from_epoch_days(anchor[i] + start_min[position]),
+                "projected_start_max": None if done[position] else _from_epoch_days(anchor[i] + start_max[position]),
+                "projected_end_min": None if done[position] else _from_epoch_days(anchor[i] + end_min[position]),
+                "projected_end_max": None if done[position] else _from_epoch_days(anchor[i] + end_max[position]),
+            })
+    
+    return schedules
+
+
+def _segmented_cumsum(values, groups):
+    """並べ替え済みのグループごとに累積和を取る"""
+    if not len(values):
+        return values
+    cumulative = np.cumsum(values)
+    group_start = np.r_[True, groups[1:] != groups[:-1]]
+    offsets = np.where(group_start, cumulative - values, 0.0)
+    return cumulative - np.maximum.accumulate(np.where(group_start, offsets, -np.inf))
+
+
+def _risk(publish: float, finish_min: float, finish_max: float) -> str:
+    if np.isnan(publish):
+        return "no_target"
+    if finish_min > publish:
+        return "late"  # 最短でも公開日に間に合わない
+    if finish_max > publish:
+        return "at_risk"  # 最長見積もりでは公開日を超過する
+    return "on_track"
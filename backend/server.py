@@ -1,39 +1,185 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Header, Depends, Request
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, timezone
+import json
+import hashlib
+import hmac
+from datetime import datetime, timedelta, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from default_tasks_template import get_default_tasks_for_platform, get_phases_summary
 from default_checklist_template import get_default_checklist_for_platform
-import shutil
+from schedule_engine import compute_schedules
+import time
+import metrics
+import compression
+import profiling
+import analytics
+import change_log
+import project_progress
+import project_gc
+import project_archive
+import task_tree
+import work_queue
+import upload_reconciler
+import upload_sessions
+import asset_validation
+import text_extraction
+import migrations
+from migrations import v002_attachment_text_status
+from background_jobs import PeriodicJob
+from singleflight import SingleFlight, WriteGeneration, WriteGenerationMiddleware, make_key
+from resources import Resources, DatabaseHandle
+from storage import create_storage
+from memo_buffer import MemoBuffer, MemoConflict, InvalidMemoPatch
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
-# Create the main app without a prefix
-app = FastAPI()
+# MongoDB connection（接続はlifespanで開き、ワーカープロセスごとに接続プールを持つ）
+resources = Resources()
+db = DatabaseHandle(resources)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=profiling.ProfiledRoute if profiling.ENABLED else APIRoute)
+
+# アップロードファイルの保存先（STORAGE_BACKEND=s3 の場合はS3互換ストレージ）
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/app/uploads'))
+storage = create_storage(UPLOAD_DIR)
+
+# 直接アップロードの完了通知を待つ時間（秒）
+PENDING_UPLOAD_TTL = 3600
+
+# 再開可能な分割アップロード（大きな動画・ビルドなど）
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_MB', '8')) * 1024 * 1024  # 既定のチャンクサイズ
+UPLOAD_SESSION_MAX_BYTES = int(os.environ.get('UPLOAD_SESSION_MAX_MB', '4096')) * 1024 * 1024
+UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', '86400'))  # 最後のチャンクを受信してから破棄するまで
+UPLOAD_SESSION_SWEEP_INTERVAL = float(os.environ.get('UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS', '600'))
+UPLOAD_SESSION_SWEEP_BATCH_SIZE = 100
+
+# プロジェクト一括複製の上限
+MAX_CLONE_COUNT = 100
+
+# AIアシスタントで使用するモデル
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-4o-mini"
+
+# 分析サマリーの再集計間隔（秒、0で無効）
+ANALYTICS_REFRESH_INTERVAL = float(os.environ.get('ANALYTICS_REFRESH_INTERVAL_SECONDS', '600'))
+
+# 進捗カウンターの修復ジョブの実行間隔（秒、0で無効）
+PROGRESS_REPAIR_INTERVAL = float(os.environ.get('PROGRESS_REPAIR_INTERVAL_SECONDS', '86400'))
+
+# タスクメモの自動保存をまとめて書き込む間隔（秒）
+MEMO_FLUSH_INTERVAL = float(os.environ.get('MEMO_FLUSH_INTERVAL_SECONDS', '2'))
+
+# 削除の記録（差分同期用）の保持日数（これより長く同期していないクライアントは全件を読み込み直す）
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', '30'))
+
+# 論理削除したプロジェクトを復元できる日数（過ぎたものはバックグラウンドで物理削除する）
+PROJECT_RETENTION_DAYS = float(os.environ.get('PROJECT_RETENTION_DAYS', '7'))
+PROJECT_GC_INTERVAL = float(os.environ.get('PROJECT_GC_INTERVAL_SECONDS', '300'))
+PROJECT_GC_BATCH_SIZE = int(os.environ.get('PROJECT_GC_BATCH_SIZE', '500'))
+PROJECT_GC_BATCH_PAUSE = float(os.environ.get('PROJECT_GC_BATCH_PAUSE_SECONDS', '0.2'))
+
+# 承認済み・更新のないプロジェクトの関連データをアーカイブする（参照時に自動で復元）
+PROJECT_ARCHIVE_INTERVAL = float(os.environ.get('PROJECT_ARCHIVE_INTERVAL_SECONDS', '3600'))
+PROJECT_ARCHIVE_APPROVED_DAYS = float(os.environ.get('PROJECT_ARCHIVE_APPROVED_DAYS', '30'))  # 承認済みのプロジェクト
+PROJECT_ARCHIVE_IDLE_DAYS = float(os.environ.get('PROJECT_ARCHIVE_IDLE_DAYS', '180'))  # 状態に関わらず
+PROJECT_ARCHIVE_BATCH_SIZE = int(os.environ.get('PROJECT_ARCHIVE_BATCH_SIZE', '50'))  # 1回あたりのプロジェクト数
+
+# アップロードディレクトリの整合性チェック（孤立ファイル・参照切れの検出）
+UPLOAD_RECONCILE_INTERVAL = float(os.environ.get('UPLOAD_RECONCILE_INTERVAL_SECONDS', '3600'))
+UPLOAD_RECONCILE_QUARANTINE = os.environ.get('UPLOAD_RECONCILE_MODE', 'report') == 'quarantine'  # report / quarantine
+UPLOAD_ORPHAN_GRACE = float(os.environ.get('UPLOAD_ORPHAN_GRACE_SECONDS', '3600'))  # これより新しいファイルは対象外
+UPLOAD_RECONCILE_BATCH_SIZE = 1000
+UPLOAD_RECONCILE_MAX_ENTRIES = int(os.environ.get('UPLOAD_RECONCILE_MAX_ENTRIES', '100000'))  # 1回あたりの走査件数
+
+# 添付画像の自動チェックを実行するプロセス数（0でスレッド実行）
+ASSET_VALIDATION_WORKERS = int(os.environ.get('ASSET_VALIDATION_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# 添付ドキュメント（PDF・テキスト・Word）のテキスト抽出
+TEXT_EXTRACTION_WORKERS = int(os.environ.get('TEXT_EXTRACTION_WORKERS', '1'))  # 0でスレッド実行
+TEXT_EXTRACTION_INTERVAL = float(os.environ.get('TEXT_EXTRACTION_INTERVAL_SECONDS', '10'))
+TEXT_EXTRACTION_BATCH_SIZE = int(os.environ.get('TEXT_EXTRACTION_BATCH_SIZE', '20'))  # 1回あたりのチェックリスト項目数
+TEXT_EXTRACTION_MAX_BYTES = int(os.environ.get('TEXT_EXTRACTION_MAX_MB', '20')) * 1024 * 1024  # これより大きいファイルは対象外
+TEXT_EXTRACTION_TIMEOUT = float(os.environ.get('TEXT_EXTRACTION_TIMEOUT_SECONDS', '60'))  # 1件あたり
+AI_ATTACHMENT_CONTEXT_CHARS = int(os.environ.get('AI_ATTACHMENT_CONTEXT_CHARS', '6000'))  # AIに渡す添付ドキュメントの抜粋の文字数
+
+# スキーマのマイグレーション（未適用のものをバックグラウンドで少しずつ適用する）
+SCHEMA_MIGRATION_INTERVAL = float(os.environ.get('SCHEMA_MIGRATION_INTERVAL_SECONDS', '60'))  # 1回あたりの実行時間も兼ねる
+SCHEMA_MIGRATION_BATCH_SIZE = int(os.environ.get('SCHEMA_MIGRATION_BATCH_SIZE', '200'))
+SCHEMA_MIGRATION_RATE = float(os.environ.get('SCHEMA_MIGRATION_RATE', '1000'))  # 1秒あたりのドキュメント数（0で無制限）
+
+# 応答の圧縮（これより小さい応答は圧縮しない）
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+
+# 書き込み時に圧縮して保存するリジェクトのテキスト（AIが生成した分析・対応計画）
+PRECOMPRESSED_REJECTION_FIELDS = ["ai_analysis", "action_plan"]
+
+# 差分同期の対象（区分 → コレクション）
+SYNC_COLLECTIONS = {"tasks": "tasks", "checklist": "checklist_items", "rejections": "rejections"}
+
+# 起動時にMongoDBへの接続を待つ最大秒数（超えた場合は起動失敗）
+MONGO_STARTUP_TIMEOUT = float(os.environ.get('MONGO_STARTUP_TIMEOUT_SECONDS', '30'))
+
+# /readyz でのMongoDB疎通確認のタイムアウト（秒）
+READINESS_PING_TIMEOUT = 1.0
+
+# スナップショットで取得できる区分
+SNAPSHOT_SECTIONS = ["project", "tasks", "phases", "checklist", "rejections"]
+
+# デフォルトのタスク・チェックリストを用意するプラットフォーム
+PLATFORMS = ["iOS", "Android", "Both"]
+
+# /phases のレスポンス（warm-upで生成してキャッシュ）
+PHASES = None
+PHASES_BODY = None
+PHASES_ETAG = None
+PHASES_MAX_AGE = 86400
+
+# プラットフォーム → 検証・シリアライズ済みのテンプレートドキュメント（id, project_id, created_at を除く）
+DEFAULT_TASK_DOCUMENTS = {}
+DEFAULT_CHECKLIST_DOCUMENTS = {}
+
+# 一覧のソートに使用できるフィールド
+PROJECT_SORT_FIELDS = {"name", "status", "platform", "start_date", "publish_date", "created_at", "updated_at"}
+TASK_SORT_FIELDS = {"title", "phase_number", "order", "step_number", "status", "due_date", "completed_at", "created_at"}
 
 
 # ========== Data Models ==========
 
+class ProgressCounter(BaseModel):
+    total: int = 0
+    completed: int = 0
+
+class ProjectProgress(BaseModel):
+    """タスク・チェックリスト・リジェクトの件数（書き込み時に $inc で更新される非正規化カウンター）"""
+    tasks: ProgressCounter = Field(default_factory=ProgressCounter)
+    phases: Dict[str, ProgressCounter] = {}  # フェーズ番号（文字列）ごと
+    checklist: Dict[str, ProgressCounter] = {}  # プラットフォームごと
+    open_rejections: int = 0
+
 class Project(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -44,8 +190,14 @@ class Project(BaseModel):
     status: str = "active"  # "active", "submitted", "approved", "rejected"
     start_date: Optional[datetime] = None  # ネイティブ申請開始日
     publish_date: Optional[datetime] = None  # 公開日（目標）
+    progress: ProjectProgress = Field(default_factory=ProjectProgress)
+    revision: int = 0  # 書き込みごとに増えるリビジョン（ETag用）
+    revisions: Dict[str, int] = {}  # 区分（project, tasks, checklist, rejections）ごとのリビジョン
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    deleted_at: Optional[datetime] = None  # 論理削除した日時（PROJECT_RETENTION_DAYS 日後に物理削除）
+    active_at: Optional[datetime] = None  # タスク・チェックリストなどの最終更新日時
+    archived_at: Optional[datetime] = None  # 関連データをアーカイブした日時（参照時に復元される）
 
 class ProjectCreate(BaseModel):
     name: str
@@ -63,6 +215,16 @@ class ProjectUpdate(BaseModel):
     start_date: Optional[datetime] = None
     publish_date: Optional[datetime] = None
 
+class ProjectCloneRequest(BaseModel):
+    names: List[str]  # 作成するプロジェクト名（1件につき1プロジェクト）
+    description: Optional[str] = None
+    start_date: Optional[datetime] = None
+    publish_date: Optional[datetime] = None
+    include_tasks: bool = True
+    include_checklist: bool = True
+    include_attachments: bool = False  # 添付ファイルの参照もコピーする
+    reset_progress: bool = True  # タスクの完了状態をリセットする
+
 
 class Task(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -77,6 +239,7 @@ class Task(BaseModel):
     priority: str = "medium"  # "low", "medium", "high"
     completed: bool = False  # 完了フラグ
     memo: Optional[str] = None  # メモ/ノート
+    memo_version: int = 0  # メモの更新ごとに進むバージョン
     step_number: Optional[str] = None  # ステップ番号（例: "1.1", "2.3"）
     phase_number: Optional[int] = None  # フェーズ番号（1-9）
     estimated_days: Optional[str] = None  # 所要日数（例: "1-3日", "即時"）
@@ -86,6 +249,8 @@ class Task(BaseModel):
     is_default: bool = False  # デフォルトタスクかどうか
     completed_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: Optional[datetime] = None
+    rev: int = 0  # 最後に変更されたときのプロジェクトのリビジョン（差分同期に使用）
 
 class TaskCreate(BaseModel):
     project_id: str
@@ -112,6 +277,43 @@ class TaskUpdate(BaseModel):
     completed: Optional[bool] = None
     memo: Optional[str] = None
 
+class WorkQueueProject(BaseModel):
+    project_id: str
+    project_name: Optional[str] = None
+    tasks: List[Task]
+
+class WorkQueue(BaseModel):
+    """担当者・期限別のタスク（期限の近い順。プロジェクトはページ内で最も期限の近いタスクの順）"""
+    projects: List[WorkQueueProject]
+    count: int  # ページのタスク数
+    next_cursor: Optional[str] = None  # 次のページ（cursor に指定する）
+
+class MemoPatch(BaseModel):
+    # 位置はコードポイント単位（JavaScriptのUTF-16のコード単位ではない）
+    start: int  # 置き換える範囲の開始位置
+    end: int  # 置き換える範囲の終了位置（この位置は含まない）
+    text: str = ""
+
+class TaskMemoUpdate(BaseModel):
+    memo: Optional[str] = None  # メモの全文
+    patches: Optional[List[MemoPatch]] = None  # 全文の代わりに送る差分
+    base_version: Optional[int] = None  # 編集を始めた時点の memo_version（差分の場合は必須）
+
+
+class AssetValidation(BaseModel):
+    passed: bool
+    errors: List[str] = []  # ルール違反の内容
+    format: Optional[str] = None  # "PNG", "JPEG"
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mode: Optional[str] = None  # カラーモード（"RGB", "RGBA" など）
+    has_alpha: Optional[bool] = None
+    checked_at: datetime
+
+class ChecklistValidation(BaseModel):
+    passed: bool  # すべてのファイルと枚数のルールを満たしている
+    errors: List[str] = []  # 枚数などの項目単位のルール違反
+    checked_at: datetime
 
 class FileAttachment(BaseModel):
     filename: str
@@ -120,6 +322,10 @@ class FileAttachment(BaseModel):
     file_size: int
     mime_type: str
     uploaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    missing: bool = False  # 実体が見つからない（整合性チェックで検出）
+    validation: Optional[AssetValidation] = None  # 素材の自動チェック結果
+    text_status: Optional[str] = None  # テキスト抽出: "pending", "done", "unsupported", "too_large", "failed"
+    content_sha256: Optional[str] = None  # 抽出結果（attachment_texts）のキー
 
 class ChecklistItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -134,9 +340,12 @@ class ChecklistItem(BaseModel):
     value: Optional[str] = None  # 入力値
     notes: Optional[str] = None
     files: List[FileAttachment] = []  # 添付ファイル
+    validation: Optional[ChecklistValidation] = None  # 素材の自動チェック結果（対象の項目のみ）
     order: int = 0  # 表示順序
     is_default: bool = False  # デフォルトチェックリストかどうか
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: Optional[datetime] = None
+    rev: int = 0
 
 class ChecklistItemCreate(BaseModel):
     project_id: str
@@ -147,6 +356,19 @@ class ChecklistItemCreate(BaseModel):
     order: int = 0
     is_default: bool = False
 
+class UploadUrlRequest(BaseModel):
+    filename: str  # 元のファイル名
+    content_type: Optional[str] = None
+
+class UploadCompleteRequest(BaseModel):
+    filename: str  # upload-url で発行された保存用のファイル名
+
+class UploadSessionCreate(BaseModel):
+    filename: str  # 元のファイル名
+    size: int  # ファイル全体のバイト数
+    content_type: Optional[str] = None
+    chunk_size: Optional[int] = None  # 省略時は UPLOAD_CHUNK_SIZE（ストレージの制約に合わせて切り上げる）
+
 class ChecklistItemUpdate(BaseModel):
     status: Optional[str] = None
     value: Optional[str] = None
@@ -161,10 +383,13 @@ class Rejection(BaseModel):
     platform: str  # "iOS", "Android"
     rejection_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     reason: str
+    category: Optional[str] = None  # リジェクト理由の分類（analytics.classify_rejection）
     ai_analysis: Optional[str] = None
     action_plan: Optional[str] = None
     status: str = "open"  # "open", "in_progress", "resolved"
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: Optional[datetime] = None
+    rev: int = 0
 
 class RejectionCreate(BaseModel):
     project_id: str
@@ -176,6 +401,18 @@ class RejectionUpdate(BaseModel):
     action_plan: Optional[str] = None
 
 
+class ProjectSnapshot(BaseModel):
+    """プロジェクト画面の表示に必要なデータ（取得しなかった区分はNone）"""
+    project_id: str
+    revisions: Dict[str, str]  # 区分 → リビジョン（次回の known に指定する）
+    unchanged: List[str] = []  # known のリビジョンから変わっていないため省略した区分
+    project: Optional[Project] = None
+    tasks_by_phase: Optional[List[dict]] = None
+    phases: Optional[List[dict]] = None
+    checklist: Optional[List[ChecklistItem]] = None
+    rejections: Optional[List[Rejection]] = None
+
+
 class AIMessageRequest(BaseModel):
     project_id: str
     message: str
@@ -204,51 +441,339 @@ def deserialize_datetime(doc, fields):
     return doc
 
 async def get_ai_response(message: str, system_message: str = "You are a helpful assistant for app store submission.") -> str:
-    """Get AI response using Emergent LLM Key"""
+    """Get AI response using Emergent LLM Key（同じ内容の同時の呼び出しは1回にまとめる）"""
+    return await llm_calls.do(
+        make_key(LLM_MODEL, system_message, message),
+        lambda: request_ai_response(message, system_message)
+    )
+
+async def request_ai_response(message: str, system_message: str) -> str:
+    start = time.perf_counter()
     try:
         api_key = os.environ.get('EMERGENT_LLM_KEY')
         chat = LlmChat(
             api_key=api_key,
             session_id=str(uuid.uuid4()),
             system_message=system_message
-        ).with_model("openai", "gpt-4o-mini")
+        ).with_model(LLM_PROVIDER, LLM_MODEL)
         
         user_message = UserMessage(text=message)
-        response = await chat.send_message(user_message)
+        with profiling.span(f"llm.{LLM_MODEL}"):
+            response = await chat.send_message(user_message)
         return response
     except Exception as e:
+        metrics.LLM_ERRORS.inc(LLM_MODEL)
         logger.error(f"AI response error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+    finally:
+        metrics.LLM_REQUEST_DURATION.observe(time.perf_counter() - start, LLM_MODEL)
+
+def compile_default_tasks(platform: str) -> list:
+    """デフォルトタスクのテンプレートをTaskモデルで検証し、挿入用のドキュメントに変換（プラットフォームごとに1回）"""
+    if platform not in DEFAULT_TASK_DOCUMENTS:
+        with profiling.span("template.default_tasks"):
+            documents = []
+            for task_template in get_default_tasks_for_platform(platform):
+                task_obj = Task(
+                    project_id="",
+                    title=task_template["title"],
+                    description=task_template["description"],
+                    phase=task_template["phase"],
+                    step_number=task_template["step_number"],
+                    phase_number=task_template["phase_number"],
+                    estimated_days=task_template["estimated_days"],
+                    assigned_to=task_template["assigned_to"],
+                    platform_specific=task_template.get("platform_specific", ""),
+                    priority=task_template["priority"],
+                    order=task_template["order"],
+                    is_default=True,
+                    status="pending",
+                    completed=False
+                )
+                documents.append(serialize_datetime(task_obj.model_dump(exclude={"id", "project_id", "created_at"})))
+        DEFAULT_TASK_DOCUMENTS[platform] = documents
+    return DEFAULT_TASK_DOCUMENTS[platform]
+
+def compile_default_checklist(platform: str) -> list:
+    """デフォルトチェックリストのテンプレートを挿入用のドキュメントに変換（プラットフォームごとに1回）"""
+    if platform not in DEFAULT_CHECKLIST_DOCUMENTS:
+        with profiling.span("template.default_checklist"):
+            documents = []
+            for checklist_template in get_default_checklist_for_platform(platform):
+                checklist_obj = ChecklistItem(
+                    project_id="",
+                    platform=checklist_template["platform"],
+                    category=checklist_template["category"],
+                    item_name=checklist_template["title"],
+                    description=checklist_template["description"],
+                    order=checklist_template["order"],
+                    is_default=True,
+                    status="incomplete"
+                )
+                documents.append(serialize_datetime(checklist_obj.model_dump(exclude={"id", "project_id", "created_at"})))
+        DEFAULT_CHECKLIST_DOCUMENTS[platform] = documents
+    return DEFAULT_CHECKLIST_DOCUMENTS[platform]
+
+def compile_phases():
+    global PHASES, PHASES_BODY, PHASES_ETAG
+    PHASES = get_phases_summary()
+    PHASES_BODY = json.dumps({"phases": PHASES}, ensure_ascii=False).encode("utf-8")
+    PHASES_ETAG = f'"{hashlib.sha1(PHASES_BODY).hexdigest()[:16]}"'
+
+def instantiate(templates: list, project_id: str) -> list:
+    """テンプレートドキュメントからプロジェクト用のドキュメントを作成"""
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {**template, "id": str(uuid.uuid4()), "project_id": project_id, "created_at": now}
+        for template in templates
+    ]
 
 async def generate_default_tasks_for_project(project_id: str, platform: str) -> int:
     """プロジェクトにデフォルトタスクを生成する"""
-    default_tasks = get_default_tasks_for_platform(platform)
-    tasks_created = 0
-    
-    for task_template in default_tasks:
-        task_obj = Task(
-            project_id=project_id,
-            title=task_template["title"],
-            description=task_template["description"],
-            phase=task_template["phase"],
-            step_number=task_template["step_number"],
-            phase_number=task_template["phase_number"],
-            estimated_days=task_template["estimated_days"],
-            assigned_to=task_template["assigned_to"],
-            platform_specific=task_template.get("platform_specific", ""),
-            priority=task_template["priority"],
-            order=task_template["order"],
-            is_default=True,
-            status="pending",
-            completed=False
-        )
-        
-        doc = task_obj.model_dump()
-        doc = serialize_datetime(doc)
-        await db.tasks.insert_one(doc)
-        tasks_created += 1
+    docs = instantiate(compile_default_tasks(platform), project_id)
+    if docs:
+        await db.tasks.insert_many(docs)
     
-    return tasks_created
+    await record_changes(
+        project_id, "tasks", [doc["id"] for doc in docs],
+        project_progress.merge(*(project_progress.task_counts(doc) for doc in docs))
+    )
+    await task_tree.invalidate(db, project_id)
+    return len(docs)
+
+async def store_request_profile(profile: profiling.RequestProfile):
+    """閾値を超えたリクエストのプロファイルをリングバッファ（capped collection）に保存"""
+    try:
+        await db.request_profiles.insert_one(profile.to_document())
+    except Exception as e:
+        logger.error(f"Failed to store request profile: {str(e)}")
+
+async def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """管理用エンドポイントへのアクセスを検証（ADMIN_TOKEN が未設定の場合は管理用エンドポイントを無効にする）"""
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def live(query: dict) -> dict:
+    """論理削除されていないプロジェクトの条件（プロジェクトを読み出すクエリはすべてこれを通す）"""
+    return {**query, "deleted_at": None}
+
+async def exclude_deleted_projects(query: dict) -> dict:
+    """プロジェクトを指定しない一覧から、論理削除されたプロジェクトのデータを除く"""
+    if "project_id" not in query:
+        deleted = await db.projects.distinct("id", {"deleted_at": {"$ne": None}})
+        if deleted:
+            query["project_id"] = {"$nin": deleted}
+    return query
+
+async def touch_project(project_id: str, section: str, inc: Optional[dict] = None) -> Optional[int]:
+    """
+    プロジェクトのリビジョンを進める（ETagの算出に使用。詳細は change_log.touch）
+    
+    Returns:
+        新しいリビジョン（プロジェクトが存在しない場合はNone）
+    """
+    revision = await change_log.touch(db, project_id, section, inc)
+    write_generation.bump()  # バックグラウンドジョブの書き込みも反映する
+    return revision
+
+async def record_changes(project_id: str, section: str, ids: List[str], inc: Optional[dict] = None) -> Optional[int]:
+    """
+    ドキュメントの追加・変更を記録する
+    
+    プロジェクトのリビジョンを進め、変更したドキュメントに rev（そのリビジョン）と updated_at を付ける。
+    """
+    revision = await change_log.record_changes(db, SYNC_COLLECTIONS[section], project_id, section, ids, inc)
+    write_generation.bump()
+    return revision
+
+async def record_deletions(project_id: str, section: str, ids: List[str], inc: Optional[dict] = None) -> Optional[int]:
+    """ドキュメントの削除を記録する（差分同期で削除を伝えるための tombstone を残す）"""
+    revision = await change_log.record_deletions(db, project_id, section, ids, inc)
+    write_generation.bump()
+    return revision
+
+async def touch_memo_projects(changed: Dict[str, List[str]]):
+    for project_id, task_ids in changed.items():
+        await record_changes(project_id, "tasks", task_ids)
+        tasks = await db.tasks.find({"id": {"$in": task_ids}}, {"_id": 0}).to_list(None)
+        await task_tree.replace_tasks(db, project_id, tasks)
+
+# メモの自動保存はプロセス内でまとめ、MEMO_FLUSH_INTERVAL ごとに書き込む
+memo_buffer = MemoBuffer(lambda: db.tasks, on_flushed=touch_memo_projects)
+
+# 同時に実行された同じ読み込み・LLMの呼び出しを1回にまとめる（結果は呼び出し元で共有するため変更しない）
+# プロジェクト単位の読み込みは区分のリビジョンをキーに含め、書き込み後の読み込みが書き込み前の結果を受け取らないようにする
+# （プロジェクトを限定しない一覧はリビジョンの代わりにプロセス内の書き込みの世代を含める）
+write_generation = WriteGeneration()
+tasks_by_phase_reads = SingleFlight("tasks_by_phase")
+task_list_reads = SingleFlight("tasks")
+project_list_reads = SingleFlight("projects")
+checklist_reads = SingleFlight("checklist")
+rejection_reads = SingleFlight("rejections")
+llm_calls = SingleFlight("llm")
+
+def read_version(revision=None):
+    """集約キーに含める読み込みの版（リビジョンがない場合は書き込みの世代）"""
+    return revision if revision is not None else ["writes", write_generation.value]
+
+def revision_etag(project_id: str, revision: int, request: Request = None) -> str:
+    """リビジョンから弱いETagを作る（クエリ文字列ごとに異なる値にする）"""
+    variant = ""
+    if request is not None and request.url.query:
+        variant = "-" + hashlib.sha1(request.url.query.encode()).hexdigest()[:10]
+    return f'W/"{project_id}-{revision}{variant}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match がETagと一致するか（弱い比較）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def cache_headers(response: Response) -> dict:
+    """check_section_etag などで設定したキャッシュのヘッダー（Responseを直接返す場合に引き継ぐ）"""
+    return {name: response.headers[name] for name in ("ETag", "Cache-Control") if name in response.headers}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+async def rehydrate(project: dict):
+    """
+    読み込み済みのプロジェクトがアーカイブ済みであれば関連データを復元する
+    
+    関連データ（tasks / checklist_items / rejections）を読む・書き換える処理の前に呼ぶ。
+    """
+    if project.get("archived_at"):
+        await project_archive.ensure_hot(db, project["id"])
+        project["archived_at"] = None
+
+async def rehydrate_doc(collection: str, doc_id: str):
+    """
+    IDで書き込むドキュメントがアーカイブ中であれば、プロジェクトの関連データを復元する
+    
+    クライアントはアーカイブ前に読み込んだ一覧のIDで書き込むため、IDで書き換える処理の前に呼ぶ。
+    """
+    if await db[collection].find_one({"id": doc_id}, {"_id": 1}) is not None:
+        return
+    project_id = await project_archive.archived_project_of(db, collection, doc_id)
+    if project_id is not None:
+        await project_archive.ensure_hot(db, project_id)
+
+async def section_project(project_id: str) -> Optional[dict]:
+    """区分のリビジョンとアーカイブの状態（プロジェクトが存在しない場合はNone）"""
+    return await db.projects.find_one(live({"id": project_id}), {"_id": 0, "id": 1, "revisions": 1, "archived_at": 1})
+
+def section_revision(project: dict, section: str) -> int:
+    return (project.get("revisions") or {}).get(section, 0)
+
+def section_token(project_id: str, section: str, revision: int) -> str:
+    """区分の内容を表す値（タスクは書き込み待ちのメモも含める）"""
+    if section == "tasks" and memo_buffer.pending_marker(project_id):
+        return f"{revision}.{memo_buffer.pending_marker(project_id)}"
+    return str(revision)
+
+async def check_section_etag(request: Request, response: Response, project_id: str, section: str, project: Optional[dict] = None):
+    """
+    プロジェクト単位の一覧のETagを確認する
+    
+    アーカイブ済みの関連データは304を返す場合も復元する（クライアントはキャッシュした一覧のIDで書き込むため）。
+    
+    Args:
+        project: section_project() で読み込み済みのプロジェクト（省略時は読み込む）
+    
+    Returns:
+        (etag, 304レスポンス or None)。プロジェクトが存在しない場合はETagもNone
+    """
+    if project is None:
+        project = await section_project(project_id)
+        if project is None:
+            return None, None
+    await rehydrate(project)
+    revision = section_revision(project, section)
+    etag = revision_etag(f"{project_id}-{section}", section_token(project_id, section, revision), request)
+    if is_not_modified(request, etag):
+        return etag, not_modified_response(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return etag, None
+
+def split_param(value: Optional[str]) -> List[str]:
+    """カンマ区切りのクエリパラメータを分割"""
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+def parse_sort(sort: Optional[str], allowed: set) -> list:
+    """
+    sortパラメータをMongoのソート指定に変換
+    
+    例: "-publish_date,name" → [("publish_date", -1), ("name", 1)]
+    """
+    keys = []
+    for key in split_param(sort):
+        direction = DESCENDING if key.startswith("-") else ASCENDING
+        field = key.lstrip("+-")
+        if field not in allowed:
+            raise HTTPException(status_code=400, detail=f"Cannot sort by '{field}'. Allowed: {', '.join(sorted(allowed))}")
+        keys.append((field, direction))
+    return keys
+
+def parse_fields(fields: Optional[str], model) -> Optional[dict]:
+    """fieldsパラメータをMongoのプロジェクションに変換（idは常に含める）"""
+    names = split_param(fields)
+    if not names:
+        return None
+    unknown = [name for name in names if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    projection = {"_id": 0, "id": 1}
+    projection.update({name: 1 for name in names})
+    return projection
+
+def date_range(start: Optional[datetime], end: Optional[datetime]) -> Optional[dict]:
+    """ISO文字列で保存された日時フィールドの範囲条件（UTCに揃えて比較）"""
+    condition = {}
+    for operator, value in (("$gte", start), ("$lte", end)):
+        if value is not None:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            condition[operator] = value.astimezone(timezone.utc).isoformat()
+    return condition or None
+
+async def ensure_indexes():
+    """一覧・絞り込み・スケジュール集計で使用するインデックスを作成"""
+    await db.projects.create_index("id", unique=True)
+    await db.projects.create_index([("status", ASCENDING), ("publish_date", ASCENDING)])
+    await db.projects.create_index([("platform", ASCENDING), ("publish_date", ASCENDING)])
+    await db.projects.create_index("deleted_at")
+    await db.projects.create_index([("archived_at", ASCENDING), ("updated_at", ASCENDING)])
+    await db[project_archive.ARCHIVES].create_index([("archive_id", ASCENDING), ("collection", ASCENDING), ("seq", ASCENDING)])
+    await db[project_archive.ARCHIVES].create_index("project_id")
+    await db[project_archive.ARCHIVES].create_index("filenames")  # アーカイブ中の添付ファイルの参照確認
+    await db[project_archive.ARCHIVES].create_index("ids")  # IDで書き込まれたアーカイブ中のドキュメントの復元
+    await db.tasks.create_index("id", unique=True)
+    await db.tasks.create_index([("project_id", ASCENDING), ("phase_number", ASCENDING), ("order", ASCENDING)])
+    await db.tasks.create_index([("project_id", ASCENDING), ("completed", ASCENDING), ("due_date", ASCENDING)])
+    await db.tasks.create_index([("completed", ASCENDING), ("due_date", ASCENDING)])
+    await work_queue.ensure_indexes(db)  # 担当者・期限別の待ち行列（GET /queue）
+    await db.checklist_items.create_index("id", unique=True)
+    await db.checklist_items.create_index([("project_id", ASCENDING), ("platform", ASCENDING)])
+    await db.checklist_items.create_index("files.filename")  # 共有している添付ファイルの参照確認
+    await db.checklist_items.create_index("files.text_status")  # テキスト抽出の待ち行列
+    await db.rejections.create_index("id", unique=True)
+    await db.rejections.create_index([("project_id", ASCENDING), ("status", ASCENDING)])
+    await db.pending_uploads.create_index("expires_at", expireAfterSeconds=0)
+    # 分割アップロード（期限切れはストレージ側の後始末が必要なため、TTLインデックスではなくジョブで破棄する）
+    await db[upload_sessions.SESSIONS].create_index("id", unique=True)
+    await db[upload_sessions.SESSIONS].create_index("expires_at")
+    await db.upload_issues.create_index([("kind", ASCENDING), ("detected_at", DESCENDING)])
+    # 差分同期（GET /projects/{id}/changes）
+    for collection in SYNC_COLLECTIONS.values():
+        await db[collection].create_index([("project_id", ASCENDING), ("rev", ASCENDING)])
+    await db.tombstones.create_index([("project_id", ASCENDING), ("rev", ASCENDING)])
+    await db.tombstones.create_index("deleted_at", expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 86400)
 
 
 # ========== Project Endpoints ==========
@@ -258,10 +783,15 @@ async def root():
     return {"message": "nativarrry (ネイティバリー) API - Native App Submission Support"}
 
 @api_router.get("/phases")
-async def get_phases():
-    """フェーズ一覧を取得"""
-    phases = get_phases_summary()
-    return {"phases": phases}
+async def get_phases(request: Request):
+    """フェーズ一覧を取得（テンプレートから生成される静的な内容のため長期キャッシュ可能）"""
+    if PHASES_BODY is None:
+        compile_phases()
+    
+    headers = {"ETag": PHASES_ETAG, "Cache-Control": f"public, max-age={PHASES_MAX_AGE}"}
+    if is_not_modified(request, PHASES_ETAG):
+        return Response(status_code=304, headers=headers)
+    return Response(content=PHASES_BODY, media_type="application/json", headers=headers)
 
 @api_router.post("/projects", response_model=Project)
 async def create_project(input: ProjectCreate):
@@ -273,32 +803,204 @@ async def create_project(input: ProjectCreate):
     doc = serialize_datetime(doc)
     
     await db.projects.insert_one(doc)
+    await analytics.record_project_created(db, project_obj.platform)
     
     # デフォルトタスクの自動生成
     if auto_generate_tasks:
         await generate_default_tasks_for_project(project_obj.id, project_obj.platform)
+        # タスク生成で更新された進捗・リビジョンを返すため読み直す
+        project = await db.projects.find_one({"id": project_obj.id}, {"_id": 0})
+        deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+        return project
     
     return project_obj
 
 @api_router.get("/projects", response_model=List[Project])
-async def get_projects():
-    projects = await db.projects.find({}, {"_id": 0}).to_list(1000)
-    
-    for project in projects:
-        deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+async def get_projects(
+    status: Optional[str] = None,
+    platform: Optional[str] = None,
+    publish_from: Optional[datetime] = None,
+    publish_to: Optional[datetime] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    プロジェクト一覧
+    
+    status / platform はカンマ区切りで複数指定可能。
+    sort は "-publish_date,name" の形式、fields を指定した場合は指定フィールドとidのみを返す。
+    """
+    query = live({})
+    if split_param(status):
+        query["status"] = {"$in": split_param(status)}
+    if split_param(platform):
+        query["platform"] = {"$in": split_param(platform)}
+    publish_range = date_range(publish_from, publish_to)
+    if publish_range:
+        query["publish_date"] = publish_range
+    
+    sort_keys = parse_sort(sort, PROJECT_SORT_FIELDS)
+    projection = parse_fields(fields, Project)
+    
+    async def read():
+        cursor = db.projects.find(query, projection or {"_id": 0})
+        if sort_keys:
+            cursor = cursor.sort(sort_keys)
+        projects = await cursor.to_list(1000)
+        if not projection:
+            for project in projects:
+                deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+        return projects
+    
+    projects = await project_list_reads.do(make_key(read_version(), query, projection, sort_keys), read)
+    
+    # 部分的なドキュメントはモデルで検証できないため、保存形式のまま返す
+    if projection:
+        return JSONResponse(content=projects)
     
     return projects
 
 @api_router.get("/projects/{project_id}", response_model=Project)
-async def get_project(project_id: str):
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+async def get_project(project_id: str, request: Request, response: Response):
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
     
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    etag = revision_etag(project_id, project.get("revision", 0))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    
     deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
     return project
 
+@api_router.get("/projects/{project_id}/snapshot", response_model=ProjectSnapshot)
+async def get_project_snapshot(
+    project_id: str,
+    request: Request,
+    response: Response,
+    include: Optional[str] = None,
+    known: Optional[str] = None
+):
+    """
+    プロジェクト・フェーズ別タスク・フェーズ・チェックリスト・リジェクトを1回のリクエストで取得
+    
+    include で取得する区分をカンマ区切りで指定する（省略時はすべて）。
+    known に前回の revisions を "tasks:12,checklist:5" の形式で指定すると、変わっていない区分は省略して unchanged に含める。
+    区分ごとの読み込みはサーバー側で並行して行う。
+    """
+    sections = split_param(include) or SNAPSHOT_SECTIONS
+    invalid = [section for section in sections if section not in SNAPSHOT_SECTIONS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown section '{invalid[0]}'. Allowed: {', '.join(SNAPSHOT_SECTIONS)}"
+        )
+    
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    if PHASES is None:
+        compile_phases()
+    section_revisions = project.get("revisions") or {}
+    revisions = {
+        "project": str(project.get("revision", 0)),
+        "tasks": section_token(project_id, "tasks", section_revisions.get("tasks", 0)),
+        "phases": PHASES_ETAG.strip('"'),
+        "checklist": section_token(project_id, "checklist", section_revisions.get("checklist", 0)),
+        "rejections": section_token(project_id, "rejections", section_revisions.get("rejections", 0)),
+    }
+    revisions = {section: revisions[section] for section in sections}
+    
+    # 304・known で省略する場合も、クライアントがIDで書き込めるよう関連データを復元する
+    if set(sections) & {"tasks", "checklist", "rejections"}:
+        await rehydrate(project)
+    
+    etag = revision_etag(f"{project_id}-snapshot", "-".join(revisions.values()), request)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    
+    known_revisions = dict(entry.split(":", 1) for entry in split_param(known) if ":" in entry)
+    unchanged = [section for section in sections if known_revisions.get(section) == revisions[section]]
+    
+    async def load_project():
+        return deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+    
+    async def load_phases():
+        return PHASES
+    
+    loaders = {
+        "project": load_project,
+        "tasks": lambda: load_tasks_by_phase(project_id, section_revisions.get("tasks", 0)),
+        "phases": load_phases,
+        "checklist": lambda: load_checklist_items({"project_id": project_id}, revisions["checklist"]),
+        "rejections": lambda: load_rejections({"project_id": project_id}, revisions["rejections"]),
+    }
+    fetched = [section for section in sections if section not in unchanged]
+    results = await asyncio.gather(*(loaders[section]() for section in fetched))
+    
+    snapshot = {"project_id": project_id, "revisions": revisions, "unchanged": unchanged}
+    for section, result in zip(fetched, results):
+        snapshot["tasks_by_phase" if section == "tasks" else section] = result
+    
+    # リジェクトのAIのテキストは保存時の圧縮のまま返す
+    rejections = snapshot.pop("rejections", None)
+    content = ProjectSnapshot(**snapshot).model_dump(mode="json")
+    if rejections is not None:
+        content["rejections"] = [rejection_json(rejection) for rejection in rejections]
+    return compression.json_response(
+        content, request.headers.get("accept-encoding"), headers=cache_headers(response), min_size=COMPRESSION_MIN_SIZE
+    )
+
+@api_router.get("/projects/{project_id}/changes")
+async def get_project_changes(project_id: str, since: int):
+    """
+    指定したリビジョン以降の変更を取得（差分同期）
+    
+    追加・変更されたタスク・チェックリスト項目・リジェクトと、削除されたもののIDを返す。
+    次回は返された revision を since に指定する。reset が true の場合は全件を読み込み直す
+    （削除の記録は TOMBSTONE_RETENTION_DAYS 日で消えるため、それより古い since は指定しないこと）。
+    """
+    # 先にリビジョンを読み、以降の変更は次回の同期で重複して返す（取りこぼさない）
+    # rev を付け終えていない書き込みがある場合は、次回の since を進めない（change_log.synced_revision）
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    revision = project.get("revision", 0)
+    result = {
+        "project_id": project_id,
+        "since": since,
+        "revision": change_log.synced_revision(project, since),
+        "reset": since < 0 or since > revision
+    }
+    if result["reset"] or since == revision:
+        return {**result, "project": None, **{section: {"upserts": [], "deleted": []} for section in SYNC_COLLECTIONS}}
+    
+    await rehydrate(project)
+    deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+    result["project"] = Project(**project)
+    
+    changed = {"project_id": project_id, "rev": {"$gt": since}}
+    for section, collection in SYNC_COLLECTIONS.items():
+        upserts = await db[collection].find(changed, {"_id": 0}).sort("rev", ASCENDING).to_list(None)
+        if section == "rejections":
+            upserts = [compression.expand_texts(upsert) for upsert in upserts]
+        tombstones = await db.tombstones.find({**changed, "section": section}, {"_id": 0, "id": 1}).to_list(None)
+        result[section] = {
+            "upserts": memo_buffer.overlay(upserts) if section == "tasks" else upserts,
+            "deleted": [tombstone["id"] for tombstone in tombstones]
+        }
+    
+    return result
+
 @api_router.put("/projects/{project_id}", response_model=Project)
 async def update_project(project_id: str, input: ProjectUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
@@ -311,51 +1013,174 @@ async def update_project(project_id: str, input: ProjectUpdate):
     
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
-    result = await db.projects.update_one(
-        {"id": project_id},
-        {"$set": update_data}
+    previous = await db.projects.find_one_and_update(
+        live({"id": project_id}),
+        {"$set": update_data, "$inc": {"revision": 1, "revisions.project": 1}},
+        projection={"_id": 0, "platform": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    if 'platform' in update_data:
+        await analytics.record_project_platform_changed(db, previous.get('platform'), update_data['platform'])
+    
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
     deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
     return project
 
 @api_router.delete("/projects/{project_id}")
 async def delete_project(project_id: str):
-    result = await db.projects.delete_one({"id": project_id})
+    """
+    プロジェクトを論理削除する
+    
+    関連データはすぐには削除せず、PROJECT_RETENTION_DAYS 日が過ぎた後にバックグラウンドで削除する
+    （それまでは POST /projects/{id}/restore で復元できる）。
+    """
+    deleted_at = datetime.now(timezone.utc)
+    project = await db.projects.find_one_and_update(
+        live({"id": project_id}),
+        {"$set": {"deleted_at": deleted_at.isoformat()}, "$inc": {"revision": 1, "revisions.project": 1}},
+        projection={"_id": 0, "platform": 1}
+    )
     
-    if result.deleted_count == 0:
+    if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Also delete related data
-    await db.tasks.delete_many({"project_id": project_id})
-    await db.checklist_items.delete_many({"project_id": project_id})
-    await db.rejections.delete_many({"project_id": project_id})
+    # 論理削除の時点で分析サマリーから差し引く
+    await analytics.record_project_deleted(db, project_id, project.get('platform'))
     
-    return {"message": "Project deleted successfully"}
+    return {
+        "message": "Project deleted successfully",
+        "restorable_until": (deleted_at + timedelta(days=PROJECT_RETENTION_DAYS)).isoformat()
+    }
+
+@api_router.post("/projects/{project_id}/restore", response_model=Project)
+async def restore_project(project_id: str):
+    """論理削除したプロジェクトを復元する（保持期間内のみ）"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=PROJECT_RETENTION_DAYS)).isoformat()
+    project = await db.projects.find_one_and_update(
+        # 保持期間を過ぎたものはガベージコレクションの対象になるため復元しない
+        {"id": project_id, "deleted_at": {"$ne": None, "$gte": cutoff}},
+        {"$set": {"deleted_at": None}, "$inc": {"revision": 1, "revisions.project": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="Deleted project not found or no longer restorable")
+    
+    await analytics.record_project_restored(db, project_id, project.get('platform'))
+    
+    deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
+    return project
 
 @api_router.post("/projects/{project_id}/generate-default-tasks")
 async def generate_default_tasks(project_id: str):
     """既存プロジェクトにデフォルトタスクを生成"""
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
     
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    await rehydrate(project)
     
     # 既存のデフォルトタスクを削除
+    removed = await db.tasks.find({"project_id": project_id, "is_default": True}, {"_id": 0, "id": 1}).to_list(None)
     await db.tasks.delete_many({"project_id": project_id, "is_default": True})
+    await record_deletions(project_id, "tasks", [task["id"] for task in removed])
     
     # 新しいデフォルトタスクを生成
     tasks_created = await generate_default_tasks_for_project(project_id, project["platform"])
+    await project_progress.recompute_progress(db, [project_id])
     
     return {
         "message": "デフォルトタスクを生成しました",
         "tasks_created": tasks_created
     }
 
+@api_router.post("/projects/{project_id}/clone")
+async def clone_project(project_id: str, input: ProjectCloneRequest):
+    """プロジェクトをテンプレートとして複製（複数プロジェクトを一括作成）"""
+    source = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
+    
+    if not source:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await rehydrate(source)
+    
+    names = [name.strip() for name in input.names if name and name.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="At least one project name is required")
+    if len(names) > MAX_CLONE_COUNT:
+        raise HTTPException(status_code=400, detail=f"Cannot clone more than {MAX_CLONE_COUNT} projects at once")
+    
+    source_tasks = []
+    if input.include_tasks:
+        source_tasks = memo_buffer.overlay(await db.tasks.find({"project_id": project_id}, {"_id": 0}).to_list(1000))
+    
+    source_items = []
+    if input.include_checklist:
+        source_items = await db.checklist_items.find({"project_id": project_id}, {"_id": 0}).to_list(1000)
+    
+    now = datetime.now(timezone.utc).isoformat()
+    projects = []
+    project_docs = []
+    task_docs = []
+    item_docs = []
+    
+    for name in names:
+        clone_tasks = []
+        clone_items = []
+        project_obj = Project(
+            name=name,
+            platform=source["platform"],
+            description=input.description if input.description is not None else source.get("description"),
+            start_date=input.start_date or source.get("start_date"),
+            publish_date=input.publish_date or source.get("publish_date")
+        )
+        
+        # タスクのコピー（IDとproject_idを振り直す）
+        for task in source_tasks:
+            doc = {**task, "id": str(uuid.uuid4()), "project_id": project_obj.id, "created_at": now, "updated_at": now, "rev": 0}
+            if input.reset_progress:
+                doc.update({"completed": False, "completed_at": None, "status": "pending"})
+            clone_tasks.append(doc)
+        
+        # チェックリスト項目のコピー（入力値・メモはそのまま引き継ぐ）
+        for item in source_items:
+            doc = {**item, "id": str(uuid.uuid4()), "project_id": project_obj.id, "created_at": now, "updated_at": now, "rev": 0}
+            if input.include_attachments:
+                # 添付ファイルの実体は複製元と共有する（削除は project_gc.release_files で参照がなくなったときのみ）
+                doc["files"] = [dict(f) for f in item.get("files", [])]
+            else:
+                doc["files"] = []
+                if item.get("files"):
+                    # 添付ファイルで完了していた項目は、ファイルを外した状態に戻す
+                    doc.update({"status": "incomplete", "validation": None})
+            clone_items.append(doc)
+        
+        project_obj.progress = ProjectProgress(**project_progress.build_progress(clone_tasks, clone_items, []))
+        projects.append(project_obj)
+        project_docs.append(serialize_datetime(project_obj.model_dump()))
+        task_docs.extend(clone_tasks)
+        item_docs.extend(clone_items)
+    
+    # コレクションごとに一括挿入
+    await db.projects.insert_many(project_docs)
+    for project_obj in projects:
+        await analytics.record_project_created(db, project_obj.platform)
+    if task_docs:
+        await db.tasks.insert_many(task_docs)
+    if item_docs:
+        await db.checklist_items.insert_many(item_docs)
+    
+    return {
+        "message": f"{len(projects)}件のプロジェクトを複製しました",
+        "source_project_id": project_id,
+        "projects": projects,
+        "tasks_created": len(task_docs),
+        "checklist_items_created": len(item_docs)
+    }
+
 @api_router.patch("/projects/{project_id}/schedule")
 async def update_project_schedule(project_id: str, start_date: Optional[datetime] = None, publish_date: Optional[datetime] = None):
     """プロジェクトのスケジュールを更新"""
@@ -369,53 +1194,122 @@ async def update_project_schedule(project_id: str, start_date: Optional[datetime
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
     result = await db.projects.update_one(
-        {"id": project_id},
-        {"$set": update_data}
+        live({"id": project_id}),
+        {"$set": update_data, "$inc": {"revision": 1, "revisions.project": 1}}
     )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
     deserialize_datetime(project, ['created_at', 'updated_at', 'start_date', 'publish_date'])
     return project
 
 @api_router.get("/projects/{project_id}/tasks")
-async def get_project_tasks_by_phase(project_id: str, phase_number: Optional[int] = None, completed: Optional[str] = "all"):
-    """プロジェクトのタスク一覧をフェーズ別に取得"""
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
-    
-    if not project:
+async def get_project_tasks_by_phase(
+    project_id: str,
+    request: Request,
+    response: Response,
+    phase_number: Optional[int] = None,
+    completed: Optional[str] = "all"
+):
+    """
+    プロジェクトのタスク一覧をフェーズ別に取得
+    
+    フェーズ別のツリー（task_trees）を1回の読み込みで取得する。tasks の変更に追いついていない場合は作り直す。
+    """
+    project = await section_project(project_id)
+    if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # クエリ構築
-    query = {"project_id": project_id}
-    if phase_number is not None:
-        query["phase_number"] = phase_number
-    if completed != "all":
-        query["completed"] = completed == "true"
-    
-    # タスクを取得
-    tasks = await db.tasks.find(query, {"_id": 0}).sort([("phase_number", 1), ("order", 1)]).to_list(1000)
-    
-    for task in tasks:
-        deserialize_datetime(task, ['created_at', 'due_date', 'completed_at'])
-    
-    # フェーズごとにグループ化
-    tasks_by_phase = {}
-    for task in tasks:
-        phase_num = task.get('phase_number', 0)
-        if phase_num not in tasks_by_phase:
-            tasks_by_phase[phase_num] = {
-                "phase_number": phase_num,
-                "phase_name": task.get('phase', 'Unknown'),
-                "tasks": []
-            }
-        tasks_by_phase[phase_num]["tasks"].append(task)
+    etag, not_modified = await check_section_etag(request, response, project_id, "tasks", project)
+    if not_modified:
+        return not_modified
     
     return {
         "project_id": project_id,
-        "tasks_by_phase": list(tasks_by_phase.values())
+        "tasks_by_phase": await load_tasks_by_phase(project_id, section_revision(project, "tasks"), phase_number, completed)
+    }
+
+async def load_tasks_by_phase(project_id: str, revision: int, phase_number: Optional[int] = None, completed: str = "all") -> list:
+    """フェーズ別のタスク一覧（タスクのないフェーズは含めない）"""
+    return await tasks_by_phase_reads.do(
+        make_key(project_id, section_token(project_id, "tasks", revision), phase_number, completed),
+        lambda: build_tasks_by_phase(project_id, revision, phase_number, completed)
+    )
+
+async def build_tasks_by_phase(project_id: str, revision: int, phase_number: Optional[int], completed: str) -> list:
+    phases = await task_tree.load(db, project_id, revision)
+    if phases is None:
+        phases = await task_tree.rebuild(db, project_id, revision)
+    
+    tasks_by_phase = []
+    for phase in phases:
+        if phase_number is not None and phase["phase_number"] != phase_number:
+            continue
+        tasks = phase["tasks"]
+        if completed != "all":
+            tasks = [task for task in tasks if task.get("completed") == (completed == "true")]
+        if not tasks:
+            continue
+        
+        memo_buffer.overlay(tasks)
+        for task in tasks:
+            deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
+        tasks_by_phase.append({
+            "phase_number": phase["phase_number"],
+            "phase_name": tasks[0].get('phase', 'Unknown'),
+            "tasks": tasks
+        })
+    return tasks_by_phase
+
+
+# ========== Schedule Endpoints ==========
+
+# スケジュール算出に必要なタスクのフィールド
+SCHEDULE_TASK_PROJECTION = {
+    "_id": 0, "id": 1, "project_id": 1, "title": 1, "step_number": 1,
+    "phase_number": 1, "order": 1, "estimated_days": 1, "completed": 1
+}
+
+@api_router.get("/projects/{project_id}/schedule")
+async def get_project_schedule(project_id: str):
+    """所要日数と完了状態からプロジェクトのタスクごとの予定日を算出"""
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await rehydrate(project)
+    
+    tasks = await db.tasks.find({"project_id": project_id}, SCHEDULE_TASK_PROJECTION).to_list(1000)
+    
+    return compute_schedules([project], tasks)[project_id]
+
+@api_router.get("/schedule/at-risk")
+async def get_at_risk_projects(include_on_track: bool = False):
+    """公開日（目標）に間に合わない可能性があるプロジェクトの一覧"""
+    projects = await db.projects.find(
+        # アーカイブ済みのプロジェクトは長期間更新がないため対象外
+        live({"status": {"$ne": "approved"}, "publish_date": {"$ne": None}, "archived_at": None}),
+        {"_id": 0, "id": 1, "name": 1, "platform": 1, "status": 1, "start_date": 1, "publish_date": 1}
+    ).to_list(None)
+    
+    # 完了済みタスクは残り日数に影響しないため未完了のタスクのみ取得
+    tasks = await db.tasks.find(
+        {"project_id": {"$in": [project["id"] for project in projects]}, "completed": False},
+        SCHEDULE_TASK_PROJECTION
+    ).to_list(None)
+    
+    schedules = compute_schedules(projects, tasks, include_tasks=False)
+    results = [
+        schedule for schedule in schedules.values()
+        if include_on_track or schedule["risk"] in ("late", "at_risk")
+    ]
+    results.sort(key=lambda schedule: schedule["slack_days"])
+    
+    return {
+        "projects": results,
+        "generated_at": datetime.now(timezone.utc).isoformat()
     }
 
 
@@ -428,20 +1322,118 @@ async def create_task(input: TaskCreate):
     
     doc = task_obj.model_dump()
     doc = serialize_datetime(doc)
+    if task_obj.due_date:
+        doc["due_at"] = work_queue.due_at(task_obj.due_date)
     
     await db.tasks.insert_one(doc)
+    task_obj.rev = await record_changes(task_obj.project_id, "tasks", [task_obj.id], project_progress.task_counts(doc)) or 0
+    
+    # record_changes で付けた rev・updated_at を含めてツリーに追加する
+    stored = await db.tasks.find_one({"id": task_obj.id}, {"_id": 0})
+    if stored is not None:
+        await task_tree.add_task(db, stored)
     return task_obj
 
 @api_router.get("/tasks", response_model=List[Task])
-async def get_tasks(project_id: Optional[str] = None):
-    query = {"project_id": project_id} if project_id else {}
-    tasks = await db.tasks.find(query, {"_id": 0}).to_list(1000)
+async def get_tasks(
+    request: Request,
+    response: Response,
+    project_id: Optional[str] = None,
+    phase_number: Optional[int] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    completed: Optional[bool] = None,
+    assigned_to: Optional[str] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    タスク一覧
+    
+    status / priority はカンマ区切りで複数指定可能。
+    sort は "phase_number,order" の形式、fields を指定した場合は指定フィールドとidのみを返す。
+    """
+    etag = None
+    if project_id:
+        etag, not_modified = await check_section_etag(request, response, project_id, "tasks")
+        if etag is None:
+            return []  # 存在しない・論理削除されたプロジェクト
+        if not_modified:
+            return not_modified
     
-    for task in tasks:
-        deserialize_datetime(task, ['created_at', 'due_date', 'completed_at'])
+    query = await exclude_deleted_projects({"project_id": project_id} if project_id else {})
+    if phase_number is not None:
+        query["phase_number"] = phase_number
+    if split_param(status):
+        query["status"] = {"$in": split_param(status)}
+    if split_param(priority):
+        query["priority"] = {"$in": split_param(priority)}
+    if completed is not None:
+        query["completed"] = completed
+    if assigned_to:
+        query["assigned_to"] = assigned_to
+    due_range = date_range(due_from, due_to)
+    if due_range:
+        query["due_date"] = due_range
+    
+    sort_keys = parse_sort(sort, TASK_SORT_FIELDS)
+    projection = parse_fields(fields, Task)
+    
+    async def read():
+        cursor = db.tasks.find(query, projection or {"_id": 0})
+        if sort_keys:
+            cursor = cursor.sort(sort_keys)
+        tasks = memo_buffer.overlay(await cursor.to_list(1000))
+        if not projection:
+            for task in tasks:
+                deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
+        return tasks
+    
+    # ETag は区分のリビジョン（書き込み待ちのメモを含む）から作るため、キーに含める
+    tasks = await task_list_reads.do(make_key(read_version(etag), query, projection, sort_keys), read)
+    
+    if projection:
+        return JSONResponse(content=tasks, headers={"ETag": etag, "Cache-Control": "no-cache"} if etag else None)
     
     return tasks
 
+@api_router.get("/queue", response_model=WorkQueue)
+async def get_work_queue(
+    assigned_to: Optional[str] = None,
+    due_before: Optional[datetime] = None,
+    priority: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """
+    プロジェクト横断の未完了タスクの待ち行列（期限の近い順）
+    
+    assigned_to で担当者、due_before で期限（これより前。期限切れのタスクを含む）を絞り込む。
+    priority はカンマ区切りで複数指定可能。期限のないタスクは含めない。
+    次のページは返された next_cursor を cursor に指定して取得する。
+    """
+    excluded = await exclude_deleted_projects({})
+    try:
+        queue = await work_queue.load(
+            db,
+            assigned_to=assigned_to,
+            due_before=due_before,
+            priorities=split_param(priority),
+            cursor=cursor,
+            limit=max(1, min(limit, work_queue.MAX_LIMIT)),
+            excluded_projects=excluded.get("project_id", {}).get("$nin")
+        )
+    except work_queue.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    for group in queue["projects"]:
+        memo_buffer.overlay(group["tasks"])
+        for task in group["tasks"]:
+            deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
+    return queue
+
 @api_router.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, input: TaskUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
@@ -452,27 +1444,55 @@ async def update_task(task_id: str, input: TaskUpdate):
     
     # Serialize datetime fields
     if 'due_date' in update_data and update_data['due_date']:
+        update_data['due_at'] = work_queue.due_at(update_data['due_date'])
         update_data['due_date'] = update_data['due_date'].isoformat()
     
-    result = await db.tasks.update_one(
-        {"id": task_id},
-        {"$set": update_data}
-    )
+    await rehydrate_doc("tasks", task_id)
     
-    if result.matched_count == 0:
+    # メモは自動保存と同じくバッファ経由で書き込み、バージョンを割り当てる
+    if 'memo' in update_data:
+        if await memo_buffer.update(task_id, memo=update_data.pop('memo')) is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        await memo_buffer.flush(task_id)
+    
+    # 変更前のドキュメントとの差分で進捗カウンターを更新（メモのみの場合は読み出すだけ）
+    projection = {"_id": 0, "project_id": 1, "phase_number": 1, "completed": 1}
+    if update_data:
+        previous = await db.tasks.find_one_and_update({"id": task_id}, {"$set": update_data}, projection=projection)
+    else:
+        previous = await db.tasks.find_one({"id": task_id}, projection)
+    
+    if previous is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    await record_changes(
+        previous["project_id"], "tasks", [task_id],
+        project_progress.changes(previous, {**previous, **update_data}, project_progress.task_counts)
+    )
+    
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    deserialize_datetime(task, ['created_at', 'due_date', 'completed_at'])
+    if 'phase' in update_data:
+        await task_tree.invalidate(db, previous["project_id"])  # フェーズ名はツリーのグループにも使われる
+    else:
+        await task_tree.replace_tasks(db, previous["project_id"], [task])
+    deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
     return task
 
 @api_router.delete("/tasks/{task_id}")
 async def delete_task(task_id: str):
-    result = await db.tasks.delete_one({"id": task_id})
+    await rehydrate_doc("tasks", task_id)
+    task = await db.tasks.find_one_and_delete(
+        {"id": task_id},
+        projection={"_id": 0, "project_id": 1, "phase_number": 1, "completed": 1}
+    )
     
-    if result.deleted_count == 0:
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    memo_buffer.discard(task_id)
+    await record_deletions(task["project_id"], "tasks", [task_id], project_progress.task_counts(task, -1))
+    await task_tree.remove_task(db, task["project_id"], {"id": task_id, **task})
+    
     return {"message": "Task deleted successfully"}
 
 @api_router.patch("/tasks/{task_id}/complete")
@@ -487,33 +1507,70 @@ async def toggle_task_completion(task_id: str, completed: bool):
         update_data["completed_at"] = None
         update_data["status"] = "pending"
     
-    result = await db.tasks.update_one(
+    await rehydrate_doc("tasks", task_id)
+    previous = await db.tasks.find_one_and_update(
         {"id": task_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"_id": 0, "project_id": 1, "phase_number": 1, "completed": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    await record_changes(
+        previous["project_id"], "tasks", [task_id],
+        project_progress.changes(previous, {**previous, **update_data}, project_progress.task_counts)
+    )
+    
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    deserialize_datetime(task, ['created_at', 'due_date', 'completed_at'])
+    await task_tree.replace_tasks(db, previous["project_id"], [task])
+    memo_buffer.overlay([task])
+    deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
     return task
 
 @api_router.patch("/tasks/{task_id}/memo")
 async def update_task_memo(task_id: str, memo: str):
-    """タスクのメモを更新"""
-    result = await db.tasks.update_one(
-        {"id": task_id},
-        {"$set": {"memo": memo}}
-    )
-    
-    if result.matched_count == 0:
+    """タスクのメモを更新（クエリ文字列で全文を送る旧形式。即座に書き込む）"""
+    await rehydrate_doc("tasks", task_id)
+    if await memo_buffer.update(task_id, memo=memo) is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    await memo_buffer.flush(task_id)
     
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    deserialize_datetime(task, ['created_at', 'due_date', 'completed_at'])
+    deserialize_datetime(task, ['created_at', 'updated_at', 'due_date', 'completed_at'])
     return task
 
+@api_router.put("/tasks/{task_id}/memo")
+async def save_task_memo(task_id: str, input: TaskMemoUpdate):
+    """
+    タスクのメモを自動保存する
+    
+    短時間に続く更新はサーバー側でまとめて書き込む（最後の値が優先）。
+    差分を送る場合は base_version が現在のバージョンと一致しなければ409を返すので、全文を送り直す。
+    """
+    if input.memo is None and not input.patches:
+        raise HTTPException(status_code=400, detail="Either memo or patches is required")
+    if input.patches and input.base_version is None:
+        raise HTTPException(status_code=400, detail="base_version is required when sending patches")
+    
+    await rehydrate_doc("tasks", task_id)
+    try:
+        version = await memo_buffer.update(
+            task_id,
+            memo=input.memo,
+            patches=[patch.model_dump() for patch in input.patches or []],
+            base_version=input.base_version
+        )
+    except MemoConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Memo version mismatch", "memo_version": e.version})
+    except InvalidMemoPatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if version is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    return {"memo_version": version}
+
 
 # ========== Checklist Endpoints ==========
 
@@ -526,127 +1583,406 @@ async def create_checklist_item(input: ChecklistItemCreate):
     doc = serialize_datetime(doc)
     
     await db.checklist_items.insert_one(doc)
+    item_obj.rev = await record_changes(item_obj.project_id, "checklist", [item_obj.id], project_progress.checklist_counts(doc)) or 0
     return item_obj
 
 @api_router.get("/checklist", response_model=List[ChecklistItem])
-async def get_checklist_items(project_id: Optional[str] = None, platform: Optional[str] = None):
+async def get_checklist_items(
+    request: Request,
+    response: Response,
+    project_id: Optional[str] = None,
+    platform: Optional[str] = None
+):
     query = {}
     if project_id:
+        etag, not_modified = await check_section_etag(request, response, project_id, "checklist")
+        if etag is None:
+            return []  # 存在しない・論理削除されたプロジェクト
+        if not_modified:
+            return not_modified
         query["project_id"] = project_id
     if platform:
         query["platform"] = platform
+    await exclude_deleted_projects(query)
     
-    items = await db.checklist_items.find(query, {"_id": 0}).to_list(1000)
-    
-    for item in items:
-        deserialize_datetime(item, ['created_at'])
+    return await load_checklist_items(query, etag if project_id else None)
+
+async def load_checklist_items(query: dict, revision: Optional[str] = None) -> list:
+    """チェックリスト項目を読み込む（revision は区分のリビジョン）"""
+    async def read():
+        items = await db.checklist_items.find(query, {"_id": 0}).to_list(1000)
+        
+        for item in items:
+            deserialize_datetime(item, ['created_at', 'updated_at'])
+        
+        return items
     
-    return items
+    return await checklist_reads.do(make_key(query, read_version(revision)), read)
 
 @api_router.put("/checklist/{item_id}", response_model=ChecklistItem)
 async def update_checklist_item(item_id: str, input: ChecklistItemUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
     
-    result = await db.checklist_items.update_one(
+    await rehydrate_doc("checklist_items", item_id)
+    previous = await db.checklist_items.find_one_and_update(
         {"id": item_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"_id": 0, "project_id": 1, "platform": 1, "status": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Checklist item not found")
     
+    await record_changes(
+        previous["project_id"], "checklist", [item_id],
+        project_progress.changes(previous, {**previous, **update_data}, project_progress.checklist_counts)
+    )
+    
     item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0})
-    deserialize_datetime(item, ['created_at'])
+    deserialize_datetime(item, ['created_at', 'updated_at'])
     return item
 
 @api_router.delete("/checklist/{item_id}")
 async def delete_checklist_item(item_id: str):
-    result = await db.checklist_items.delete_one({"id": item_id})
+    await rehydrate_doc("checklist_items", item_id)
+    item = await db.checklist_items.find_one_and_delete(
+        {"id": item_id},
+        projection={"_id": 0, "project_id": 1, "platform": 1, "status": 1, "files.filename": 1}
+    )
     
-    if result.deleted_count == 0:
+    if item is None:
         raise HTTPException(status_code=404, detail="Checklist item not found")
     
+    await record_deletions(item["project_id"], "checklist", [item_id], project_progress.checklist_counts(item, -1))
+    await project_gc.release_files(db, storage, [f["filename"] for f in item.get("files", [])])
+    
     return {"message": "Checklist item deleted successfully"}
 
 @api_router.post("/projects/{project_id}/generate-default-checklist")
 async def generate_default_checklist(project_id: str):
     """既存プロジェクトにデフォルトチェックリストを生成"""
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0})
     
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    await rehydrate(project)
     
     # 既存のデフォルトチェックリストを削除
+    removed = await db.checklist_items.find({"project_id": project_id, "is_default": True}, {"_id": 0, "id": 1}).to_list(None)
     await db.checklist_items.delete_many({"project_id": project_id, "is_default": True})
+    await record_deletions(project_id, "checklist", [item["id"] for item in removed])
     
     # 新しいデフォルトチェックリストを生成
-    default_checklist = get_default_checklist_for_platform(project["platform"])
-    items_created = 0
-    
-    for checklist_template in default_checklist:
-        checklist_obj = ChecklistItem(
-            project_id=project_id,
-            platform=checklist_template["platform"],
-            category=checklist_template["category"],
-            item_name=checklist_template["title"],
-            description=checklist_template["description"],
-            order=checklist_template["order"],
-            is_default=True,
-            status="incomplete"
-        )
-        
-        doc = checklist_obj.model_dump()
-        doc = serialize_datetime(doc)
-        await db.checklist_items.insert_one(doc)
-        items_created += 1
+    docs = instantiate(compile_default_checklist(project["platform"]), project_id)
+    if docs:
+        await db.checklist_items.insert_many(docs)
+    items_created = len(docs)
+    
+    # 既存項目の削除を含むため、チェックリストの件数は元データから再計算する
+    await project_progress.recompute_progress(db, [project_id])
+    await record_changes(project_id, "checklist", [doc["id"] for doc in docs])
     
     return {
         "message": "デフォルトチェックリストを生成しました",
         "items_created": items_created
     }
 
+asset_inspector = asset_validation.AssetInspector(ASSET_VALIDATION_WORKERS)
+
+async def _inspect_files(files: list) -> list:
+    """添付ファイルのヘッダーを読み、プロセスプールで解析する"""
+    headers = await asyncio.gather(
+        *(storage.read_header(f["filename"], asset_validation.HEADER_BYTES) for f in files),
+        return_exceptions=True
+    )
+    readable = [header for header in headers if not isinstance(header, Exception)]
+    inspected = iter(await asset_inspector.inspect(readable))
+    return [
+        {"error": "ファイルを読み込めません"} if isinstance(header, Exception) else next(inspected)
+        for header in headers
+    ]
+
+async def validate_checklist_assets(item_id: str, force: bool = False) -> Optional[dict]:
+    """
+    チェックリスト項目の添付画像をルール（asset_validation.ASSET_RULES）と照合し、結果を記録する
+    
+    すべてのルールを満たした場合は項目を完了にする（満たさなくなっても自動で未完了には戻さない）。
+    force=False の場合はチェック済みのファイルの結果を再利用する。
+    
+    Returns:
+        {"item": 項目の結果, "files": ファイル名 → ファイルの結果}（自動チェックの対象外の項目はNone）
+    """
+    item = await db.checklist_items.find_one(
+        {"id": item_id}, {"_id": 0, "id": 1, "project_id": 1, "platform": 1, "item_name": 1, "files": 1}
+    )
+    rule = asset_validation.rule_for(item["platform"], item["item_name"]) if item else None
+    if rule is None:
+        return None
+    
+    checked_at = datetime.now(timezone.utc).isoformat()
+    files = item.get("files", [])
+    targets = [f for f in files if force or not f.get("validation")]
+    for f, info in zip(targets, await _inspect_files(targets)):
+        errors = asset_validation.check_file(rule, info, f["file_size"])
+        f["validation"] = {
+            "passed": not errors,
+            "errors": errors,
+            **{key: info.get(key) for key in ("format", "width", "height", "mode", "has_alpha")},
+            "checked_at": checked_at
+        }
+    
+    item_errors = asset_validation.check_item(rule, [f["validation"] for f in files])
+    item_validation = {
+        "passed": not item_errors and all(f["validation"]["passed"] for f in files),
+        "errors": item_errors,
+        "checked_at": checked_at
+    }
+    
+    if targets:
+        await db.checklist_items.bulk_write(
+            [
+                UpdateOne({"id": item_id, "files.filename": f["filename"]}, {"$set": {"files.$.validation": f["validation"]}})
+                for f in targets
+            ],
+            ordered=False
+        )
+    
+    update_data = {"validation": item_validation}
+    if item_validation["passed"]:
+        update_data["status"] = "completed"
+    previous = await db.checklist_items.find_one_and_update(
+        {"id": item_id},
+        {"$set": update_data},
+        projection={"_id": 0, "project_id": 1, "platform": 1, "status": 1}
+    )
+    if previous is not None:
+        await record_changes(
+            previous["project_id"], "checklist", [item_id],
+            project_progress.changes(previous, {**previous, **update_data}, project_progress.checklist_counts)
+        )
+    
+    return {"item": item_validation, "files": {f["filename"]: f["validation"] for f in files}}
+
+async def attach_file(checklist_item: dict, filename: str, original_name: str, file_size: int, mime_type: str) -> dict:
+    """保存済みのファイルをチェックリスト項目に添付"""
+    metrics.UPLOAD_SIZE.observe(file_size)
+    metrics.UPLOAD_BYTES.inc(amount=file_size)
+    metrics.UPLOAD_FILES.inc()
+    
+    # Create file attachment object
+    file_attachment = {
+        "filename": filename,
+        "original_name": original_name,
+        "file_path": storage.location(filename),
+        "file_size": file_size,
+        "mime_type": mime_type or "application/octet-stream",
+        "uploaded_at": datetime.now(timezone.utc).isoformat(),
+        # テキスト抽出はバックグラウンドジョブで行う
+        "text_status": text_extraction.initial_status(mime_type, original_name)
+    }
+    
+    # Add to checklist item's files array
+    await db.checklist_items.update_one(
+        {"id": checklist_item["id"]},
+        {"$push": {"files": file_attachment}}
+    )
+    await record_changes(checklist_item["project_id"], "checklist", [checklist_item["id"]])
+    
+    # 素材の自動チェック（失敗してもアップロード自体は成功とする）
+    try:
+        result = await validate_checklist_assets(checklist_item["id"])
+        if result:
+            file_attachment["validation"] = result["files"].get(filename)
+    except Exception as e:
+        logger.error(f"Failed to validate uploaded asset: {str(e)}")
+    return file_attachment
+
 @api_router.post("/checklist/{item_id}/upload")
 async def upload_file_to_checklist(item_id: str, file: UploadFile = File(...)):
-    """チェックリスト項目にファイルをアップロード"""
+    """チェックリスト項目にファイルをアップロード（APIサーバー経由）"""
     # Check if checklist item exists
-    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0})
+    await rehydrate_doc("checklist_items", item_id)
+    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0, "id": 1, "project_id": 1})
     if not checklist_item:
         raise HTTPException(status_code=404, detail="Checklist item not found")
     
-    # Create upload directory if not exists
-    upload_dir = Path("/app/uploads")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
     # Generate unique filename
     file_extension = Path(file.filename).suffix
     unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = upload_dir / unique_filename
     
     # Save file
+    start = time.perf_counter()
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_size = await storage.save(unique_filename, file.file, file.content_type)
     except Exception as e:
         logger.error(f"Failed to save file: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to save file")
+    metrics.UPLOAD_DURATION.observe(time.perf_counter() - start)
     
-    # Get file size
-    file_size = os.path.getsize(file_path)
+    file_attachment = await attach_file(checklist_item, unique_filename, file.filename, file_size, file.content_type)
     
-    # Create file attachment object
-    file_attachment = {
+    return {
+        "message": "File uploaded successfully",
+        "file": file_attachment
+    }
+
+@api_router.post("/checklist/{item_id}/upload-url")
+async def create_upload_url(item_id: str, input: UploadUrlRequest):
+    """
+    ストレージへ直接アップロードするための署名付きURLを発行
+    
+    アップロード後に upload-complete を呼び出すと添付ファイルとして記録される。
+    ローカルストレージの場合は direct=false を返すため、従来の upload エンドポイントを使用する。
+    """
+    await rehydrate_doc("checklist_items", item_id)
+    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0, "id": 1})
+    if not checklist_item:
+        raise HTTPException(status_code=404, detail="Checklist item not found")
+    
+    if not storage.supports_presigned_urls:
+        return {"direct": False, "upload_url": f"/api/checklist/{item_id}/upload", "method": "POST"}
+    
+    content_type = input.content_type or "application/octet-stream"
+    unique_filename = f"{uuid.uuid4()}{Path(input.filename).suffix}"
+    await db.pending_uploads.insert_one({
         "filename": unique_filename,
-        "original_name": file.filename,
-        "file_path": str(file_path),
-        "file_size": file_size,
-        "mime_type": file.content_type or "application/octet-stream",
-        "uploaded_at": datetime.now(timezone.utc).isoformat()
+        "item_id": item_id,
+        "original_name": input.filename,
+        "mime_type": content_type,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=PENDING_UPLOAD_TTL)
+    })
+    
+    return {
+        "direct": True,
+        "method": "PUT",
+        "upload_url": storage.presigned_put_url(unique_filename, content_type),
+        "headers": {"Content-Type": content_type},
+        "filename": unique_filename,
+        "expires_in": storage.presign_expires
     }
+
+@api_router.post("/checklist/{item_id}/upload-complete")
+async def complete_upload(item_id: str, input: UploadCompleteRequest):
+    """直接アップロードの完了通知（ストレージ上のオブジェクトを確認して添付ファイルとして記録）"""
+    pending = await db.pending_uploads.find_one({"filename": input.filename, "item_id": item_id}, {"_id": 0})
+    if not pending:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
     
-    # Add to checklist item's files array
-    await db.checklist_items.update_one(
-        {"id": item_id},
-        {"$push": {"files": file_attachment}}
+    await rehydrate_doc("checklist_items", item_id)
+    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0, "id": 1, "project_id": 1})
+    if not checklist_item:
+        raise HTTPException(status_code=404, detail="Checklist item not found")
+    
+    stat = await storage.stat(input.filename)
+    if stat is None:
+        raise HTTPException(status_code=400, detail="File has not been uploaded")
+    file_size, _ = stat
+    
+    # 二重に記録しないよう、保留中のアップロードを先に取り除く
+    result = await db.pending_uploads.delete_one({"filename": input.filename})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    
+    file_attachment = await attach_file(
+        checklist_item, input.filename, pending["original_name"], file_size, pending["mime_type"]
+    )
+    
+    return {
+        "message": "File uploaded successfully",
+        "file": file_attachment
+    }
+
+@api_router.post("/checklist/{item_id}/upload-sessions", status_code=201)
+async def create_upload_session(item_id: str, input: UploadSessionCreate):
+    """
+    再開可能な分割アップロードを開始
+    
+    返された chunk_size ごとに分けたチャンクを PUT /upload-sessions/{id}/chunks/{index} で送り（並行してよい）、
+    すべて送った後に complete を呼び出すと添付ファイルとして記録される。
+    接続が途切れた場合は GET /upload-sessions/{id} で未受信のチャンクを確認して送り直す。
+    """
+    await rehydrate_doc("checklist_items", item_id)
+    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0, "id": 1, "project_id": 1})
+    if not checklist_item:
+        raise HTTPException(status_code=404, detail="Checklist item not found")
+    
+    if not 0 < input.size <= UPLOAD_SESSION_MAX_BYTES:
+        raise HTTPException(
+            status_code=400, detail=f"File size must be between 1 and {UPLOAD_SESSION_MAX_BYTES} bytes"
+        )
+    if input.chunk_size is not None and input.chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    
+    session = await upload_sessions.create(
+        db, storage, checklist_item, input.filename, input.content_type or "application/octet-stream",
+        input.size, input.chunk_size or UPLOAD_CHUNK_SIZE, UPLOAD_SESSION_TTL
+    )
+    return upload_sessions.progress(session)
+
+@api_router.get("/upload-sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    """分割アップロードの受信済みのチャンク・範囲と未受信のチャンク"""
+    try:
+        session = await upload_sessions.get(db, session_id)
+    except upload_sessions.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    return upload_sessions.progress(session)
+
+async def read_chunk(request: Request, limit: int) -> bytes:
+    """リクエストボディを読む（limit バイトを超えた時点で打ち切る）"""
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > limit:
+            raise HTTPException(status_code=413, detail=f"Chunk must not exceed {limit} bytes")
+    return bytes(data)
+
+@api_router.put("/upload-sessions/{session_id}/chunks/{index}")
+async def upload_chunk(session_id: str, index: int, request: Request, offset: Optional[int] = None):
+    """
+    チャンクを送る（index は0から、offset を指定した場合は index の開始位置と一致するか確認する）
+    
+    送り直した場合は上書きされる。書き込むたびにセッションの有効期限が延びる。
+    """
+    try:
+        session = await upload_sessions.get(db, session_id)
+        data = await read_chunk(request, session["chunk_size"])
+        session = await upload_sessions.write_chunk(
+            db, storage, session_id, index, data, offset, UPLOAD_SESSION_TTL
+        )
+    except upload_sessions.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    except upload_sessions.UploadSessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except upload_sessions.InvalidChunk as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    progress = upload_sessions.progress(session)
+    return {
+        "index": index,
+        "bytes_received": progress["bytes_received"],
+        "missing_chunks": len(progress["missing_chunks"]),
+    }
+
+@api_router.post("/upload-sessions/{session_id}/complete")
+async def complete_upload_session(session_id: str):
+    """すべてのチャンクを受信した分割アップロードを確定し、チェックリスト項目に添付"""
+    try:
+        session = await upload_sessions.complete(db, storage, session_id)
+    except upload_sessions.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    except upload_sessions.UploadSessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    await rehydrate_doc("checklist_items", session["item_id"])
+    checklist_item = await db.checklist_items.find_one({"id": session["item_id"]}, {"_id": 0, "id": 1, "project_id": 1})
+    if not checklist_item:
+        # 送信中に項目が削除された（ファイルは参照がないため削除する）
+        await project_gc.release_files(db, storage, [session["filename"]])
+        raise HTTPException(status_code=404, detail="Checklist item not found")
+    
+    file_attachment = await attach_file(
+        checklist_item, session["filename"], session["original_name"], session["size"], session["mime_type"]
     )
     
     return {
@@ -654,10 +1990,50 @@ async def upload_file_to_checklist(item_id: str, file: UploadFile = File(...)):
         "file": file_attachment
     }
 
+@api_router.delete("/upload-sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    """分割アップロードを中止し、受信済みのチャンクを破棄"""
+    try:
+        await upload_sessions.abort(db, storage, session_id)
+    except upload_sessions.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    except upload_sessions.UploadSessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Upload session aborted"}
+
+@api_router.get("/projects/{project_id}/attachments/search")
+async def search_attachments(project_id: str, q: str, limit: int = 20):
+    """プロジェクトの添付ドキュメント（抽出済みのテキスト）を検索"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    
+    project = await db.projects.find_one(live({"id": project_id}), {"_id": 0, "id": 1, "archived_at": 1})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await rehydrate(project)
+    
+    results = await text_extraction.search(db, project_id, q.strip(), min(limit, 100))
+    return {"project_id": project_id, "query": q, "results": results}
+
+@api_router.post("/checklist/{item_id}/validate")
+async def validate_checklist_item_assets(item_id: str):
+    """チェックリスト項目の添付画像をすべて再チェック"""
+    await rehydrate_doc("checklist_items", item_id)
+    checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0, "id": 1})
+    if not checklist_item:
+        raise HTTPException(status_code=404, detail="Checklist item not found")
+    
+    result = await validate_checklist_assets(item_id, force=True)
+    if result is None:
+        raise HTTPException(status_code=400, detail="This checklist item has no asset rules")
+    
+    return {"item_id": item_id, "validation": result["item"], "files": result["files"]}
+
 @api_router.delete("/checklist/{item_id}/files/{filename}")
 async def delete_file_from_checklist(item_id: str, filename: str):
     """チェックリスト項目からファイルを削除"""
     # Check if checklist item exists
+    await rehydrate_doc("checklist_items", item_id)
     checklist_item = await db.checklist_items.find_one({"id": item_id}, {"_id": 0})
     if not checklist_item:
         raise HTTPException(status_code=404, detail="Checklist item not found")
@@ -673,26 +2049,28 @@ async def delete_file_from_checklist(item_id: str, filename: str):
     if not file_to_delete:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete physical file
-    try:
-        file_path = Path(file_to_delete["file_path"])
-        if file_path.exists():
-            file_path.unlink()
-    except Exception as e:
-        logger.error(f"Failed to delete file: {str(e)}")
-    
     # Remove from database
     await db.checklist_items.update_one(
         {"id": item_id},
         {"$pull": {"files": {"filename": filename}}}
     )
+    await record_changes(checklist_item["project_id"], "checklist", [item_id])
+    
+    # 複製したプロジェクトと共有している場合があるため、参照がなくなったときだけ実体を削除
+    await project_gc.release_files(db, storage, [filename])
+    
+    # 枚数のルールを再チェック
+    await validate_checklist_assets(item_id)
     
     return {"message": "File deleted successfully"}
 
 @api_router.get("/uploads/{filename}")
 async def get_uploaded_file(filename: str):
-    """アップロードされたファイルを取得"""
-    file_path = Path("/app/uploads") / filename
+    """アップロードされたファイルを取得（S3互換ストレージの場合は署名付きURLへリダイレクト）"""
+    if storage.supports_presigned_urls:
+        return RedirectResponse(storage.presigned_get_url(filename, filename), status_code=307)
+    
+    file_path = storage.path(filename)
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
@@ -717,6 +2095,7 @@ async def get_uploaded_file(filename: str):
 async def create_rejection(input: RejectionCreate):
     rejection_dict = input.model_dump()
     rejection_obj = Rejection(**rejection_dict)
+    rejection_obj.category = analytics.classify_rejection(rejection_obj.reason)
     
     # Generate AI analysis automatically
     system_message = """You are an expert in app store submission guidelines for both iOS App Store and Google Play Store. 
@@ -749,35 +2128,76 @@ Create a step-by-step action plan to resolve it. Format as a numbered list."""
     
     doc = rejection_obj.model_dump()
     doc = serialize_datetime(doc)
+    doc = compression.store_texts(doc, PRECOMPRESSED_REJECTION_FIELDS)
     
     await db.rejections.insert_one(doc)
+    rejection_obj.rev = await record_changes(
+        rejection_obj.project_id, "rejections", [rejection_obj.id], project_progress.rejection_counts(doc)
+    ) or 0
+    await analytics.record_rejection_created(db, rejection_obj.platform, rejection_obj.category)
     return rejection_obj
 
 @api_router.get("/rejections", response_model=List[Rejection])
-async def get_rejections(project_id: Optional[str] = None):
-    query = {"project_id": project_id} if project_id else {}
-    rejections = await db.rejections.find(query, {"_id": 0}).to_list(1000)
-    
-    for rejection in rejections:
-        deserialize_datetime(rejection, ['created_at', 'rejection_date'])
+async def get_rejections(request: Request, response: Response, project_id: Optional[str] = None):
+    if project_id:
+        etag, not_modified = await check_section_etag(request, response, project_id, "rejections")
+        if etag is None:
+            return []  # 存在しない・論理削除されたプロジェクト
+        if not_modified:
+            return not_modified
+    
+    query = await exclude_deleted_projects({"project_id": project_id} if project_id else {})
+    rejections = await load_rejections(query, etag if project_id else None)
+    return compression.json_response(
+        [rejection_json(rejection) for rejection in rejections],
+        request.headers.get("accept-encoding"),
+        headers=cache_headers(response),
+        min_size=COMPRESSION_MIN_SIZE
+    )
+
+async def load_rejections(query: dict, revision: Optional[str] = None) -> list:
+    """リジェクトを読み込む（revision は区分のリビジョン。圧縮して保存したテキストは展開しない）"""
+    async def read():
+        rejections = await db.rejections.find(query, {"_id": 0}).to_list(1000)
+        
+        for rejection in rejections:
+            deserialize_datetime(rejection, ['created_at', 'updated_at', 'rejection_date'])
+        
+        return rejections
     
-    return rejections
+    return await rejection_reads.do(make_key(query, read_version(revision)), read)
+
+def rejection_json(rejection: dict) -> dict:
+    """応答用のリジェクト（圧縮して保存したテキストは compression.Fragment のまま埋め込む）"""
+    fragments = compression.fragments_of(rejection)
+    return {**Rejection(**rejection).model_dump(mode="json"), **fragments}
 
 @api_router.put("/rejections/{rejection_id}", response_model=Rejection)
 async def update_rejection(rejection_id: str, input: RejectionUpdate):
     update_data = {k: v for k, v in input.model_dump().items() if v is not None}
+    update = {"$set": update_data}
+    if "action_plan" in update_data:
+        # 編集した対応計画は圧縮せずに保存する
+        update["$unset"] = {f"{compression.PRECOMPRESSED}.action_plan": ""}
     
-    result = await db.rejections.update_one(
+    await rehydrate_doc("rejections", rejection_id)
+    previous = await db.rejections.find_one_and_update(
         {"id": rejection_id},
-        {"$set": update_data}
+        update,
+        projection={"_id": 0, "project_id": 1, "status": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Rejection not found")
     
+    await record_changes(
+        previous["project_id"], "rejections", [rejection_id],
+        project_progress.changes(previous, {**previous, **update_data}, project_progress.rejection_counts)
+    )
+    
     rejection = await db.rejections.find_one({"id": rejection_id}, {"_id": 0})
-    deserialize_datetime(rejection, ['created_at', 'rejection_date'])
-    return rejection
+    deserialize_datetime(rejection, ['created_at', 'updated_at', 'rejection_date'])
+    return compression.expand_texts(rejection)
 
 
 # ========== AI Assistant Endpoints ==========
@@ -789,6 +2209,16 @@ async def ai_chat(input: AIMessageRequest):
     Provide clear, accurate, and actionable advice based on the latest guidelines and best practices.
     If asked about specific requirements, cite relevant guidelines when possible."""
     
+    # 添付ドキュメント（プライバシーポリシー・審査とのやり取りなど）の抜粋を参考情報として渡す
+    await project_archive.ensure_hot(db, input.project_id)
+    attachments = await text_extraction.context_for(db, input.project_id, input.message, AI_ATTACHMENT_CONTEXT_CHARS)
+    if attachments:
+        system_message += f"""
+    
+    The following are excerpts from documents attached to this project. Use them when they are relevant to the question.
+
+{attachments}"""
+    
     response = await get_ai_response(input.message, system_message)
     
     return {
@@ -825,24 +2255,311 @@ Be specific and actionable."""
     }
 
 
+# ========== Analytics Endpoints ==========
+# 集計済みのサマリーコレクションを返すだけなので、プロジェクト数に関係なく小さな読み取りで済む
+
+@api_router.get("/analytics/phase-durations")
+async def get_phase_durations():
+    """フェーズごとの所要日数（平均・中央値・90パーセンタイル）"""
+    phases = await db[analytics.PHASE_DURATIONS].find({}, {"_id": 0}).sort("phase_number", 1).to_list(None)
+    return {"phases": phases}
+
+@api_router.get("/analytics/rejection-rates")
+async def get_rejection_rates():
+    """プラットフォームごとのリジェクト率"""
+    stats = await db[analytics.PLATFORM_STATS].find({}, {"_id": 0}).sort("platform", 1).to_list(None)
+    
+    for row in stats:
+        projects = row.get("projects", 0)
+        rejected_projects = row.get("rejected_projects")
+        row["rejections_per_project"] = round(row.get("rejections", 0) / projects, 3) if projects else None
+        # リジェクトされたプロジェクト数は定期集計でのみ更新される
+        row["rejection_rate"] = round(rejected_projects / projects, 3) if projects and rejected_projects is not None else None
+    
+    return {"platforms": stats}
+
+@api_router.get("/analytics/rejection-categories")
+async def get_rejection_categories(platform: Optional[str] = None, limit: int = 10):
+    """リジェクト理由のカテゴリ別件数（多い順）"""
+    query = {"platform": platform, "count": {"$gt": 0}} if platform else {"count": {"$gt": 0}}
+    categories = await db[analytics.REJECTION_CATEGORIES].find(
+        query, {"_id": 0}
+    ).sort("count", -1).to_list(limit)
+    
+    return {"categories": categories}
+
+@api_router.get("/analytics/overdue-by-assignee")
+async def get_overdue_by_assignee():
+    """担当者ごとの期限切れタスク数"""
+    assignees = await db[analytics.OVERDUE_BY_ASSIGNEE].find(
+        {}, {"_id": 0}
+    ).sort("overdue_tasks", -1).to_list(None)
+    
+    return {"assignees": assignees}
+
+
+# ========== Admin Endpoints ==========
+
+@api_router.post("/admin/analytics/refresh", dependencies=[Depends(verify_admin_token)])
+async def refresh_analytics_now():
+    """分析サマリーを即時に再集計"""
+    refreshed_at = await analytics.refresh_analytics(db)
+    return {"message": "Analytics refreshed", "refreshed_at": refreshed_at}
+
+@api_router.post("/admin/progress/repair", dependencies=[Depends(verify_admin_token)])
+async def repair_project_progress(project_id: Optional[str] = None):
+    """進捗カウンターを元データから再計算（project_id省略時は全プロジェクト）"""
+    if project_id:
+        # アーカイブ済みの場合は関連データを戻してから再計算する
+        await project_archive.ensure_hot(db, project_id)
+    repaired = await project_progress.recompute_progress(db, [project_id] if project_id else None)
+    return {"message": "Project progress repaired", "projects_repaired": repaired}
+
+async def run_upload_reconciliation(max_entries: int) -> dict:
+    return await upload_reconciler.reconcile(
+        db, storage, UPLOAD_RECONCILE_QUARANTINE, UPLOAD_ORPHAN_GRACE, UPLOAD_RECONCILE_BATCH_SIZE, max_entries
+    )
+
+@api_router.post("/admin/projects/archive", dependencies=[Depends(verify_admin_token)])
+async def archive_inactive_projects(limit: int = PROJECT_ARCHIVE_BATCH_SIZE):
+    """対象のプロジェクトのアーカイブを即時に実行"""
+    archived = await project_archive.archive_inactive(
+        db, PROJECT_ARCHIVE_APPROVED_DAYS, PROJECT_ARCHIVE_IDLE_DAYS, limit
+    )
+    return {"message": "Project archiving completed", "projects_archived": archived}
+
+@api_router.post("/admin/uploads/reconcile", dependencies=[Depends(verify_admin_token)])
+async def reconcile_uploads(max_entries: int = UPLOAD_RECONCILE_MAX_ENTRIES):
+    """アップロードディレクトリの整合性チェックを前回の続きから即時に実行"""
+    stats = await run_upload_reconciliation(max_entries)
+    return {"message": "Upload reconciliation completed", **stats}
+
+async def run_text_extraction():
+    # text_status のない添付ファイルはマイグレーションの適用後は存在しない
+    legacy = not await schema_version.at_least(db, v002_attachment_text_status.VERSION)
+    changed = await text_extraction.process_pending(
+        db, storage, text_extractor, TEXT_EXTRACTION_BATCH_SIZE, TEXT_EXTRACTION_MAX_BYTES, legacy
+    )
+    for project_id, item_ids in changed.items():
+        await record_changes(project_id, "checklist", item_ids)
+    return changed
+
+@api_router.post("/admin/attachments/extract", dependencies=[Depends(verify_admin_token)])
+async def reextract_attachments(status: str = "failed"):
+    """
+    指定した状態の添付ファイルのテキスト抽出をやり直す（抽出処理の更新後など）
+    
+    内容が同じファイルは抽出済みの結果を使うため、失敗したもの以外は再抽出されない。
+    """
+    result = await db.checklist_items.update_many(
+        {"files.text_status": status},
+        {"$set": {"files.$[file].text_status": "pending"}},
+        array_filters=[{"file.text_status": status}]
+    )
+    return {"message": "Attachments queued for text extraction", "items_queued": result.modified_count}
+
+# 適用済みのスキーマバージョン（旧形式のドキュメントへの対応を省けるかの判定に使う）
+schema_version = migrations.SchemaVersion()
+
+@api_router.get("/admin/migrations", dependencies=[Depends(verify_admin_token)])
+async def get_migration_status():
+    """適用済みのスキーマバージョンと未適用のマイグレーション"""
+    return await migrations.status(db)
+
+@api_router.post("/admin/migrations/run", dependencies=[Depends(verify_admin_token)])
+async def run_migrations(dry_run: bool = False, target: Optional[int] = None, time_budget: float = 30):
+    """
+    未適用のマイグレーションを即時に実行
+    
+    time_budget 秒で中断した場合は、次回（またはバックグラウンドジョブ）で続きから再開する。
+    dry_run=true の場合は書き込まずに対象件数を返す。
+    """
+    return await migrations.run(
+        db, SCHEMA_MIGRATION_BATCH_SIZE, SCHEMA_MIGRATION_RATE,
+        time_budget=time_budget, target=target, dry_run=dry_run
+    )
+
+@api_router.get("/admin/uploads/issues", dependencies=[Depends(verify_admin_token)])
+async def list_upload_issues(kind: Optional[str] = None, limit: int = 100):
+    """検出した孤立ファイル（orphan）と参照切れ（dangling）の一覧（新しい順）"""
+    query = {"kind": kind} if kind else {}
+    issues = await db.upload_issues.find(query, {"_id": 0}).sort("detected_at", DESCENDING).to_list(min(limit, 1000))
+    total = await db.upload_issues.count_documents(query)
+    return {"total": total, "issues": issues}
+
+@api_router.get("/admin/profiles", dependencies=[Depends(verify_admin_token)])
+async def list_request_profiles(limit: int = 50):
+    """保存されたリクエストプロファイルの一覧（新しい順）"""
+    profiles = await db.request_profiles.find(
+        {}, {"_id": 0, "spans": 0, "stacks": 0}
+    ).sort([("$natural", -1)]).to_list(min(limit, profiling.BUFFER_SIZE))
+    
+    return {"profiles": profiles}
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(verify_admin_token)])
+async def download_request_profile(profile_id: str, format: str = "json"):
+    """リクエストプロファイルをダウンロード（format=folded で折り畳みスタック形式）"""
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "folded":
+        content = "\n".join(f"{stack} {count}" for stack, count in profile.get("stacks", [])) + "\n"
+        return Response(
+            content=content,
+            media_type="text/plain",
+            headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.folded"}
+        )
+    
+    return Response(
+        content=json.dumps(profile, ensure_ascii=False),
+        media_type="application/json",
+        headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.json"}
+    )
+
+
+# ========== Application Lifecycle ==========
+
+async def create_profile_buffer():
+    if not profiling.ENABLED:
+        return
+    try:
+        await db.create_collection(
+            "request_profiles",
+            capped=True,
+            size=profiling.BUFFER_SIZE * 256 * 1024,
+            max=profiling.BUFFER_SIZE
+        )
+    except CollectionInvalid:
+        pass  # 既に作成済み
+
+# 複数ワーカーで起動した場合も、リースを取得した1プロセスだけが実行する
+analytics_job = PeriodicJob(
+    "analytics-refresh", lambda: analytics.refresh_analytics(db), ANALYTICS_REFRESH_INTERVAL,
+    leases=lambda: db.job_leases
+)
+# 起動直後にも実行され、カウンターを持たない既存プロジェクトを補完する
+progress_repair_job = PeriodicJob(
+    "progress-repair", lambda: project_progress.recompute_progress(db), PROGRESS_REPAIR_INTERVAL,
+    leases=lambda: db.job_leases
+)
+# 論理削除したプロジェクトの関連データを、保持期間の経過後に少しずつ物理削除する
+project_gc_job = PeriodicJob(
+    "project-gc",
+    lambda: project_gc.collect_garbage(db, storage, PROJECT_RETENTION_DAYS, PROJECT_GC_BATCH_SIZE, PROJECT_GC_BATCH_PAUSE),
+    PROJECT_GC_INTERVAL,
+    leases=lambda: db.job_leases
+)
+project_archive_job = PeriodicJob(
+    "project-archive",
+    lambda: project_archive.archive_inactive(
+        db, PROJECT_ARCHIVE_APPROVED_DAYS, PROJECT_ARCHIVE_IDLE_DAYS, PROJECT_ARCHIVE_BATCH_SIZE
+    ),
+    PROJECT_ARCHIVE_INTERVAL,
+    leases=lambda: db.job_leases
+)
+# 走査位置を maintenance_state に保存し、1回あたり UPLOAD_RECONCILE_MAX_ENTRIES 件ずつ進める
+upload_reconcile_job = PeriodicJob(
+    "upload-reconcile",
+    lambda: run_upload_reconciliation(UPLOAD_RECONCILE_MAX_ENTRIES),
+    UPLOAD_RECONCILE_INTERVAL,
+    leases=lambda: db.job_leases
+)
+text_extractor = text_extraction.TextExtractor(TEXT_EXTRACTION_WORKERS, TEXT_EXTRACTION_TIMEOUT)
+text_extraction_job = PeriodicJob(
+    "text-extraction", run_text_extraction, TEXT_EXTRACTION_INTERVAL, leases=lambda: db.job_leases
+)
+# 中断した位置は maintenance_state に保存し、次回はその続きから適用する
+schema_migration_job = PeriodicJob(
+    "schema-migration",
+    lambda: migrations.run(db, SCHEMA_MIGRATION_BATCH_SIZE, SCHEMA_MIGRATION_RATE, time_budget=SCHEMA_MIGRATION_INTERVAL),
+    SCHEMA_MIGRATION_INTERVAL,
+    leases=lambda: db.job_leases
+)
+# 放棄された分割アップロードを、ストレージ上のチャンクと合わせて破棄する
+upload_session_sweep_job = PeriodicJob(
+    "upload-session-sweep",
+    lambda: upload_sessions.sweep_expired(db, storage, UPLOAD_SESSION_SWEEP_BATCH_SIZE),
+    UPLOAD_SESSION_SWEEP_INTERVAL,
+    leases=lambda: db.job_leases
+)
+# メモの書き込みバッファはプロセスごとに持つため、リースを取らずに各プロセスで実行する
+memo_flush_job = PeriodicJob("memo-flush", memo_buffer.flush, MEMO_FLUSH_INTERVAL)
+BACKGROUND_JOBS = [
+    schema_migration_job, analytics_job, progress_repair_job, project_gc_job, project_archive_job,
+    upload_reconcile_job, upload_session_sweep_job, text_extraction_job, memo_flush_job
+]
+
+async def warm_up():
+    """リクエストを受け付ける前の準備（接続確認・インデックス作成・テンプレートの事前変換）"""
+    await resources.wait_until_reachable(MONGO_STARTUP_TIMEOUT)
+    await ensure_indexes()
+    await create_profile_buffer()
+    for platform in PLATFORMS:
+        compile_default_tasks(platform)
+        compile_default_checklist(platform)
+    compile_phases()
+    await asset_inspector.start()
+    await text_extractor.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources.connect()
+    try:
+        await warm_up()
+        for job in BACKGROUND_JOBS:
+            job.start()
+        resources.ready = True
+        logger.info(f"Worker {os.getpid()} is ready")
+        yield
+    finally:
+        resources.ready = False
+        for job in BACKGROUND_JOBS:
+            await job.stop()
+        asset_inspector.stop()
+        text_extractor.stop()
+        if resources.db is not None:
+            try:
+                await memo_buffer.flush()
+            except Exception:
+                logger.exception("Failed to flush pending task memos")
+        resources.close()
+
+# Create the main app without a prefix
+app = FastAPI(lifespan=lifespan)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(compression.CompressionMiddleware, min_size=COMPRESSION_MIN_SIZE)
+app.add_middleware(WriteGenerationMiddleware, generation=write_generation)
+
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware, on_complete=store_request_profile)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include the router in the main app
 app.include_router(api_router)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus形式のメトリクスを返す"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """プロセスが応答できるか（liveness）"""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """warm-upが完了し、MongoDBに接続できるか（readiness）"""
+    if resources.ready and await resources.ping(timeout=READINESS_PING_TIMEOUT):
+        return {"status": "ready", "pid": os.getpid()}
+    return JSONResponse(status_code=503, content={"status": "not_ready", "pid": os.getpid()})
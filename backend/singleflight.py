@@ -0,0 +1,101 @@
+# nativarrry（ネイティバリー）同時に実行された同じ処理の集約
+# 同じキーの処理が実行中なら新たに実行せず、実行中の処理の結果を共有する（同じプロジェクトを同時に開いた場合の読み込み・同じ内容のLLMの呼び出しなど）
+
+import asyncio
+import json
+
+import metrics
+
+
+def make_key(*parts) -> str:
+    """キーに使う値を正規化する（辞書はキーの順序によらず同じ値にする）"""
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    同じキーで同時に呼ばれた処理を1回の実行にまとめる
+    
+    処理は呼び出し元とは別のタスクで実行するため、呼び出し元の1つがキャンセルされても
+    他の呼び出し元には影響しない（待っている呼び出し元がすべてキャンセルされた場合のみ処理をキャンセルする）。
+    結果はキャッシュせず、実行が終わればキーを破棄する。例外は待っていた呼び出し元すべてに送出する。
+    結果は呼び出し元の間で共有されるため、変更しないこと。
+    """
+    
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._calls = {}
+    
+    async def do(self, key: str, fn):
+        """
+        fn()（コルーチン関数）を実行し、同じキーの処理が実行中ならその結果を待つ
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._finished(key, call))
+            metrics.SINGLEFLIGHT_IN_FLIGHT.inc(self.operation)
+            metrics.SINGLEFLIGHT_CALLS.inc(self.operation, "leader")
+        else:
+            metrics.SINGLEFLIGHT_CALLS.inc(self.operation, "shared")
+        
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 待っている呼び出し元がすべてキャンセルされた
+                call.task.cancel()
+    
+    def _finished(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        metrics.SINGLEFLIGHT_IN_FLIGHT.dec(self.operation)
+
+
+class WriteGeneration:
+    """
+    プロセス内の書き込みの世代
+    
+    リビジョンを持たない読み込み（プロジェクトを限定しない一覧など）のキーに含め、
+    書き込みの後に始まった読み込みが、書き込みの前に始まった読み込みに合流しないようにする。
+    他のプロセスの書き込みは反映しない（同時に実行された読み込みと同じ扱いになる）。
+    """
+    
+    def __init__(self):
+        self.value = 0
+    
+    def bump(self):
+        self.value += 1
+
+
+class WriteGenerationMiddleware:
+    """GET / HEAD / OPTIONS 以外のリクエストは、応答を返す前に書き込みの世代を進めるASGIミドルウェア"""
+    
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    
+    def __init__(self, app, generation: WriteGeneration):
+        self.app = app
+        self.generation = generation
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self.generation.bump()
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
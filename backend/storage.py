@@ -0,0 +1,221 @@
+# nativarrry（ネイティバリー）添付ファイルのストレージ
+# ローカルファイルシステムとS3互換オブジェクトストレージ（AWS S3 / MinIO）を切り替えて使用する
+
+import asyncio
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+
+STAGING_DIR = ".partial"  # 分割アップロード中のファイルの置き場所（UPLOAD_DIR 内、整合性チェックの走査対象外）
+
+
+class LocalStorage:
+    """UPLOAD_DIR に保存するストレージ（署名付きURLは発行できないため、API経由で転送する）"""
+    
+    name = "local"
+    supports_presigned_urls = False
+    min_part_size = 1
+    
+    def __init__(self, root: Path):
+        self.root = root
+    
+    def path(self, key: str) -> Path:
+        return self.root / key
+    
+    def location(self, key: str) -> str:
+        return str(self.path(key))
+    
+    def _save(self, key: str, fileobj) -> int:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer)
+        return os.path.getsize(path)
+    
+    async def save(self, key: str, fileobj, content_type: str = None) -> int:
+        """ファイルを保存し、サイズを返す"""
+        return await asyncio.to_thread(self._save, key, fileobj)
+    
+    async def stat(self, key: str):
+        """(サイズ, Content-Type) を返す（存在しない場合はNone）"""
+        path = self.path(key)
+        if not path.is_file():
+            return None
+        return path.stat().st_size, None
+    
+    def _read_header(self, key: str, size: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read(size)
+    
+    async def read_header(self, key: str, size: int) -> bytes:
+        """先頭から size バイトを読む（画像のヘッダー解析用）"""
+        return await asyncio.to_thread(self._read_header, key, size)
+    
+    async def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+    
+    def _staging_path(self, upload_id: str) -> Path:
+        return self.root / STAGING_DIR / upload_id
+    
+    def _create_multipart(self, upload_id: str, size: int):
+        path = self._staging_path(upload_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 最終的なサイズで確保し、各チャンクを位置を指定して書き込む（未書き込みの範囲はスパース）
+        with open(path, "xb") as f:
+            f.truncate(size)
+    
+    async def create_multipart(self, key: str, size: int, content_type: str = None) -> str:
+        """分割アップロードを開始し、アップロードIDを返す"""
+        upload_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._create_multipart, upload_id, size)
+        return upload_id
+    
+    def _write_part(self, upload_id: str, offset: int, data: bytes):
+        # 並行して書き込まれる他のチャンクと位置を共有しないよう、pwrite で書き込む
+        fd = os.open(self._staging_path(upload_id), os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        finally:
+            os.close(fd)
+    
+    async def write_part(self, key: str, upload_id: str, index: int, offset: int, data: bytes):
+        """チャンクを書き込む（S3の場合はパートのETagを返す）"""
+        await asyncio.to_thread(self._write_part, upload_id, offset, data)
+        return None
+    
+    async def complete_multipart(self, key: str, upload_id: str, parts: dict):
+        """分割アップロードを確定する（書き込み済みのファイルを移動するだけで、読み直さない）"""
+        await asyncio.to_thread(os.replace, self._staging_path(upload_id), self.path(key))
+    
+    async def abort_multipart(self, key: str, upload_id: str):
+        self._staging_path(upload_id).unlink(missing_ok=True)
+
+
+class S3Storage:
+    """S3互換ストレージ（クライアントは署名付きURLで直接アップロード・ダウンロードする）"""
+    
+    name = "s3"
+    supports_presigned_urls = True
+    min_part_size = 5 * 1024 * 1024  # 最後以外のパートの最小サイズ
+    
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 presign_expires: int = 900):
+        import boto3
+        from botocore.config import Config
+        
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.presign_expires = presign_expires
+        # 認証情報は AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY などの標準の環境変数から読み込まれる
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            # MinIOなどのエンドポイント指定時はパス形式のURLを使う
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "auto"})
+        )
+    
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+    
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.object_key(key)}"
+    
+    async def save(self, key: str, fileobj, content_type: str = None) -> int:
+        extra_args = {"ContentType": content_type} if content_type else None
+        await asyncio.to_thread(
+            self.client.upload_fileobj, fileobj, self.bucket, self.object_key(key), ExtraArgs=extra_args
+        )
+        size, _ = await self.stat(key)
+        return size
+    
+    async def stat(self, key: str):
+        from botocore.exceptions import ClientError
+        
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"], head.get("ContentType")
+    
+    async def read_header(self, key: str, size: int) -> bytes:
+        response = await asyncio.to_thread(
+            self.client.get_object, Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes=0-{size - 1}"
+        )
+        return await asyncio.to_thread(response["Body"].read)
+    
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.object_key(key))
+    
+    async def create_multipart(self, key: str, size: int, content_type: str = None) -> str:
+        extra_args = {"ContentType": content_type} if content_type else {}
+        response = await asyncio.to_thread(
+            self.client.create_multipart_upload, Bucket=self.bucket, Key=self.object_key(key), **extra_args
+        )
+        return response["UploadId"]
+    
+    async def write_part(self, key: str, upload_id: str, index: int, offset: int, data: bytes):
+        response = await asyncio.to_thread(
+            self.client.upload_part, Bucket=self.bucket, Key=self.object_key(key),
+            UploadId=upload_id, PartNumber=index + 1, Body=data
+        )
+        return response["ETag"]
+    
+    async def complete_multipart(self, key: str, upload_id: str, parts: dict):
+        # パートの結合はS3側で行われる
+        await asyncio.to_thread(
+            self.client.complete_multipart_upload, Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id,
+            MultipartUpload={"Parts": [
+                {"PartNumber": int(index) + 1, "ETag": etag}
+                for index, etag in sorted(parts.items(), key=lambda part: int(part[0]))
+            ]}
+        )
+    
+    async def abort_multipart(self, key: str, upload_id: str):
+        from botocore.exceptions import ClientError
+        
+        try:
+            await asyncio.to_thread(
+                self.client.abort_multipart_upload, Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+    
+    def presigned_put_url(self, key: str, content_type: str) -> str:
+        """直接アップロード用のURL（アップロード時は同じContent-Typeを指定する必要がある）"""
+        return self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key), "ContentType": content_type},
+            ExpiresIn=self.presign_expires
+        )
+    
+    def presigned_get_url(self, key: str, filename: str = None) -> str:
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f"inline; filename={filename}"
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_expires)
+
+
+def create_storage(upload_dir: Path):
+    """STORAGE_BACKEND（local / s3）に応じたストレージを作成"""
+    backend = os.environ.get("STORAGE_BACKEND", "local").lower()
+    if backend == "local":
+        return LocalStorage(upload_dir)
+    if backend == "s3":
+        return S3Storage(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.environ.get("S3_PREFIX", ""),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL"),  # MinIO: http://localhost:9000
+            region=os.environ.get("S3_REGION"),
+            presign_expires=int(os.environ.get("S3_PRESIGN_EXPIRES_SECONDS", "900"))
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,105 @@
+# nativarrry（ネイティバリー）フェーズ別のタスクツリー
+# プロジェクトのタスクをフェーズごとにまとめた1ドキュメント（task_trees）を、tasks の読み取り用に維持する
+# tasks コレクションが正で、ツリーは revision（= プロジェクトの revisions.tasks）が一致する間だけ使う
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+TREES = "task_trees"  # _id: プロジェクトID
+
+MAX_TASKS = 1000
+
+
+def _key(phase_number) -> str:
+    return str(phase_number if phase_number is not None else 0)
+
+
+def _phases(tree: dict) -> list:
+    return [tree["phases"][key] for key in sorted(tree.get("phases", {}), key=int)]
+
+
+async def load(db, project_id: str, revision: int):
+    """
+    リビジョンが一致するツリーのフェーズ一覧（phase_number 順）を返す
+    
+    Returns:
+        [{"phase_number", "phase_name", "tasks"}]（ツリーがない・古い場合はNone）
+    """
+    tree = await db[TREES].find_one({"_id": project_id, "revision": revision}, {"_id": 0, "phases": 1})
+    return _phases(tree) if tree is not None else None
+
+
+async def rebuild(db, project_id: str, revision: int) -> list:
+    """tasks からツリーを作り直す（読み込み時にリビジョンが一致しなかった場合）"""
+    tasks = await db.tasks.find(
+        {"project_id": project_id}, {"_id": 0}
+    ).sort([("phase_number", 1), ("order", 1)]).to_list(MAX_TASKS)
+    
+    phases = {}
+    for task in tasks:
+        task.setdefault("rev", 0)
+        key = _key(task.get("phase_number"))
+        if key not in phases:
+            phases[key] = {"phase_number": int(key), "phase_name": task.get("phase", "Unknown"), "tasks": []}
+        phases[key]["tasks"].append(task)
+    
+    tree = {"project_id": project_id, "revision": revision, "phases": phases}
+    await db[TREES].replace_one({"_id": project_id}, tree, upsert=True)
+    return _phases(tree)
+
+
+async def invalidate(db, project_id: str):
+    """ツリーを破棄する（タスクの一括生成・削除など、個別に反映しない変更の後）"""
+    await db[TREES].delete_one({"_id": project_id})
+
+
+async def add_task(db, task: dict):
+    """作成したタスクをフェーズ内の order 順の位置に追加し、リビジョンを進める"""
+    key = _key(task.get("phase_number"))
+    await db[TREES].update_one(
+        {"_id": task["project_id"]},
+        {
+            "$set": {f"phases.{key}.phase_number": int(key), f"phases.{key}.phase_name": task.get("phase", "Unknown")},
+            "$push": {f"phases.{key}.tasks": {"$each": [task], "$sort": {"order": 1}}},
+            "$inc": {"revision": 1},
+        }
+    )
+
+
+async def replace_tasks(db, project_id: str, tasks: list):
+    """
+    更新したタスクをツリー内で置き換え、リビジョンを1つ進める
+    
+    ツリーが同じか新しい rev のタスクを持っている場合はそのままにする。
+    タスクがツリーにない場合はツリーを破棄し、次回の読み込みで作り直す。
+    """
+    incremented = False
+    for task in tasks:
+        key = _key(task.get("phase_number"))
+        update = {"$set": {f"phases.{key}.tasks.$": task}}
+        if not incremented:
+            update["$inc"] = {"revision": 1}
+        result = await db[TREES].update_one(
+            {"_id": project_id, f"phases.{key}.tasks": {"$elemMatch": {"id": task["id"], "rev": {"$lte": task.get("rev", 0)}}}},
+            update
+        )
+        if result.matched_count:
+            incremented = True
+            continue
+        # 並行した更新で新しい内容が反映済みの場合は置き換えない
+        if await db[TREES].count_documents({"_id": project_id, f"phases.{key}.tasks.id": task["id"]}, limit=1) == 0:
+            await invalidate(db, project_id)
+            return
+    if not incremented:
+        await db[TREES].update_one({"_id": project_id}, {"$inc": {"revision": 1}})
+
+
+async def remove_task(db, project_id: str, task: dict):
+    """削除したタスクをツリーから取り除き、リビジョンを進める"""
+    key = _key(task.get("phase_number"))
+    await db[TREES].update_one(
+        {"_id": project_id},
+        {"$pull": {f"phases.{key}.tasks": {"id": task["id"]}}, "$inc": {"revision": 1}}
+    )
@@ -0,0 +1,304 @@
+# nativarrry（ネイティバリー）添付ドキュメントのテキスト抽出
+# チェックリスト項目に添付されたPDF・テキスト・Word文書から本文を抽出し、内容のハッシュごとに保存する
+
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from xml.etree import ElementTree
+
+
+logger = logging.getLogger(__name__)
+
+TEXTS = "attachment_texts"  # 抽出結果（_id: 内容のSHA-256）
+
+# 抽出するドキュメントの種類（MIMEタイプ・拡張子 → 種類）
+MIME_KINDS = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/plain": "text",
+    "text/markdown": "text",
+    "text/csv": "text",
+    "application/json": "text",
+}
+EXTENSION_KINDS = {".pdf": "pdf", ".docx": "docx", ".txt": "text", ".md": "text", ".csv": "text", ".json": "text"}
+
+MAX_PAGES = 200  # PDFは先頭からこのページ数まで
+MAX_CHARS = 200_000  # 保存する本文の上限
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def kind_of(mime_type: str, filename: str):
+    """抽出対象のドキュメントの種類（対象外はNone）"""
+    return MIME_KINDS.get((mime_type or "").split(";")[0].strip()) or EXTENSION_KINDS.get(Path(filename or "").suffix.lower())
+
+
+def initial_status(mime_type: str, filename: str) -> str:
+    """添付時のテキスト抽出の状態（画像など対象外のファイルはキューに入れない）"""
+    return "pending" if kind_of(mime_type, filename) else "unsupported"
+
+
+def _extract_pdf(data: bytes) -> dict:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return {"status": "unsupported", "error": "pypdf is not installed"}
+    
+    reader = PdfReader(io.BytesIO(data))
+    texts = []
+    for page in reader.pages[:MAX_PAGES]:
+        texts.append(page.extract_text() or "")
+        if sum(len(text) for text in texts) >= MAX_CHARS:
+            break
+    return {"text": "\n".join(texts), "pages": len(reader.pages)}
+
+
+def _extract_docx(data: bytes) -> dict:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    paragraphs = [
+        "".join(node.text or "" for node in paragraph.iter(f"{WORD_NAMESPACE}t"))
+        for paragraph in root.iter(f"{WORD_NAMESPACE}p")
+    ]
+    return {"text": "\n".join(paragraphs)}
+
+
+def _extract_plain(data: bytes) -> dict:
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            return {"text": data.decode(encoding)}
+        except UnicodeDecodeError:
+            continue
+    return {"text": data.decode("utf-8", errors="replace")}
+
+
+EXTRACTORS = {"pdf": _extract_pdf, "docx": _extract_docx, "text": _extract_plain}
+
+
+def extract_text(data: bytes, kind: str) -> dict:
+    """
+    ドキュメントから本文を抽出する
+    
+    プロセスプールのワーカーで実行する。
+    
+    Returns:
+        {"status": "done", "text": 本文, "chars": 文字数, "truncated": 上限で切り詰めたか, ...}
+    """
+    try:
+        result = EXTRACTORS[kind](data)
+    except Exception as e:
+        return {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    if "text" not in result:
+        return result
+    
+    text = re.sub(r"[ \t　]+", " ", result["text"])
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+    return {
+        **result,
+        "status": "done",
+        "text": text[:MAX_CHARS],
+        "chars": min(len(text), MAX_CHARS),
+        "truncated": len(text) > MAX_CHARS,
+    }
+
+
+def _lower_priority():
+    # APIのリクエスト処理より優先度を下げる
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+def _noop():
+    return None
+
+
+class TextExtractor:
+    """
+    テキスト抽出を実行するプロセスプール
+    
+    workers=0 の場合はスレッドで実行する（開発環境など）。
+    ワーカー数でCPUの使用量を、timeout で1件あたりの待ち時間を制限する。
+    """
+    
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+    
+    async def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_lower_priority
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _noop) for _ in range(self.workers)))
+    
+    async def extract(self, data: bytes, kind: str) -> dict:
+        if self._pool is None:
+            future = asyncio.to_thread(extract_text, data, kind)
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, extract_text, data, kind)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            return {"status": "failed", "error": f"Extraction timed out after {self.timeout:g}s"}
+    
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+async def _extract_file(db, storage, extractor: TextExtractor, f: dict, max_bytes: int):
+    """添付ファイル1件の本文を抽出して保存し、(状態, SHA-256) を返す"""
+    kind = kind_of(f.get("mime_type"), f.get("original_name") or f["filename"])
+    if kind is None:
+        return "unsupported", None
+    if f.get("file_size", 0) > max_bytes:
+        return "too_large", None
+    
+    try:
+        data = await storage.read_header(f["filename"], max_bytes)
+    except Exception as e:
+        logger.warning(f"Failed to read attachment {f['filename']}: {str(e)}")
+        return "failed", None
+    sha256 = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    
+    # 同じ内容のファイル（複製したプロジェクト・再アップロード）は抽出済みの結果を使う
+    existing = await db[TEXTS].find_one({"_id": sha256}, {"_id": 0, "status": 1})
+    if existing is not None and existing["status"] != "failed":
+        return existing["status"], sha256
+    
+    result = await extractor.extract(data, kind)
+    await db[TEXTS].update_one(
+        {"_id": sha256},
+        {"$set": {**result, "kind": kind, "extracted_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return result["status"], sha256
+
+
+async def process_pending(db, storage, extractor: TextExtractor, batch_size: int, max_bytes: int, legacy: bool = True) -> dict:
+    """
+    抽出待ちの添付ファイル（text_status が pending）を最大 batch_size 件処理する
+    
+    legacy の場合は text_status が未設定のもの（マイグレーションの適用前に添付されたもの）も対象にする。
+    
+    Returns:
+        プロジェクトID → 更新したチェックリスト項目IDのリスト
+    """
+    statuses = ["pending", None] if legacy else ["pending"]
+    query = {"files": {"$elemMatch": {"text_status": {"$in": statuses}}}}
+    items = await db.checklist_items.find(
+        query, {"_id": 0, "id": 1, "project_id": 1, "files": 1}
+    ).limit(batch_size).to_list(batch_size)
+    
+    changed = {}
+    for item in items:
+        for f in item.get("files", []):
+            if f.get("text_status") not in statuses:
+                continue
+            status, sha256 = await _extract_file(db, storage, extractor, f, max_bytes)
+            await db.checklist_items.update_one(
+                {"id": item["id"], "files.filename": f["filename"]},
+                {"$set": {"files.$.text_status": status, "files.$.content_sha256": sha256}}
+            )
+        changed.setdefault(item["project_id"], []).append(item["id"])
+    return changed
+
+
+def _snippet(text: str, start: int, length: int, width: int = 80) -> str:
+    begin = max(0, start - width)
+    end = min(len(text), start + length + width)
+    return ("…" if begin > 0 else "") + text[begin:end].replace("\n", " ") + ("…" if end < len(text) else "")
+
+
+async def search(db, project_id: str, query: str, limit: int) -> list:
+    """
+    プロジェクトの添付ドキュメントの本文を検索する（大文字・小文字を区別しない部分一致）
+    
+    Returns:
+        一致した添付ファイル（一致数の多い順）
+    """
+    items = await db.checklist_items.find(
+        {"project_id": project_id, "files.text_status": "done"},
+        {"_id": 0, "id": 1, "item_name": 1, "files": 1}
+    ).to_list(None)
+    attachments = {}
+    for item in items:
+        for f in item["files"]:
+            if f.get("text_status") == "done" and f.get("content_sha256"):
+                attachments.setdefault(f["content_sha256"], []).append((item, f))
+    if not attachments:
+        return []
+    
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    results = []
+    async for doc in db[TEXTS].find(
+        {"_id": {"$in": list(attachments)}, "text": {"$regex": pattern.pattern, "$options": "i"}},
+        {"_id": 1, "text": 1}
+    ):
+        matches = list(pattern.finditer(doc["text"]))
+        if not matches:
+            continue
+        for item, f in attachments[doc["_id"]]:
+            results.append({
+                "item_id": item["id"],
+                "item_name": item["item_name"],
+                "filename": f["filename"],
+                "original_name": f.get("original_name"),
+                "matches": len(matches),
+                "snippet": _snippet(doc["text"], matches[0].start(), len(matches[0].group())),
+            })
+    results.sort(key=lambda result: result["matches"], reverse=True)
+    return results[:limit]
+
+
+async def context_for(db, project_id: str, message: str, max_chars: int) -> str:
+    """
+    AIアシスタントに渡す添付ドキュメントの抜粋
+    
+    質問に含まれる語を多く含むドキュメントから順に、合計 max_chars 文字まで含める。
+    """
+    items = await db.checklist_items.find(
+        {"project_id": project_id, "files.text_status": "done"},
+        {"_id": 0, "item_name": 1, "files.original_name": 1, "files.text_status": 1, "files.content_sha256": 1}
+    ).to_list(None)
+    names = {}
+    for item in items:
+        for f in item["files"]:
+            if f.get("text_status") == "done" and f.get("content_sha256"):
+                names.setdefault(f["content_sha256"], f"{item['item_name']} / {f.get('original_name')}")
+    if not names:
+        return ""
+    
+    # "5.1.1" のようなガイドラインの番号も1語として扱う
+    terms = {term.lower().strip(".") for term in re.findall(r"[\w.]{2,}", message)} - {""}
+    docs = await db[TEXTS].find({"_id": {"$in": list(names)}}, {"_id": 1, "text": 1}).to_list(None)
+    
+    def relevance(doc):
+        counts = [doc["text"].lower().count(term) for term in terms]
+        return sum(1 for count in counts if count), sum(counts)
+    
+    docs.sort(key=relevance, reverse=True)
+    
+    sections = []
+    remaining = max_chars
+    for doc in docs:
+        if remaining <= 0:
+            break
+        excerpt = doc["text"][:remaining]
+        sections.append(f"### {names[doc['_id']]}\n{excerpt}")
+        remaining -= len(excerpt)
+    return "\n\n".join(sections)
@@ -0,0 +1,238 @@
+# nativarrry（ネイティバリー）アップロードディレクトリの整合性チェック
+# UPLOAD_DIR のファイルと checklist_items.files の参照を突き合わせ、孤立ファイルと参照切れを検出する
+
+import array
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import project_archive
+
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "upload-reconciler"
+QUARANTINE_DIR = ".quarantine"  # UPLOAD_DIR 内の隔離先（先頭が "." のエントリは走査しない）
+
+
+def _hash(filename: str) -> int:
+    return int.from_bytes(hashlib.blake2b(filename.encode(), digest_size=8).digest(), "little")
+
+
+async def build_reference_index(db) -> np.ndarray:
+    """
+    参照されているファイル名の索引（64bitハッシュのソート済み配列）
+    
+    ファイル名の集合を持つ代わりに1件8バイトで保持する。ハッシュの衝突は「参照あり」と判定されるだけなので、
+    誤って孤立ファイルとして扱うことはない。アーカイブ済みのチェックリスト項目の参照も含める。
+    """
+    hashes = array.array("Q")
+    async for item in db.checklist_items.find({"files.0": {"$exists": True}}, {"_id": 0, "files.filename": 1}):
+        for f in item["files"]:
+            hashes.append(_hash(f["filename"]))
+    async for chunk in db[project_archive.ARCHIVES].find(
+        {"collection": "checklist_items", "$or": [{"filenames.0": {"$exists": True}}, {"filenames": {"$exists": False}}]},
+        {"_id": 0, "filenames": 1, "data": 1}
+    ):
+        for filename in project_archive.chunk_filenames(chunk):
+            hashes.append(_hash(filename))
+    return np.unique(np.frombuffer(hashes, dtype=np.uint64))
+
+
+def contains(index: np.ndarray, filenames: list) -> np.ndarray:
+    """各ファイル名が索引に含まれるか"""
+    if not filenames or index.size == 0:
+        return np.zeros(len(filenames), dtype=bool)
+    hashes = np.fromiter((_hash(name) for name in filenames), dtype=np.uint64, count=len(filenames))
+    positions = np.minimum(np.searchsorted(index, hashes), index.size - 1)
+    return index[positions] == hashes
+
+
+def _skip(entries, count: int) -> int:
+    skipped = 0
+    for _ in entries:
+        skipped += 1
+        if skipped >= count:
+            break
+    return skipped
+
+
+def _next_batch(entries, size: int) -> list:
+    """(ファイル名, 通常のファイルか) を最大size件読む"""
+    batch = []
+    for entry in entries:
+        batch.append((entry.name, entry.is_file(follow_symlinks=False)))
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def _older_than(root: Path, filenames: list, cutoff: float) -> list:
+    """猶予期間より前に作成されたファイルのみ（アップロード中・参照の登録前のものを除く）"""
+    old = []
+    for name in filenames:
+        try:
+            if os.stat(root / name).st_mtime < cutoff:
+                old.append(name)
+        except FileNotFoundError:
+            pass
+    return old
+
+
+def _quarantine(root: Path, filenames: list) -> list:
+    target = root / QUARANTINE_DIR
+    target.mkdir(exist_ok=True)
+    moved = []
+    for name in filenames:
+        try:
+            os.replace(root / name, target / name)
+            moved.append(name)
+        except FileNotFoundError:
+            pass
+    return moved
+
+
+async def _record_orphans(db, filenames: list, action: str, now: str):
+    for name in filenames:
+        await db.upload_issues.update_one(
+            {"_id": f"orphan:{name}"},
+            {"$set": {"kind": "orphan", "filename": name, "action": action, "last_seen_at": now},
+             "$setOnInsert": {"detected_at": now}},
+            upsert=True
+        )
+
+
+async def scan_directory(db, root: Path, quarantine: bool, grace_seconds: float, batch_size: int, max_entries: int) -> dict:
+    """
+    ディレクトリを前回の続きから最大 max_entries 件走査し、参照されていないファイルを報告（または隔離）する
+    
+    走査位置は maintenance_state に保存し、ディレクトリの末尾に達したら先頭に戻る。
+    """
+    state = await db.maintenance_state.find_one({"_id": STATE_ID}) or {}
+    position = state.get("position", 0)
+    cycle_started_at = state.get("cycle_started_at") or datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc).isoformat()
+    stats = {"scanned": 0, "orphans": 0, "quarantined": 0, "cycle_completed": False}
+    
+    if not root.is_dir():
+        return stats
+    
+    index = await build_reference_index(db)
+    entries = await asyncio.to_thread(os.scandir, root)
+    try:
+        if position:
+            skipped = await asyncio.to_thread(_skip, entries, position)
+            if skipped < position:
+                position = skipped  # 前回より件数が減っている
+        while stats["scanned"] < max_entries:
+            batch = await asyncio.to_thread(_next_batch, entries, min(batch_size, max_entries - stats["scanned"]))
+            if not batch:
+                stats["cycle_completed"] = True
+                break
+            position += len(batch)
+            stats["scanned"] += len(batch)
+            
+            names = [name for name, is_file in batch if is_file and not name.startswith(".")]
+            candidates = [name for name, referenced in zip(names, contains(index, names)) if not referenced]
+            orphans = await asyncio.to_thread(_older_than, root, candidates, time.time() - grace_seconds)
+            if orphans:
+                if quarantine:
+                    orphans = await asyncio.to_thread(_quarantine, root, orphans)
+                    stats["quarantined"] += len(orphans)
+                await _record_orphans(db, orphans, "quarantined" if quarantine else "reported", now)
+                stats["orphans"] += len(orphans)
+            
+            # バッチごとに走査位置を保存し、中断しても続きから再開する
+            await db.maintenance_state.update_one(
+                {"_id": STATE_ID},
+                {"$set": {"position": position, "cycle_started_at": cycle_started_at}},
+                upsert=True
+            )
+    finally:
+        entries.close()
+    
+    if stats["cycle_completed"]:
+        # 1周の間に見つからなかった孤立ファイル（参照された・削除された）の記録を消す
+        await db.upload_issues.delete_many({"kind": "orphan", "action": "reported", "last_seen_at": {"$lt": cycle_started_at}})
+        await db.maintenance_state.update_one(
+            {"_id": STATE_ID},
+            {"$set": {"position": 0, "cycle_completed_at": now}, "$unset": {"cycle_started_at": ""}},
+            upsert=True
+        )
+    return stats
+
+
+async def check_references(db, root: Path, batch_size: int, max_items: int) -> dict:
+    """
+    チェックリスト項目の添付ファイルが存在するかを前回の続きから確認し、参照切れに missing を付ける
+    
+    ファイルが戻った場合は missing を外す。
+    """
+    state = await db.maintenance_state.find_one({"_id": STATE_ID}) or {}
+    last_id = state.get("last_item_id")
+    now = datetime.now(timezone.utc).isoformat()
+    stats = {"items_checked": 0, "dangling": 0, "cycle_completed": False}
+    
+    while stats["items_checked"] < max_items:
+        query = {"files.0": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        items = await db.checklist_items.find(
+            query, {"_id": 1, "id": 1, "project_id": 1, "files.filename": 1, "files.missing": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not items:
+            stats["cycle_completed"] = True
+            last_id = None
+            break
+        
+        for item in items:
+            filenames = [f["filename"] for f in item["files"]]
+            exists = await asyncio.to_thread(lambda: [(root / name).is_file() for name in filenames])
+            for f, found in zip(item["files"], exists):
+                if found == (not f.get("missing", False)):
+                    continue
+                await db.checklist_items.update_one(
+                    {"_id": item["_id"], "files.filename": f["filename"]},
+                    {"$set": {"files.$.missing": not found}}
+                )
+                issue_id = f"dangling:{item['id']}:{f['filename']}"
+                if found:
+                    await db.upload_issues.delete_one({"_id": issue_id})
+                else:
+                    await db.upload_issues.update_one(
+                        {"_id": issue_id},
+                        {"$set": {"kind": "dangling", "filename": f["filename"], "item_id": item["id"],
+                                  "project_id": item["project_id"], "detected_at": now}},
+                        upsert=True
+                    )
+                    stats["dangling"] += 1
+        
+        last_id = items[-1]["_id"]
+        stats["items_checked"] += len(items)
+    
+    await db.maintenance_state.update_one({"_id": STATE_ID}, {"$set": {"last_item_id": last_id}}, upsert=True)
+    return stats
+
+
+async def reconcile(db, storage, quarantine: bool, grace_seconds: float, batch_size: int, max_entries: int) -> dict:
+    """
+    孤立ファイルと参照切れの検出を1回分実行する（ローカルストレージのみ）
+    
+    Returns:
+        走査件数・検出件数などの集計
+    """
+    if storage.name != "local":
+        return {"skipped": f"storage backend '{storage.name}' is not a local directory"}
+    
+    stats = {
+        "files": await scan_directory(db, storage.root, quarantine, grace_seconds, batch_size, max_entries),
+        "references": await check_references(db, storage.root, batch_size, max_entries),
+    }
+    logger.info(f"Upload reconciliation: {stats}")
+    return stats
@@ -0,0 +1,230 @@
+# nativarrry（ネイティバリー）再開可能な分割アップロード
+# 大きなファイル（アプリのプレビュー動画・ビルドなど）をチャンクに分けて送り、途切れた場合は未受信のチャンクだけを送り直す
+
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from pymongo import ReturnDocument
+
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = "upload_sessions"
+
+MAX_PARTS = 10000  # S3のマルチパートアップロードのパート数の上限
+COMPLETE_TIMEOUT = 3600  # 確定中のセッションを破棄の対象から外す時間（秒。確定中に停止したプロセスのセッションはこの後に破棄する）
+
+
+class UploadSessionNotFound(LookupError):
+    pass
+
+
+class UploadSessionConflict(Exception):
+    """セッションの状態と一致しない操作（確定中・期限切れ・未受信のチャンクがあるなど）"""
+
+
+class InvalidChunk(ValueError):
+    pass
+
+
+def chunk_range(session: dict, index: int):
+    """チャンクの (開始位置, バイト数)"""
+    offset = index * session["chunk_size"]
+    return offset, min(session["chunk_size"], session["size"] - offset)
+
+
+def progress(session: dict) -> dict:
+    """受信済みのチャンクと範囲（[開始, 終了) のバイト位置）"""
+    received = sorted(session.get("received", []))
+    ranges = []
+    for index in received:
+        start, length = chunk_range(session, index)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + length
+        else:
+            ranges.append([start, start + length])
+    received_set = set(received)
+    return {
+        "session_id": session["id"],
+        "item_id": session["item_id"],
+        "filename": session["original_name"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "chunk_count": session["chunk_count"],
+        "received_chunks": received,
+        "missing_chunks": [index for index in range(session["chunk_count"]) if index not in received_set],
+        "received_ranges": ranges,
+        "bytes_received": sum(end - start for start, end in ranges),
+        "status": session["status"],
+        "expires_at": session["expires_at"],
+    }
+
+
+async def create(db, storage, item: dict, original_name: str, mime_type: str, size: int, chunk_size: int, ttl: float) -> dict:
+    """
+    分割アップロードのセッションを作成する
+    
+    チャンクサイズはストレージの最小パートサイズ以上、かつパート数が MAX_PARTS 以下になるよう切り上げる。
+    """
+    chunk_size = max(chunk_size, storage.min_part_size, -(-size // MAX_PARTS))
+    filename = f"{uuid.uuid4()}{Path(original_name).suffix}"
+    upload_id = await storage.create_multipart(filename, size, mime_type)
+    now = datetime.now(timezone.utc)
+    session = {
+        "id": str(uuid.uuid4()),
+        "item_id": item["id"],
+        "project_id": item["project_id"],
+        "filename": filename,
+        "original_name": original_name,
+        "mime_type": mime_type,
+        "size": size,
+        "chunk_size": chunk_size,
+        "chunk_count": max(1, -(-size // chunk_size)),
+        "upload_id": upload_id,
+        "received": [],
+        "parts": {},
+        "status": "open",
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=ttl),
+    }
+    await db[SESSIONS].insert_one(session)
+    session.pop("_id", None)
+    return session
+
+
+async def get(db, session_id: str) -> dict:
+    session = await db[SESSIONS].find_one({"id": session_id}, {"_id": 0})
+    if session is None:
+        raise UploadSessionNotFound(session_id)
+    return session
+
+
+async def _require_open(db, session_id: str) -> dict:
+    session = await get(db, session_id)
+    if session["status"] != "open":
+        raise UploadSessionConflict(f"Upload session is {session['status']}")
+    return session
+
+
+async def write_chunk(db, storage, session_id: str, index: int, data: bytes, offset: int = None, ttl: float = 0) -> dict:
+    """
+    チャンクを書き込み、受信済みとして記録する
+    
+    同じチャンクを送り直した場合は上書きする（異なるチャンクは並行して送ってよい）。
+    書き込むたびに有効期限を ttl 秒後まで延ばす。
+    """
+    session = await _require_open(db, session_id)
+    if not 0 <= index < session["chunk_count"]:
+        raise InvalidChunk(f"Chunk index must be between 0 and {session['chunk_count'] - 1}")
+    start, length = chunk_range(session, index)
+    if offset is not None and offset != start:
+        raise InvalidChunk(f"Chunk {index} starts at offset {start}")
+    if len(data) != length:
+        raise InvalidChunk(f"Chunk {index} must be {length} bytes (received {len(data)})")
+    
+    try:
+        etag = await storage.write_part(session["filename"], session["upload_id"], index, start, data)
+    except FileNotFoundError:
+        # 書き込み中に期限切れで破棄された
+        raise UploadSessionConflict("Upload session has expired")
+    
+    updated = await db[SESSIONS].find_one_and_update(
+        {"id": session_id, "status": "open"},
+        {
+            "$addToSet": {"received": index},
+            "$set": {f"parts.{index}": etag, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)},
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        raise UploadSessionConflict("Upload session is no longer open")
+    return updated
+
+
+async def complete(db, storage, session_id: str) -> dict:
+    """
+    すべてのチャンクを受信したセッションを確定し、セッションを削除する
+    
+    Returns:
+        確定したセッション（添付ファイルとしての記録は呼び出し側で行う）
+    """
+    session = await db[SESSIONS].find_one_and_update(
+        {"id": session_id, "status": "open"},
+        {"$set": {
+            "status": "completing",
+            "completing_until": datetime.now(timezone.utc) + timedelta(seconds=COMPLETE_TIMEOUT),
+        }},
+        projection={"_id": 0}
+    )
+    if session is None:
+        await _require_open(db, session_id)  # 存在しない・確定中の場合はここで例外になる
+        raise UploadSessionConflict("Upload session is no longer open")
+    
+    missing = session["chunk_count"] - len(set(session.get("received", [])))
+    try:
+        if missing:
+            raise UploadSessionConflict(f"{missing} chunks have not been received")
+        await storage.complete_multipart(session["filename"], session["upload_id"], session.get("parts", {}))
+    except Exception:
+        # 未受信のチャンクを送った後に、もう一度確定できるようにする
+        await db[SESSIONS].update_one(
+            {"id": session_id, "status": "completing"}, {"$set": {"status": "open"}, "$unset": {"completing_until": ""}}
+        )
+        raise
+    
+    await db[SESSIONS].delete_one({"id": session_id})
+    return session
+
+
+async def abort(db, storage, session_id: str):
+    """セッションを破棄し、書き込み済みのチャンクを削除する"""
+    session = await db[SESSIONS].find_one_and_update(
+        {"id": session_id, "status": {"$ne": "completing"}},
+        {"$set": {"status": "aborted"}},
+        projection={"_id": 0}
+    )
+    if session is None:
+        await _require_open(db, session_id)
+        raise UploadSessionConflict("Upload session is being completed")
+    await storage.abort_multipart(session["filename"], session["upload_id"])
+    await db[SESSIONS].delete_one({"id": session_id})
+
+
+async def sweep_expired(db, storage, limit: int) -> int:
+    """
+    有効期限を過ぎたセッション（途中で放棄されたアップロード）を最大 limit 件破棄する
+    
+    確定中のセッションは、チャンクを削除すると確定が失敗するため COMPLETE_TIMEOUT を過ぎるまで破棄しない。
+    
+    Returns:
+        破棄したセッション数
+    """
+    now = datetime.now(timezone.utc)
+    query = {
+        "expires_at": {"$lt": now},
+        "$or": [{"status": {"$ne": "completing"}}, {"completing_until": {"$lt": now}}],
+    }
+    expired = await db[SESSIONS].find(query, {"_id": 0, "id": 1}).to_list(limit)
+    swept = 0
+    for entry in expired:
+        # チャンクの受信で期限が延びていない・確定が始まっていないことを確かめてから、新しいチャンクを受け付けない状態にする
+        session = await db[SESSIONS].find_one_and_update(
+            {**query, "id": entry["id"]},
+            {"$set": {"status": "expired"}},
+            projection={"_id": 0}
+        )
+        if session is None:
+            continue
+        try:
+            await storage.abort_multipart(session["filename"], session["upload_id"])
+        except Exception as e:
+            logger.error(f"Failed to discard upload session {session['id']}: {str(e)}")
+            continue  # 次回に再試行する
+        await db[SESSIONS].delete_one({"id": session["id"]})
+        swept += 1
+    if swept:
+        logger.info(f"Discarded {swept} expired upload sessions")
+    return swept
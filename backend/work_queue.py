@@ -0,0 +1,120 @@
+# nativarrry（ネイティバリー）プロジェクト横断のタスクの待ち行列（担当者・期限別）
+# 期限は表示用のISO文字列（due_date）とは別に日時型（due_at）でも保存し、
+# 未完了で期限のあるタスクだけを持つ部分インデックスを期限順に読む
+
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pymongo import ASCENDING
+
+
+MAX_LIMIT = 200  # 1ページあたりのタスク数の上限
+
+# 部分インデックスの条件（インデックスを使うため、クエリにも同じ条件を含める）
+PARTIAL_FILTER = {"completed": False, "due_at": {"$type": "date"}}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def due_at(value: datetime) -> datetime:
+    """due_date を日時型で保存する値（タイムゾーンのない値はUTCとみなす）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+async def ensure_indexes(db):
+    # 担当者を指定する場合と、全員分を期限順に読む場合（id は同じ期限のタスクの順序とページの境界に使う）
+    await db.tasks.create_index(
+        [("assigned_to", ASCENDING), ("due_at", ASCENDING), ("id", ASCENDING)],
+        name="queue_assignee_due", partialFilterExpression=PARTIAL_FILTER
+    )
+    await db.tasks.create_index(
+        [("due_at", ASCENDING), ("id", ASCENDING)],
+        name="queue_due", partialFilterExpression=PARTIAL_FILTER
+    )
+
+
+def encode_cursor(task: dict) -> str:
+    """次のページの位置（ページの最後のタスクの期限とID）"""
+    value = f"{task['due_at'].replace(tzinfo=None).isoformat()}|{task['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        due, task_id = value.split("|", 1)
+        return datetime.fromisoformat(due).replace(tzinfo=timezone.utc), task_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+async def load(
+    db,
+    assigned_to: Optional[str] = None,
+    due_before: Optional[datetime] = None,
+    priorities: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    excluded_projects: Optional[List[str]] = None
+) -> dict:
+    """
+    未完了で期限のあるタスクを期限の近い順に、プロジェクトごとにまとめて返す
+    
+    ページの区切りは期限とIDで指定する（同じプロジェクトが続くページにまたがることがある）。
+    プロジェクト名はページのタスク分だけ $lookup で付ける。
+    
+    Returns:
+        {"projects": [{"project_id", "project_name", "tasks"}], "count": タスク数, "next_cursor": 次のページ（なければNone）}
+    """
+    due = {"$type": "date"}
+    if due_before is not None:
+        due["$lt"] = due_at(due_before)
+    query = {"completed": False, "due_at": due}
+    if assigned_to is not None:
+        query["assigned_to"] = assigned_to
+    if priorities:
+        query["priority"] = {"$in": priorities}
+    if excluded_projects:
+        query["project_id"] = {"$nin": excluded_projects}
+    if cursor is not None:
+        after_due, after_id = decode_cursor(cursor)
+        # 範囲で読み始める位置を絞り、同じ期限のタスクはIDで続きを判定する
+        due["$gte"] = after_due
+        query["$or"] = [{"due_at": {"$gt": after_due}}, {"id": {"$gt": after_id}}]
+    
+    tasks = await db.tasks.aggregate([
+        {"$match": query},
+        {"$sort": {"due_at": ASCENDING, "id": ASCENDING}},
+        {"$limit": limit + 1},
+        {"$lookup": {
+            "from": "projects",
+            "localField": "project_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "name": 1}}],
+            "as": "project"
+        }},
+        {"$project": {"_id": 0}},
+    ]).to_list(limit + 1)
+    
+    next_cursor = encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    tasks = tasks[:limit]
+    
+    projects = {}
+    for task in tasks:
+        project = task.pop("project")
+        group = projects.get(task["project_id"])
+        if group is None:
+            group = projects[task["project_id"]] = {
+                "project_id": task["project_id"],
+                "project_name": project[0].get("name") if project else None,
+                "tasks": [],
+            }
+        group["tasks"].append(task)
+    # プロジェクトはページ内で最も期限の近いタスクの順
+    return {"projects": list(projects.values()), "count": len(tasks), "next_cursor": next_cursor}
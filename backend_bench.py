@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+nativarrry（ネイティバリー）バックエンドAPIベンチマーク
+FastAPIアプリをプロセス内で起動し、主要シナリオのレイテンシとスループットを計測します
+
+使い方:
+    python backend_bench.py                                   # インメモリ（mongomock-motor）
+    python backend_bench.py --mongo-url mongodb://localhost:27017
+    python backend_bench.py --output bench.json --baseline bench_baseline.json
+    python backend_bench.py --save-baseline bench_baseline.json
+
+インメモリで実行する場合は backend/requirements-dev.txt をインストールしてください。
+LLM呼び出しはスタブに置き換えるため、ネットワーク接続は不要です。
+ベースラインと比較して許容範囲を超えて悪化したシナリオがあれば終了コード1を返します。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform as platform_module
+import shutil
+import sys
+import tempfile
+import time
+import types
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+SCENARIOS = ["create_project", "toggle_phase", "checklist_upload", "dashboard_list"]
+UPLOAD_PAYLOAD = b"\x89PNG\r\n\x1a\n" + os.urandom(64 * 1024)
+
+
+class StubLlmChat:
+    """LlmChatの代替（固定のテキストを返す）"""
+    
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.system_message = system_message
+    
+    def with_model(self, provider, model):
+        return self
+    
+    async def send_message(self, user_message):
+        await asyncio.sleep(0)
+        return "1. Root cause analysis\n2. Guideline\n3. Common issues\n4. Action plan\n" * 20
+
+
+def install_llm_stub():
+    """emergentintegrationsが未インストールの環境でもserverをimportできるようにする"""
+    try:
+        import emergentintegrations.llm.chat  # noqa: F401
+        return
+    except ImportError:
+        pass
+    chat_module = types.ModuleType("emergentintegrations.llm.chat")
+    chat_module.LlmChat = StubLlmChat
+    chat_module.UserMessage = types.SimpleNamespace
+    sys.modules["emergentintegrations"] = types.ModuleType("emergentintegrations")
+    sys.modules["emergentintegrations.llm"] = types.ModuleType("emergentintegrations.llm")
+    sys.modules["emergentintegrations.llm.chat"] = chat_module
+
+
+def load_server(args):
+    """環境変数を設定してからserverモジュールを読み込む"""
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://in-memory"
+    os.environ["DB_NAME"] = args.db_name
+    os.environ.setdefault("EMERGENT_LLM_KEY", "bench")
+    sys.path.insert(0, str(BACKEND_DIR))
+    install_llm_stub()
+    
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor がインストールされていません（pip install -r backend/requirements-dev.txt）。--mongo-url でローカルのMongoDBを指定することもできます")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    
+    import server
+    server.LlmChat = StubLlmChat
+    return server
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank法
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def run_operations(operation, iterations, concurrency):
+    """operationをconcurrency並列でiterations回実行し、統計値を返す"""
+    latencies = []
+    failures = 0
+    counter = iter(range(iterations))
+    
+    async def worker():
+        nonlocal failures
+        for i in counter:
+            start = time.perf_counter()
+            ok = await operation(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                failures += 1
+    
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+    
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "failures": failures,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(iterations / wall, 2) if wall else 0.0
+    }
+
+
+async def seed_projects(server, count, batch_size=5000):
+    """ダッシュボード用の背景データとしてプロジェクトを直接投入する"""
+    now = datetime.now(timezone.utc)
+    platforms = ["iOS", "Android", "Both"]
+    statuses = ["active", "submitted", "approved", "rejected"]
+    batch = []
+    for i in range(count):
+        project = server.Project(
+            name=f"Bench Project {i}",
+            platform=platforms[i % 3],
+            status=statuses[i % 4],
+            start_date=now,
+            publish_date=now
+        )
+        batch.append(server.serialize_datetime(project.model_dump()))
+        if len(batch) >= batch_size:
+            await server.db.projects.insert_many(batch)
+            batch = []
+    if batch:
+        await server.db.projects.insert_many(batch)
+
+
+async def run_scale(server, client, scale, args):
+    results = {}
+    
+    async def ok(response_coro):
+        response = await response_coro
+        return response.status_code < 400
+    
+    # プロジェクト作成（デフォルトタスク生成を含む）
+    if "create_project" in args.scenarios:
+        async def create_project(i):
+            return await ok(client.post("/api/projects", json={
+                "name": f"Bench {scale}-{i}",
+                "platform": "Both",
+                "start_date": "2025-01-01T00:00:00Z",
+                "publish_date": "2025-03-01T00:00:00Z"
+            }))
+        results["create_project"] = await run_operations(create_project, args.iterations, args.concurrency)
+    
+    # フェーズ単位のタスク完了切り替え
+    if "toggle_phase" in args.scenarios:
+        response = await client.post("/api/projects", json={"name": f"Toggle {scale}", "platform": "Both"})
+        project_id = response.json()["id"]
+        response = await client.get(f"/api/projects/{project_id}/tasks")
+        task_ids = [task["id"] for phase in response.json()["tasks_by_phase"] for task in phase["tasks"]]
+        
+        async def toggle_phase(i):
+            task_id = task_ids[i % len(task_ids)]
+            completed = "true" if (i // len(task_ids)) % 2 == 0 else "false"
+            return await ok(client.patch(f"/api/tasks/{task_id}/complete?completed={completed}"))
+        results["toggle_phase"] = await run_operations(toggle_phase, args.iterations, args.concurrency)
+    
+    # チェックリストへのファイルアップロード
+    if "checklist_upload" in args.scenarios:
+        response = await client.post("/api/projects", json={"name": f"Upload {scale}", "platform": "iOS"})
+        project_id = response.json()["id"]
+        await client.post(f"/api/projects/{project_id}/generate-default-checklist")
+        response = await client.get(f"/api/checklist?project_id={project_id}")
+        item_ids = [item["id"] for item in response.json()]
+        
+        async def checklist_upload(i):
+            item_id = item_ids[i % len(item_ids)]
+            files = {"file": (f"screenshot-{i}.png", UPLOAD_PAYLOAD, "image/png")}
+            return await ok(client.post(f"/api/checklist/{item_id}/upload", files=files))
+        results["checklist_upload"] = await run_operations(checklist_upload, args.iterations, args.concurrency)
+    
+    # ダッシュボードのプロジェクト一覧
+    if "dashboard_list" in args.scenarios:
+        async def dashboard_list(i):
+            return await ok(client.get("/api/projects"))
+        results["dashboard_list"] = await run_operations(dashboard_list, args.iterations, args.concurrency)
+    
+    return results
+
+
+async def run_benchmarks(server, args):
+    import httpx
+    
+    transport = httpx.ASGITransport(app=server.app)
+    results = {}
+    seeded = 0
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for scale in args.scales:
+                print(f"--- scale={scale} projects ---")
+                await seed_projects(server, scale - seeded)
+                seeded = scale
+                for scenario, stats in (await run_scale(server, client, scale, args)).items():
+                    key = f"{scenario}@{scale}"
+                    results[key] = stats
+                    print(f"{key:<28} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+                          f"p99={stats['p99_ms']:>9.2f}ms {stats['throughput_rps']:>9.2f} req/s "
+                          f"failures={stats['failures']}")
+        if args.mongo_url:
+            await server.resources.client.drop_database(args.db_name)
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """ベースラインと比較し、悪化したシナリオの一覧を返す"""
+    regressions = []
+    for key, stats in results.items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if base[metric] and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {base[metric]:.2f} -> {stats[metric]:.2f}")
+        if base["throughput_rps"] and stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput_rps {base['throughput_rps']:.2f} -> {stats['throughput_rps']:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="nativarrry backend benchmark")
+    parser.add_argument("--mongo-url", help="ローカルMongoDBのURL（省略時はインメモリ）")
+    parser.add_argument("--db-name", default=f"nativarrry_bench_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--scales", help="背景データとして投入するプロジェクト数（既定: MongoDB 10,1000,100000 / インメモリ 10,1000）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", help="結果をJSONで書き出すパス")
+    parser.add_argument("--baseline", help="比較対象のベースラインJSON")
+    parser.add_argument("--save-baseline", help="今回の結果をベースラインとして保存するパス")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="許容する悪化率（0.25 = 25%%）")
+    args = parser.parse_args()
+    # インメモリのスタンドインは全件走査になるため、10万件規模はMongoDB指定時のみ既定で実行する
+    scales = args.scales or ("10,1000,100000" if args.mongo_url else "10,1000")
+    args.scales = sorted(int(scale) for scale in scales.split(","))
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario in SCENARIOS]
+    
+    # アップロードされたファイルは一時ディレクトリへ
+    upload_dir = tempfile.mkdtemp(prefix="nativarrry-bench-")
+    os.environ.setdefault("UPLOAD_DIR", upload_dir)
+    
+    server = load_server(args)
+    try:
+        results = asyncio.run(run_benchmarks(server, args))
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform_module.python_version(),
+            "backend": "mongodb" if args.mongo_url else "in-memory",
+            "iterations": args.iterations,
+            "concurrency": args.concurrency
+        },
+        "results": results
+    }
+    
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"結果を書き出しました: {args.output}")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"ベースラインを保存しました: {args.save_baseline}")
+    
+    failed = [key for key, stats in results.items() if stats["failures"]]
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+    
+    for key in failed:
+        print(f"❌ FAIL {key}: {results[key]['failures']} failed requests")
+    for regression in regressions:
+        print(f"❌ REGRESSION {regression}")
+    if failed or regressions:
+        sys.exit(1)
+    print("✅ ベンチマーク完了")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,10 @@ const Dashboard = () => {
 
   const loadProjects = async () => {
     try {
-      const response = await axios.get(`${API}/projects`);
+      // 一覧カードで使用するフィールドのみ取得
+      const response = await axios.get(`${API}/projects`, {
+        params: { fields: 'name,platform,description,status,created_at,progress' }
+      });
       setProjects(response.data);
     } catch (error) {
       console.error('Failed to load projects:', error);
@@ -61,14 +64,19 @@ const Dashboard = () => {
   const handleDeleteProject = async (e, projectId, projectName) => {
     e.stopPropagation(); // Prevent navigation when clicking delete
     
-    if (!window.confirm(`「${projectName}」を削除しますか？\nこの操作は取り消せません。`)) {
+    if (!window.confirm(`「${projectName}」を削除しますか？`)) {
       return;
     }
 
     try {
       await axios.delete(`${API}/projects/${projectId}`);
       setProjects(projects.filter(p => p.id !== projectId));
-      alert('プロジェクトを削除しました');
+      
+      // 削除したプロジェクトは保持期間中であれば復元できる
+      if (window.confirm('プロジェクトを削除しました。元に戻しますか？')) {
+        const response = await axios.post(`${API}/projects/${projectId}/restore`);
+        setProjects(current => [...current, response.data]);
+      }
     } catch (error) {
       console.error('Failed to delete project:', error);
       alert('プロジェクトの削除に失敗しました');
@@ -207,6 +215,22 @@ const Dashboard = () => {
                   </div>
                 </div>
                 <div className="mt-4 pt-4 border-t border-gray-200 dark:border-gray-700">
+                  {project.progress && project.progress.tasks.total > 0 && (
+                    <div className="mb-3" data-testid={`project-progress-${project.id}`}>
+                      <div className="flex items-center justify-between text-xs text-gray-600 dark:text-gray-400 mb-1">
+                        <span>タスク {project.progress.tasks.completed} / {project.progress.tasks.total}</span>
+                        {project.progress.open_rejections > 0 && (
+                          <span className="text-red-600 dark:text-red-400">未解決のリジェクト {project.progress.open_rejections}件</span>
+                        )}
+                      </div>
+                      <div className="w-full h-2 bg-gray-200 dark:bg-gray-700 rounded-full overflow-hidden">
+                        <div
+                          className="h-full bg-blue-600 dark:bg-blue-500 rounded-full transition-all"
+                          style={{ width: `${Math.round((project.progress.tasks.completed / project.progress.tasks.total) * 100)}%` }}
+                        />
+                      </div>
+                    </div>
+                  )}
                   <div className="text-xs text-gray-500 dark:text-gray-400">
                     作成日: {new Date(project.created_at).toLocaleDateString('ja-JP')}
                   </div>
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { 
@@ -24,15 +24,122 @@ import {
 } from 'lucide-react';
 import Footer from './Footer';
 import ThemeToggle from './ThemeToggle';
+import { diffText } from '../lib/memoDiff';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// メモの自動保存までの待ち時間（ミリ秒）
+const MEMO_AUTOSAVE_DELAY = 1000;
+
+// これより大きいファイルは再開可能な分割アップロードで送る
+const CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+const CHUNK_UPLOAD_CONCURRENCY = 3;
+const CHUNK_UPLOAD_RETRIES = 5;
+
+const uploadWholeFile = async (itemId, file) => {
+  // ストレージが対応していれば署名付きURLへ直接アップロードする
+  const urlRes = await axios.post(`${API}/checklist/${itemId}/upload-url`, {
+    filename: file.name,
+    content_type: file.type || 'application/octet-stream'
+  });
+  
+  if (urlRes.data.direct) {
+    await axios.put(urlRes.data.upload_url, file, { headers: urlRes.data.headers });
+    return axios.post(`${API}/checklist/${itemId}/upload-complete`, {
+      filename: urlRes.data.filename
+    });
+  }
+  
+  const formData = new FormData();
+  formData.append('file', file);
+  
+  return axios.post(`${API}/checklist/${itemId}/upload`, formData, {
+    headers: {
+      'Content-Type': 'multipart/form-data'
+    }
+  });
+};
+
+// 未受信のチャンクを並行して送り、届かなかったチャンクはサーバーに確認して送り直す
+const uploadInChunks = async (itemId, file) => {
+  const sessionRes = await axios.post(`${API}/checklist/${itemId}/upload-sessions`, {
+    filename: file.name,
+    size: file.size,
+    content_type: file.type || 'application/octet-stream'
+  });
+  const { session_id: sessionId, chunk_size: chunkSize } = sessionRes.data;
+  let missing = sessionRes.data.missing_chunks;
+  
+  for (let attempt = 0; missing.length > 0; attempt++) {
+    if (attempt > CHUNK_UPLOAD_RETRIES) {
+      throw new Error('接続が不安定なため、アップロードを完了できませんでした');
+    }
+    if (attempt > 0) {
+      await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+    }
+    
+    const queue = [...missing];
+    const sendChunks = async () => {
+      while (queue.length > 0) {
+        const index = queue.shift();
+        const offset = index * chunkSize;
+        try {
+          await axios.put(`${API}/upload-sessions/${sessionId}/chunks/${index}`, file.slice(offset, offset + chunkSize), {
+            params: { offset },
+            headers: { 'Content-Type': 'application/octet-stream' }
+          });
+        } catch (error) {
+          // 接続エラー・サーバーエラーは次の周回で送り直す
+          if (error.response && error.response.status < 500) throw error;
+        }
+      }
+    };
+    await Promise.all(Array.from({ length: CHUNK_UPLOAD_CONCURRENCY }, sendChunks));
+    
+    const statusRes = await axios.get(`${API}/upload-sessions/${sessionId}`);
+    missing = statusRes.data.missing_chunks;
+  }
+  
+  return axios.post(`${API}/upload-sessions/${sessionId}/complete`);
+};
+
+// 差分同期の結果を一覧に反映する（IDで置き換え・追加し、削除されたものを除く）
+const applyChanges = (items, { upserts, deleted }) => {
+  const changed = new Map(upserts.map(item => [item.id, item]));
+  const removed = new Set(deleted);
+  const merged = items
+    .filter(item => !removed.has(item.id))
+    .map(item => changed.get(item.id) || item);
+  const existing = new Set(merged.map(item => item.id));
+  return [...merged, ...upserts.filter(item => !existing.has(item.id) && !removed.has(item.id))];
+};
+
+// タスクをフェーズ別にまとめる（GET /projects/{id}/tasks と同じ並び）
+const groupTasksByPhase = (tasks) => {
+  const sorted = [...tasks].sort((a, b) =>
+    ((a.phase_number ?? -1) - (b.phase_number ?? -1)) || ((a.order || 0) - (b.order || 0))
+  );
+  const groups = new Map();
+  sorted.forEach(task => {
+    const phaseNumber = task.phase_number ?? null;
+    if (!groups.has(phaseNumber)) {
+      groups.set(phaseNumber, { phase_number: phaseNumber, phase_name: task.phase || 'Unknown', tasks: [] });
+    }
+    groups.get(phaseNumber).tasks.push(task);
+  });
+  return [...groups.values()];
+};
+
 const ProjectDetail = () => {
   const { projectId } = useParams();
   const navigate = useNavigate();
   
   const [activeTab, setActiveTab] = useState('overview');
+  const savedMemos = useRef({});  // タスクごとの保存済みメモとバージョン
+  const memoTimers = useRef({});
+  const syncedRevision = useRef(null);  // 差分同期の基準となるプロジェクトのリビジョン
+  const snapshotRevisions = useRef({});  // スナップショットの区分ごとのリビジョン（変わっていない区分は再取得しない）
   const [project, setProject] = useState(null);
   const [tasks, setTasks] = useState([]);
   const [tasksByPhase, setTasksByPhase] = useState([]);
@@ -54,30 +161,75 @@ const ProjectDetail = () => {
   });
 
   useEffect(() => {
+    snapshotRevisions.current = {};
     loadProjectData();
   }, [projectId]);
 
-  const loadProjectData = async () => {
+  // タブに戻ったとき・再接続したときは差分だけを取得する
+  useEffect(() => {
+    const handleResume = () => {
+      if (document.visibilityState === 'visible') syncChanges();
+    };
+    window.addEventListener('focus', handleResume);
+    window.addEventListener('online', handleResume);
+    return () => {
+      window.removeEventListener('focus', handleResume);
+      window.removeEventListener('online', handleResume);
+    };
+  }, [projectId]);
+
+  const syncChanges = async () => {
+    if (syncedRevision.current === null) return;
     try {
-      const [projectRes, tasksByPhaseRes, phasesRes, checklistRes, rejectionsRes] = await Promise.all([
-        axios.get(`${API}/projects/${projectId}`),
-        axios.get(`${API}/projects/${projectId}/tasks`),
-        axios.get(`${API}/phases`),
-        axios.get(`${API}/checklist?project_id=${projectId}`),
-        axios.get(`${API}/rejections?project_id=${projectId}`)
-      ]);
-      
-      setProject(projectRes.data);
-      setTasksByPhase(tasksByPhaseRes.data.tasks_by_phase || []);
-      setPhases(phasesRes.data.phases || []);
-      setChecklistItems(checklistRes.data);
-      setRejections(rejectionsRes.data);
+      const res = await axios.get(`${API}/projects/${projectId}/changes`, {
+        params: { since: syncedRevision.current }
+      });
+      const changes = res.data;
+      if (changes.reset) {
+        await loadProjectData();
+        return;
+      }
+      syncedRevision.current = changes.revision;
+      if (!changes.project) return;
       
-      // Initialize schedule data
-      setScheduleData({
-        start_date: projectRes.data.start_date ? projectRes.data.start_date.split('T')[0] : '',
-        publish_date: projectRes.data.publish_date ? projectRes.data.publish_date.split('T')[0] : ''
+      setProject(changes.project);
+      setTasksByPhase(current =>
+        groupTasksByPhase(applyChanges(current.flatMap(phase => phase.tasks), changes.tasks))
+      );
+      setChecklistItems(current => applyChanges(current, changes.checklist));
+      setRejections(current => applyChanges(current, changes.rejections));
+    } catch (error) {
+      console.error('Failed to sync project changes:', error);
+    }
+  };
+
+  const loadProjectData = async () => {
+    try {
+      // プロジェクト・タスク・フェーズ・チェックリスト・リジェクトを1回のリクエストで取得する
+      const known = Object.entries(snapshotRevisions.current)
+        .map(([section, revision]) => `${section}:${revision}`)
+        .join(',');
+      const res = await axios.get(`${API}/projects/${projectId}/snapshot`, {
+        params: known ? { known } : {}
       });
+      const snapshot = res.data;
+      snapshotRevisions.current = snapshot.revisions;
+      
+      // unchanged の区分は null で返るため、表示中の内容をそのまま使う
+      if (snapshot.project) {
+        setProject(snapshot.project);
+        syncedRevision.current = snapshot.project.revision;
+        
+        // Initialize schedule data
+        setScheduleData({
+          start_date: snapshot.project.start_date ? snapshot.project.start_date.split('T')[0] : '',
+          publish_date: snapshot.project.publish_date ? snapshot.project.publish_date.split('T')[0] : ''
+        });
+      }
+      if (snapshot.tasks_by_phase) setTasksByPhase(snapshot.tasks_by_phase);
+      if (snapshot.phases) setPhases(snapshot.phases);
+      if (snapshot.checklist) setChecklistItems(snapshot.checklist);
+      if (snapshot.rejections) setRejections(snapshot.rejections);
     } catch (error) {
       console.error('Failed to load project data:', error);
       alert('プロジェクトの読み込みに失敗しました');
@@ -139,11 +291,24 @@ const ProjectDetail = () => {
   };
 
   const updateTaskMemo = async (taskId, memo) => {
+    clearTimeout(memoTimers.current[taskId]);
+    const saved = savedMemos.current[taskId];
+    if (saved && saved.text === memo) return;
+    
     try {
-      await axios.patch(`${API}/tasks/${taskId}/memo?memo=${encodeURIComponent(memo)}`);
-      // Reload tasks to reflect changes
-      const tasksByPhaseRes = await axios.get(`${API}/projects/${projectId}/tasks`);
-      setTasksByPhase(tasksByPhaseRes.data.tasks_by_phase || []);
+      // 2回目以降は前回保存した内容からの差分だけを送る
+      const body = saved
+        ? { patches: [diffText(saved.text, memo)], base_version: saved.version }
+        : { memo };
+      let res;
+      try {
+        res = await axios.put(`${API}/tasks/${taskId}/memo`, body);
+      } catch (error) {
+        // 他の画面で更新されていた・差分を適用できなかった場合は全文を送り直す
+        if (!saved || ![400, 409].includes(error.response?.status)) throw error;
+        res = await axios.put(`${API}/tasks/${taskId}/memo`, { memo });
+      }
+      savedMemos.current[taskId] = { text: memo, version: res.data.memo_version };
     } catch (error) {
       console.error('Failed to update task memo:', error);
       alert('メモの更新に失敗しました');
@@ -193,6 +358,10 @@ const ProjectDetail = () => {
         task.id === taskId ? { ...task, memo } : task
       )
     })));
+    
+    // 入力が止まったら自動保存
+    clearTimeout(memoTimers.current[taskId]);
+    memoTimers.current[taskId] = setTimeout(() => updateTaskMemo(taskId, memo), MEMO_AUTOSAVE_DELAY);
   };
 
   const updateSchedule = async () => {
@@ -301,21 +470,24 @@ const ProjectDetail = () => {
 
   const uploadFileToChecklist = async (itemId, file) => {
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      
-      const response = await axios.post(`${API}/checklist/${itemId}/upload`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      let response;
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        response = await uploadInChunks(itemId, file);
+      } else {
+        response = await uploadWholeFile(itemId, file);
+      }
       
       console.log('Upload response:', response.data);
       
       // Reload checklist immediately after upload
       await loadProjectData();
       
-      alert('ファイルをアップロードしました');
+      const validation = response.data.file?.validation;
+      if (validation && !validation.passed) {
+        alert('ファイルをアップロードしましたが、ストアの要件を満たしていません:\n' + validation.errors.join('\n'));
+      } else {
+        alert('ファイルをアップロードしました');
+      }
     } catch (error) {
       console.error('Failed to upload file:', error);
       alert('ファイルのアップロードに失敗しました: ' + (error.response?.data?.detail || error.message));
@@ -503,10 +675,14 @@ const ProjectDetail = () => {
               
               <button
                 onClick={async () => {
-                  if (window.confirm(`「${project.name}」を削除しますか？\nこの操作は取り消せません。`)) {
+                  if (window.confirm(`「${project.name}」を削除しますか？`)) {
                     try {
                       await axios.delete(`${API}/projects/${projectId}`);
-                      alert('プロジェクトを削除しました');
+                      // 削除したプロジェクトは保持期間中であれば復元できる
+                      if (window.confirm('プロジェクトを削除しました。元に戻しますか？')) {
+                        await axios.post(`${API}/projects/${projectId}/restore`);
+                        return;
+                      }
                       navigate('/');
                     } catch (error) {
                       console.error('Failed to delete project:', error);
@@ -1329,7 +1505,15 @@ const ProjectDetail = () => {
                                               {isPdf && ' • PDF'}
                                               {isDoc && ' • Word'}
                                               {isImage && ' • 画像'}
+                                              {file.missing && (
+                                                <span className="text-red-600 dark:text-red-400"> • ファイルが見つかりません</span>
+                                              )}
                                             </div>
+                                            {file.validation && !file.validation.passed && (
+                                              <div className="text-xs text-red-600 dark:text-red-400">
+                                                {file.validation.errors.join(' / ')}
+                                              </div>
+                                            )}
                                           </div>
                                           
                                           {/* View Button */}
@@ -1355,6 +1539,15 @@ const ProjectDetail = () => {
                                     })}
                                   </div>
                                 )}
+
+                                {/* Asset Validation */}
+                                {item.validation && item.validation.errors.length > 0 && (
+                                  <div className="mt-2 text-xs text-red-600 dark:text-red-400">
+                                    {item.validation.errors.map((error, idx) => (
+                                      <div key={idx}>⚠ {error}</div>
+                                    ))}
+                                  </div>
+                                )}
                               </div>
 
                               {/* Notes */}
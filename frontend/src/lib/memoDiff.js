@@ -0,0 +1,19 @@
+// 変更前後の共通する先頭・末尾を除いた差分（1件の置き換え）を求める
+// 位置はサーバー（Python の文字列）と同じコードポイント単位（UTF-16のコード単位ではない）
+export const diffText = (beforeText, afterText) => {
+  const before = Array.from(beforeText);
+  const after = Array.from(afterText);
+  let start = 0;
+  while (start < before.length && start < after.length && before[start] === after[start]) {
+    start++;
+  }
+  let end = 0;
+  while (
+    end < before.length - start &&
+    end < after.length - start &&
+    before[before.length - 1 - end] === after[after.length - 1 - end]
+  ) {
+    end++;
+  }
+  return { start, end: before.length - end, text: after.slice(start, after.length - end).join('') };
+};
@@ -0,0 +1,25 @@
+import { diffText } from './memoDiff';
+
+// サーバー側の apply_patches と同じくコードポイント単位で適用する
+const applyPatch = (text, { start, end, text: replacement }) => {
+  const chars = Array.from(text);
+  return [...chars.slice(0, start), replacement, ...chars.slice(end)].join('');
+};
+
+test('diff of plain text', () => {
+  expect(diffText('hello world', 'hello there')).toEqual({ start: 6, end: 11, text: 'there' });
+});
+
+test('offsets count non-BMP characters as one', () => {
+  const before = '😀 メモ 𠮷';
+  const after = '😀 メモ 𠮷野家';
+  expect(diffText(before, after)).toEqual({ start: 6, end: 6, text: '野家' });
+  expect(applyPatch(before, diffText(before, after))).toBe(after);
+});
+
+test('does not split surrogate pairs', () => {
+  // 😀 (U+1F600) と 😁 (U+1F601) は上位サロゲートが同じ
+  const patch = diffText('a😀b', 'a😁b');
+  expect(patch).toEqual({ start: 1, end: 2, text: '😁' });
+  expect(applyPatch('a😀b', patch)).toBe('a😁b');
+});
@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 依存は backend/requirements-dev.txt（mongomock-motor など）
+# backend のモジュールはパッケージではなく、backend ディレクトリから直接 import する
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
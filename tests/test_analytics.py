@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import analytics
+import project_archive
+
+
+def test_overdue_match_compares_dates():
+    now = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    tasks = mongomock.MongoClient(tz_aware=True).db.tasks
+    tasks.insert_many([
+        # 文字列では "2026-10-19T12:00:00.000Z" < "2026-10-19T12:00:00+00:00" となり期限切れと判定されていた
+        {"id": "now", "completed": False, "due_date": "2026-10-19T12:00:00.000Z", "due_at": now},
+        {"id": "past", "completed": False, "due_date": "2026-10-19T11:59:00+00:00", "due_at": now - timedelta(minutes=1)},
+        {"id": "future", "completed": False, "due_date": "2026-10-19T12:01:00.000Z", "due_at": now + timedelta(minutes=1)},
+        {"id": "done", "completed": True, "due_date": "2026-10-01T00:00:00Z", "due_at": now - timedelta(days=18)},
+    ])
+    match = analytics._overdue_pipeline("stamp", now, [])[0]
+    assert [task["id"] for task in tasks.aggregate([match])] == ["past"]
+
+
+def test_archive_summary_keeps_due_at():
+    due_at = datetime(2026, 1, 1)
+    summary = analytics.archive_summary({}, [
+        {"assigned_to": "a", "due_date": "2026-01-01T00:00:00Z", "due_at": due_at, "completed": False},
+        {"assigned_to": "b", "due_date": "2026-01-01T00:00:00Z", "completed": True},
+        {"assigned_to": "c", "completed": False},
+    ], [])
+    assert summary["open_tasks"] == [{"assigned_to": "a", "due_date": "2026-01-01T00:00:00Z", "due_at": due_at}]
+
+
+@pytest.mark.anyio
+async def test_deleting_archived_project_subtracts_archived_rejections():
+    db = AsyncMongoMockClient()["test"]
+    await db.projects.insert_one({
+        "id": "p1", "platform": "iOS", "revision": 1, "archived_at": None, "deleted_at": None,
+        "updated_at": "2020-01-01T00:00:00+00:00",
+    })
+    await analytics.record_project_created(db, "iOS")
+    for index, category in enumerate(["privacy", "privacy", "metadata"]):
+        await db.rejections.insert_one({"id": f"r{index}", "project_id": "p1", "platform": "iOS", "category": category, "rev": 1})
+        await analytics.record_rejection_created(db, "iOS", category)
+    assert await project_archive.archive_project(db, "p1")
+    # アーカイブ後に作成されたリジェクト
+    await db.rejections.insert_one({"id": "r3", "project_id": "p1", "platform": "iOS", "category": "privacy", "rev": 2})
+    await analytics.record_rejection_created(db, "iOS", "privacy")
+
+    await analytics.record_project_deleted(db, "p1", "iOS")
+
+    stats = await db[analytics.PLATFORM_STATS].find_one({"_id": "iOS"})
+    assert (stats["projects"], stats["rejections"]) == (0, 0)
+    categories = await db[analytics.REJECTION_CATEGORIES].find({}, {"_id": 0, "category": 1, "count": 1}).to_list(None)
+    assert {row["category"]: row["count"] for row in categories} == {"privacy": 0, "metadata": 0}
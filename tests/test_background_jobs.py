@@ -0,0 +1,44 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from background_jobs import PeriodicJob, worker_id
+
+
+@pytest.mark.anyio
+async def test_lease_is_renewed_while_running():
+    leases = AsyncMongoMockClient()["test"]["job_leases"]
+    expirations = []
+
+    async def slow():
+        # リースの有効期限（実行間隔の1.5倍）を超えて実行する
+        for _ in range(4):
+            await asyncio.sleep(0.1)
+            expirations.append((await leases.find_one({"_id": "slow"}))["expires_at"])
+
+    job = PeriodicJob("slow", slow, 0.2, leases=lambda: leases)
+    await job._run_with_lease()
+
+    assert expirations[-1] > expirations[0]
+    assert (await leases.find_one({"_id": "slow"}))["owner"] == worker_id()
+
+
+@pytest.mark.anyio
+async def test_other_owner_is_not_run():
+    leases = AsyncMongoMockClient()["test"]["job_leases"]
+    job = PeriodicJob("busy", None, 60, leases=lambda: leases)
+    # 他のプロセスが有効なリースを保持している
+    await leases.insert_one({
+        "_id": "busy", "owner": "other:1", "expires_at": job._lease_expires_at(datetime.now(timezone.utc))
+    })
+
+    calls = []
+
+    async def func():
+        calls.append(1)
+
+    job.func = func
+    await job._run_with_lease()
+    assert calls == []
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import change_log
+
+
+@pytest.fixture
+async def db():
+    db = AsyncMongoMockClient()["test"]
+    await db.projects.insert_one({"id": "p1", "revision": 3})
+    await db.tasks.insert_one({"id": "t1", "project_id": "p1", "title": "before", "rev": 3})
+    return db
+
+
+async def sync(db, since: int):
+    """GET /projects/{id}/changes と同じ順序（先にプロジェクトを読んでから変更を読む）"""
+    project = await db.projects.find_one({"id": "p1"})
+    upserts = await db.tasks.find({"project_id": "p1", "rev": {"$gt": since}}).to_list(None)
+    return change_log.synced_revision(project, since), [task["title"] for task in upserts]
+
+
+@pytest.mark.anyio
+async def test_sync_between_touch_and_stamp_does_not_skip_change(db, monkeypatch):
+    stamping = asyncio.Event()
+    release = asyncio.Event()
+    collection_class = type(db.tasks)
+    update_many = collection_class.update_many
+    
+    async def slow_update_many(self, *args, **kwargs):
+        stamping.set()
+        await release.wait()
+        return await update_many(self, *args, **kwargs)
+    
+    monkeypatch.setattr(collection_class, "update_many", slow_update_many)
+    
+    await db.tasks.update_one({"id": "t1"}, {"$set": {"title": "after"}})
+    write = asyncio.create_task(change_log.record_changes(db, "tasks", "p1", "tasks", ["t1"]))
+    await asyncio.wait_for(stamping.wait(), 1)
+    
+    # リビジョンは進んだが rev はまだ付いていない
+    since, titles = await sync(db, 3)
+    assert (since, titles) == (3, [])
+    
+    release.set()
+    assert await write == 4
+    assert await sync(db, since) == (4, ["after"])
+    assert (await db.projects.find_one({"id": "p1"}))["sync_pending"] == []
+
+
+@pytest.mark.anyio
+async def test_stale_pending_entry_is_ignored(db):
+    stale = datetime.now(timezone.utc) - timedelta(seconds=change_log.PENDING_TIMEOUT + 1)
+    await db.projects.update_one({"id": "p1"}, {"$push": {"sync_pending": {"token": "crashed", "at": stale}}})
+    assert (await sync(db, 3))[0] == 3
+    
+    await change_log.record_changes(db, "tasks", "p1", "tasks", ["t1"])
+    # 異常終了で残った記録は次の書き込みで取り除かれる
+    project = await db.projects.find_one({"id": "p1"})
+    assert project["sync_pending"] == []
+    assert (await sync(db, 3))[0] == 4
+
+
+@pytest.mark.anyio
+async def test_record_deletions_leaves_tombstones(db):
+    assert await change_log.record_deletions(db, "p1", "tasks", ["t1"], {"progress.tasks.total": -1}) == 4
+    tombstone = await db.tombstones.find_one({"id": "t1"})
+    assert (tombstone["section"], tombstone["rev"]) == ("tasks", 4)
+    project = await db.projects.find_one({"id": "p1"})
+    assert (project["revisions"]["tasks"], project["progress"]["tasks"]["total"], project["sync_pending"]) == (1, -1, [])
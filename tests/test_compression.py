@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+import random
+import zlib
+
+import pytest
+
+import compression
+from compression import Fragment, GzipSplicer, crc32_combine, json_response, negotiate, precompress
+
+
+@pytest.mark.parametrize("a, b", [
+    (b"", b""),
+    (b"hello ", b"world"),
+    (b"", b"only second"),
+    (b"only first", b""),
+    (os.urandom(1000), os.urandom(70000)),
+])
+def test_crc32_combine(a, b):
+    assert crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+
+
+def test_crc32_combine_random_lengths():
+    rng = random.Random(0)
+    for _ in range(50):
+        a = rng.randbytes(rng.randrange(0, 300))
+        b = rng.randbytes(rng.randrange(0, 300))
+        assert crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+
+
+def test_splicer_matches_plain_bytes():
+    texts = ["分析結果 " * 200, 'quotes " and \\ backslashes\n', ""]
+    splicer = GzipSplicer()
+    expected = b""
+    for text in texts:
+        splicer.write(b'{"prefix":')
+        fragment = Fragment(precompress(text))
+        splicer.write_fragment(fragment)
+        splicer.write(b"}")
+        expected += b'{"prefix":' + json.dumps(text, ensure_ascii=False).encode() + b"}"
+    # gzip.decompress は末尾のCRC-32と長さも検証する
+    assert gzip.decompress(splicer.finish()) == expected
+
+
+def rejection(index: int) -> dict:
+    doc = {
+        "id": f"r{index}",
+        "ai_analysis": f"ガイドライン 5.1.1 に関する分析 {index}\n" * 50,
+        "action_plan": "1. \"NSCameraUsageDescription\" を追加\t\x00" * 20,
+        "notes": "plain",
+    }
+    return compression.store_texts(doc, ["ai_analysis", "action_plan"])
+
+
+def test_spliced_response_equals_plain_json():
+    docs = [rejection(i) for i in range(3)]
+    plain = [compression.expand_texts(dict(doc)) for doc in docs]
+    content = [{**doc, **compression.fragments_of(doc)} for doc in docs]
+    for doc in content:
+        doc.pop(compression.PRECOMPRESSED)
+
+    spliced = json_response(content, "gzip, deflate", min_size=0)
+    assert spliced.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(spliced.body)) == plain
+
+    identity = json_response(content, None, min_size=0)
+    assert "content-encoding" not in identity.headers
+    assert json.loads(identity.body) == plain
+    assert gzip.decompress(spliced.body) == identity.body
+
+
+def test_small_response_is_not_spliced():
+    content = {"text": Fragment(precompress("short"))}
+    response = json_response(content, "gzip", min_size=1024)
+    assert "content-encoding" not in response.headers
+    assert json.loads(response.body) == {"text": "short"}
+
+
+def test_fragments_of_prefers_edited_field():
+    doc = rejection(0)
+    doc["action_plan"] = "edited"
+    assert set(compression.fragments_of(doc)) == {"ai_analysis"}
+    assert compression.expand_texts(doc)["action_plan"] == "edited"
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("gzip", "gzip"),
+    ("gzip;q=0.5, br;q=0.9", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "zstd"),
+    ("identity", None),
+    ("gzip;q=invalid", None),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header, ["zstd", "br", "gzip"]) == expected
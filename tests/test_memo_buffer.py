@@ -0,0 +1,117 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from memo_buffer import InvalidMemoPatch, MemoBuffer, MemoConflict, apply_patches
+
+
+@pytest.fixture
+async def tasks():
+    collection = AsyncMongoMockClient()["test"]["tasks"]
+    await collection.insert_one({"id": "t1", "project_id": "p1", "memo": "hello world", "memo_version": 3})
+    return collection
+
+
+def test_apply_patches_in_order():
+    # 2つ目の差分の位置は1つ目を適用した後の文字列に対する値
+    patches = [{"start": 0, "end": 5, "text": "goodbye"}, {"start": 8, "end": 13, "text": "moon"}]
+    assert apply_patches("hello world", patches) == "goodbye moon"
+
+
+@pytest.mark.parametrize("patch", [
+    {"start": -1, "end": 0, "text": ""},
+    {"start": 3, "end": 2, "text": ""},
+    {"start": 0, "end": 12, "text": ""},
+])
+def test_apply_patches_out_of_bounds(patch):
+    with pytest.raises(InvalidMemoPatch):
+        apply_patches("hello world", [patch])
+
+
+@pytest.mark.anyio
+async def test_patch_against_current_version(tasks):
+    buffer = MemoBuffer(lambda: tasks)
+    version = await buffer.update("t1", patches=[{"start": 6, "end": 11, "text": "there"}], base_version=3)
+    assert version == 4
+    
+    # 未書き込みの値に続けて差分を適用する
+    version = await buffer.update("t1", patches=[{"start": 11, "end": 11, "text": "!"}], base_version=4)
+    assert version == 5
+    assert buffer.overlay([{"id": "t1", "memo": "hello world"}])[0] == {"id": "t1", "memo": "hello there!", "memo_version": 5}
+    
+    assert await buffer.flush() == 1
+    task = await tasks.find_one({"id": "t1"})
+    assert (task["memo"], task["memo_version"]) == ("hello there!", 5)
+
+
+@pytest.mark.anyio
+async def test_stale_base_version_conflicts(tasks):
+    buffer = MemoBuffer(lambda: tasks)
+    await buffer.update("t1", memo="first", base_version=3)
+    
+    with pytest.raises(MemoConflict) as excinfo:
+        await buffer.update("t1", patches=[{"start": 0, "end": 0, "text": "x"}], base_version=3)
+    assert excinfo.value.version == 4
+    assert buffer.overlay([{"id": "t1", "memo": ""}])[0]["memo"] == "first"
+
+
+@pytest.mark.anyio
+async def test_invalid_patch_leaves_memo_unchanged(tasks):
+    buffer = MemoBuffer(lambda: tasks)
+    with pytest.raises(InvalidMemoPatch):
+        await buffer.update("t1", patches=[{"start": 0, "end": 100, "text": ""}], base_version=3)
+    assert await buffer.flush() == 0
+    assert await buffer.update("t1", memo="ok", base_version=3) == 4
+
+
+def test_apply_patches_counts_code_points():
+    # 非BMPの文字も1文字（クライアントは Array.from で数える）
+    assert apply_patches("😀 メモ 𠮷", [{"start": 6, "end": 6, "text": "野家"}]) == "😀 メモ 𠮷野家"
+    assert apply_patches("a😀b", [{"start": 1, "end": 2, "text": "😁"}]) == "a😁b"
+
+
+@pytest.mark.anyio
+async def test_flush_does_not_overwrite_newer_version(tasks):
+    buffer = MemoBuffer(lambda: tasks)
+    other = MemoBuffer(lambda: tasks)  # 別のプロセス
+    await buffer.update("t1", memo="stale")
+    await other.update("t1", memo="newer")
+    await other.flush()
+    
+    await buffer.flush()
+    task = await tasks.find_one({"id": "t1"})
+    assert (task["memo"], task["memo_version"]) == ("newer", 5)
+
+
+@pytest.mark.anyio
+async def test_versions_are_unique_across_processes(tasks):
+    first = MemoBuffer(lambda: tasks)
+    second = MemoBuffer(lambda: tasks)
+    assert await first.update("t1", patches=[{"start": 0, "end": 5, "text": "hi"}], base_version=3) == 4
+    
+    # 別のプロセスは同じ基準バージョンの差分を受け付けない
+    with pytest.raises(MemoConflict) as excinfo:
+        await second.update("t1", patches=[{"start": 0, "end": 0, "text": "x"}], base_version=3)
+    assert excinfo.value.version == 4
+    
+    # 未書き込みのバージョンを基準にした差分も、書き込まれるまでは受け付けない
+    with pytest.raises(MemoConflict):
+        await second.update("t1", patches=[{"start": 0, "end": 0, "text": "x"}], base_version=4)
+    
+    # 全文は受け付け、次のバージョンを割り当てる
+    assert await second.update("t1", memo="full") == 5
+    await second.flush()
+    await first.flush()
+    task = await tasks.find_one({"id": "t1"})
+    assert (task["memo"], task["memo_version"]) == ("full", 5)
+    
+    # 書き込み済みのバージョンを基準にした差分はどちらのプロセスでも受け付ける
+    first.discard("t1")
+    assert await first.update("t1", patches=[{"start": 4, "end": 4, "text": "!"}], base_version=5) == 6
+    await first.flush()
+    assert (await tasks.find_one({"id": "t1"}))["memo"] == "full!"
+
+
+@pytest.mark.anyio
+async def test_unknown_task(tasks):
+    buffer = MemoBuffer(lambda: tasks)
+    assert await buffer.update("missing", memo="x") is None
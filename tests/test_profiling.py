@@ -0,0 +1,37 @@
+import threading
+import time
+
+import profiling
+
+
+def scope(*headers):
+    return {"type": "http", "headers": list(headers)}
+
+
+def test_header_is_ignored_without_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+    middleware = profiling.ProfilingMiddleware(None, on_complete=None)
+    assert not middleware._requested(scope((b"x-profile", b"1")))
+    assert not middleware._requested(scope((b"x-profile", b"true")))
+
+
+def test_header_must_match_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    middleware = profiling.ProfilingMiddleware(None, on_complete=None)
+    assert middleware._requested(scope((b"x-profile", b"secret")))
+    assert not middleware._requested(scope((b"x-profile", b"1")))
+    assert not middleware._requested(scope())
+
+
+def test_stacks_are_stable_after_remove():
+    sampler = profiling.StackSampler(0.0005)
+    profile = profiling.RequestProfile("GET", "/api/", forced=True)
+    sampler.add(profile, threading.get_ident())
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        profile.to_document()  # 採取中に読んでも例外にならない
+    sampler.remove(profile)
+    
+    document = profile.to_document()
+    time.sleep(0.01)
+    assert profile.to_document()["samples"] == document["samples"]
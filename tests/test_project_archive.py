@@ -0,0 +1,95 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import project_archive
+import project_gc
+import upload_reconciler
+from storage import LocalStorage
+
+
+@pytest.fixture
+async def db():
+    db = AsyncMongoMockClient()["test"]
+    await db.projects.insert_one({
+        "id": "p1", "name": "archived", "revision": 1, "archived_at": None, "deleted_at": None,
+        "updated_at": "2020-01-01T00:00:00+00:00",
+    })
+    await db.checklist_items.insert_one({
+        "id": "c1", "project_id": "p1", "rev": 1, "status": "completed",
+        "files": [{"filename": "shared.png"}, {"filename": "own.png"}],
+    })
+    return db
+
+
+@pytest.fixture
+def root(tmp_path):
+    for name in ["shared.png", "own.png", "orphan.png"]:
+        (tmp_path / name).write_bytes(b"data")
+    return tmp_path
+
+
+async def scan(db, root):
+    return await upload_reconciler.scan_directory(
+        db, root, quarantine=True, grace_seconds=0, batch_size=10, max_entries=100
+    )
+
+
+@pytest.mark.anyio
+async def test_archived_attachments_are_not_quarantined(db, root):
+    assert await project_archive.archive_project(db, "p1")
+    assert await db.checklist_items.count_documents({}) == 0
+    
+    stats = await scan(db, root)
+    assert stats["quarantined"] == 1  # 参照のない orphan.png のみ
+    
+    assert await project_archive.ensure_hot(db, "p1")
+    item = await db.checklist_items.find_one({"id": "c1"})
+    missing = [f["filename"] for f in item["files"] if not (root / f["filename"]).is_file()]
+    assert missing == []
+
+
+@pytest.mark.anyio
+async def test_archived_reference_keeps_shared_file(db, root):
+    await project_archive.archive_project(db, "p1")
+    # 複製先が削除した添付ファイルは、アーカイブ中のプロジェクトが参照している間は残す
+    assert await project_gc.release_files(db, LocalStorage(root), ["shared.png"]) == 0
+    assert (root / "shared.png").is_file()
+
+
+@pytest.mark.anyio
+async def test_gc_releases_archived_attachments(db, root):
+    await project_archive.archive_project(db, "p1")
+    # 別のプロジェクトが shared.png を共有している
+    await db.checklist_items.insert_one({"id": "c2", "project_id": "p2", "files": [{"filename": "shared.png"}]})
+    await db.projects.update_one({"id": "p1"}, {"$set": {"deleted_at": "2020-01-02T00:00:00+00:00"}})
+    
+    counts = await project_gc.collect_project(db, LocalStorage(root), "p1", batch_size=1, pause=0)
+    
+    assert counts["project_archives"] == 1  # tasks・rejections は空のため、チェックリストのチャンクのみ
+    assert not (root / "own.png").exists()
+    assert (root / "shared.png").is_file()
+    assert await db.project_archives.count_documents({}) == 0
+
+
+def test_chunk_filenames_of_legacy_chunk():
+    docs = [{"id": "c1", "files": [{"filename": "b.png"}, {"filename": "a.png"}]}, {"id": "c2"}]
+    chunk = {"data": project_archive._pack(docs)}
+    assert project_archive.chunk_filenames(chunk) == ["a.png", "b.png"]
+
+
+@pytest.mark.anyio
+async def test_write_by_id_finds_archived_project(db):
+    assert await project_archive.archive_project(db, "p1")
+    assert await project_archive.archived_project_of(db, "checklist_items", "c1") == "p1"
+    assert await project_archive.archived_project_of(db, "tasks", "c1") is None
+    
+    # IDで書き込む前に復元する
+    assert await project_archive.ensure_hot(db, "p1")
+    result = await db.checklist_items.update_one({"id": "c1"}, {"$set": {"status": "pending"}})
+    assert result.matched_count == 1
+    assert await project_archive.archived_project_of(db, "checklist_items", "c1") is None
+
+
+def test_chunk_ids_of_legacy_chunk():
+    chunk = {"data": project_archive._pack([{"id": "c1"}, {"id": "c2"}])}
+    assert project_archive.chunk_ids(chunk) == ["c1", "c2"]
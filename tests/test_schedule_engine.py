@@ -0,0 +1,31 @@
+import math
+
+import pytest
+
+from schedule_engine import parse_estimated_days
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("即時", (0.0, 0.0)),
+    ("1-2日", (1.0, 2.0)),
+    ("1-2週間", (7.0, 14.0)),
+    ("3日", (3.0, 3.0)),
+    ("1ヶ月", (30.0, 30.0)),
+    ("数時間", (0.25, 0.75)),
+    # 全角数字・全角チルダは NFKC で正規化する
+    ("２～３日", (2.0, 3.0)),
+    ("４時間", (0.5, 0.5)),
+])
+def test_parses_ranges_and_units(text, expected):
+    assert parse_estimated_days(text) == expected
+
+
+def test_supplement_only_extends_max():
+    assert parse_estimated_days("平均 2～7日 (場合により10日以上)") == (2.0, 10.0)
+    assert parse_estimated_days("1-2週間 (最短3日)") == (7.0, 14.0)
+
+
+@pytest.mark.parametrize("text", ["", None, "不明", "要確認"])
+def test_unparsable_is_nan(text):
+    low, high = parse_estimated_days(text)
+    assert math.isnan(low) and math.isnan(high)
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, WriteGeneration, WriteGenerationMiddleware, make_key
+
+
+def test_make_key_ignores_dict_order():
+    assert make_key({"a": 1, "b": 2}, None) == make_key({"b": 2, "a": 1}, None)
+    assert make_key({"a": 1}, 1) != make_key({"a": 1}, 2)
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = 0
+    release = asyncio.Event()
+
+    async def read():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"value": calls}
+
+    waiters = [asyncio.create_task(flight.do("k", read)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight._calls == {}
+
+
+@pytest.mark.anyio
+async def test_cancelling_one_waiter_does_not_cancel_others():
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+    cancelled = False
+
+    async def read():
+        nonlocal cancelled
+        try:
+            await release.wait()
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "done"
+
+    first = asyncio.create_task(flight.do("k", read))
+    second = asyncio.create_task(flight.do("k", read))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "done"
+    assert first.cancelled()
+    assert not cancelled
+
+
+@pytest.mark.anyio
+async def test_cancelling_all_waiters_cancels_the_call():
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def read():
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.do("k", read)) for _ in range(2)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0)
+    assert flight._calls == {}
+
+
+@pytest.mark.anyio
+async def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    # 失敗した後の呼び出しは新たに実行する
+    async def succeed():
+        return "ok"
+
+    assert await flight.do("k", succeed) == "ok"
+
+
+@pytest.mark.anyio
+async def test_write_generation_separates_reads_after_write():
+    flight = SingleFlight("test")
+    generation = WriteGeneration()
+    started = asyncio.Event()
+    release = asyncio.Event()
+    state = {"value": "before"}
+
+    async def read():
+        value = state["value"]
+        started.set()
+        await release.wait()
+        return value
+
+    before = asyncio.create_task(flight.do(make_key(generation.value), read))
+    await started.wait()
+
+    # 読み込み中に書き込みがあった
+    state["value"] = "after"
+    generation.bump()
+    after = asyncio.create_task(flight.do(make_key(generation.value), read))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await before == "before"
+    assert await after == "after"
+
+
+@pytest.mark.anyio
+async def test_middleware_bumps_generation_on_writes():
+    generation = WriteGeneration()
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = WriteGenerationMiddleware(app, generation)
+    await middleware({"type": "http", "method": "GET"}, None, send)
+    assert generation.value == 0
+    await middleware({"type": "http", "method": "PUT"}, None, send)
+    assert generation.value == 1
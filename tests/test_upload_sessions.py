@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import upload_sessions
+from storage import LocalStorage
+from upload_sessions import InvalidChunk, UploadSessionConflict, UploadSessionNotFound
+
+
+ITEM = {"id": "c1", "project_id": "p1"}
+DATA = bytes(range(256)) * 4 + b"tail"  # 1028バイト（100バイトのチャンクでは最後のチャンクが28バイト）
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(tmp_path)
+
+
+async def create(db, storage, chunk_size=100):
+    return await upload_sessions.create(db, storage, ITEM, "preview.mp4", "video/mp4", len(DATA), chunk_size, ttl=60)
+
+
+async def send(db, storage, session, index):
+    start, length = upload_sessions.chunk_range(session, index)
+    return await upload_sessions.write_chunk(db, storage, session["id"], index, DATA[start:start + length], offset=start, ttl=60)
+
+
+@pytest.mark.anyio
+async def test_out_of_order_chunks_and_resume(db, storage):
+    session = await create(db, storage)
+    assert session["chunk_count"] == 11
+
+    # 途切れる前に送れたチャンク（順不同・再送を含む）
+    for index in [10, 3, 0, 4, 3]:
+        await send(db, storage, session, index)
+
+    progress = upload_sessions.progress(await upload_sessions.get(db, session["id"]))
+    assert progress["received_chunks"] == [0, 3, 4, 10]
+    assert progress["missing_chunks"] == [1, 2, 5, 6, 7, 8, 9]
+    assert progress["received_ranges"] == [[0, 100], [300, 500], [1000, 1028]]
+    assert progress["bytes_received"] == 328
+
+    # 再開後は未受信のチャンクだけを送る
+    for index in reversed(progress["missing_chunks"]):
+        await send(db, storage, session, index)
+
+    completed = await upload_sessions.complete(db, storage, session["id"])
+    assert storage.path(completed["filename"]).read_bytes() == DATA
+    with pytest.raises(UploadSessionNotFound):
+        await upload_sessions.get(db, session["id"])
+
+
+@pytest.mark.anyio
+async def test_complete_with_missing_chunks_can_be_retried(db, storage):
+    session = await create(db, storage)
+    for index in range(10):
+        await send(db, storage, session, index)
+
+    with pytest.raises(UploadSessionConflict):
+        await upload_sessions.complete(db, storage, session["id"])
+    assert (await upload_sessions.get(db, session["id"]))["status"] == "open"
+
+    await send(db, storage, session, 10)
+    completed = await upload_sessions.complete(db, storage, session["id"])
+    assert storage.path(completed["filename"]).read_bytes() == DATA
+
+
+@pytest.mark.anyio
+async def test_invalid_chunks(db, storage):
+    session = await create(db, storage)
+    with pytest.raises(InvalidChunk):
+        await upload_sessions.write_chunk(db, storage, session["id"], 11, b"x", ttl=60)
+    with pytest.raises(InvalidChunk):
+        await upload_sessions.write_chunk(db, storage, session["id"], 1, DATA[:100], offset=0, ttl=60)
+    with pytest.raises(InvalidChunk):
+        await upload_sessions.write_chunk(db, storage, session["id"], 10, DATA[1000:-1], ttl=60)
+
+
+@pytest.mark.anyio
+async def test_aborted_session_rejects_chunks(db, storage):
+    session = await create(db, storage)
+    await send(db, storage, session, 0)
+    await upload_sessions.abort(db, storage, session["id"])
+    with pytest.raises(UploadSessionNotFound):
+        await send(db, storage, session, 1)
+
+
+async def expire(db, session_id, **fields):
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await db[upload_sessions.SESSIONS].update_one({"id": session_id}, {"$set": {"expires_at": past, **fields}})
+
+
+@pytest.mark.anyio
+async def test_sweep_skips_session_being_completed(db, storage, monkeypatch):
+    session = await create(db, storage)
+    for index in range(session["chunk_count"]):
+        await send(db, storage, session, index)
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+    complete_multipart = storage.complete_multipart
+
+    async def slow_complete(*args):
+        started.set()
+        await release.wait()
+        return await complete_multipart(*args)
+
+    monkeypatch.setattr(storage, "complete_multipart", slow_complete)
+    completing = asyncio.create_task(upload_sessions.complete(db, storage, session["id"]))
+    await started.wait()
+
+    # 確定中に有効期限を過ぎた
+    await expire(db, session["id"])
+    assert await upload_sessions.sweep_expired(db, storage, limit=10) == 0
+
+    release.set()
+    completed = await completing
+    assert storage.path(completed["filename"]).read_bytes() == DATA
+
+
+@pytest.mark.anyio
+async def test_sweep_discards_stale_completing_session(db, storage):
+    session = await create(db, storage)
+    await send(db, storage, session, 0)
+    # 確定中にプロセスが停止し、COMPLETE_TIMEOUT を過ぎた
+    await expire(db, session["id"], status="completing", completing_until=datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert await upload_sessions.sweep_expired(db, storage, limit=10) == 1
+    with pytest.raises(UploadSessionNotFound):
+        await upload_sessions.get(db, session["id"])